@@ -1,21 +1,224 @@
+import itertools
 import os
+import queue
 import time
-import re
 import traceback
+import threading
 from datetime import datetime
 
+import httpx
 import openai 
 
+from chat_log_parser import ChatLogParser
+from context_window import DEFAULT_TOKEN_BUDGET, clip_to_budget, estimate_tokens
+from message_record import Message, MessageKind
+from metrics import metrics
+from request_policy import DeadlineExceeded, FirstTokenTimeout, LatencyTracker, TokenBucket
+from response_cache import ResponseCache
+from scheduler import Backoff
+from sentence_stream import SentenceSplitter
+
+# 这里使用的是阿里云的大模型，如果需要使用其他平台，请参考对应的开发文档后对应修改
+DEFAULT_BASE_URL = "https://dashscope.aliyuncs.com/compatible-mode/v1"
+
+# HTTP连接池配置：保持长连接，避免每次回复都重新进行TCP/TLS握手
+POOL_CONFIG = {
+    'max_connections': 10,  # 最大连接数
+    'max_keepalive_connections': 5,  # 最大保持空闲的长连接数
+    'keepalive_expiry': 120.0,  # 空闲长连接的保留时间(秒)
+}
+
+# AI请求的限流、超时、重试和对冲配置
+REQUEST_POLICY = {
+    'requests_per_second': 2.0,  # 所有聊天共享的令牌桶速率，0表示不限流
+    'burst': 5,  # 令牌桶容量（允许的突发请求数）
+    'connect_timeout': 5.0,  # 建立连接的超时(秒)
+    'first_token_timeout': 15.0,  # 从发出请求到收到第一个字的超时(秒)，流式输出中两次分块的最长间隔也不超过它
+    'total_timeout': 60.0,  # 一次回复（包括排队、重试和生成）的总超时(秒)
+    'max_retries': 3,  # 可重试错误（429、5xx、连接错误、首字超时）的最大重试次数
+    'backoff_base': 1.0,  # 第一次重试前的最长等待(秒)，之后每次翻倍（带随机抖动）
+    'backoff_cap': 20.0,  # 重试等待的上限(秒)
+    'hedge_percentile': None,  # 首字延迟超过最近请求的该百分位数时发出对冲请求（如95），None表示不对冲
+    'hedge_min_samples': 20,  # 至少有多少个首字延迟样本后才启用对冲
+}
+
+# 系统提示词（可通过ChatAI(system_prompt=...)替换，例如批量回放时比较不同的提示词）
+SYSTEM_PROMPT = "给你一段对话，是A正在和B进行对话。请一句话一句话的思考A下一句会说什么，然后直接返回要发送的内容。不要在返回的内容里出现A和B，只返回要发送的内容。"
+
+# 检索较早消息时，分数低于最高分这个比例的结果视为不相关
+RELATED_MIN_SCORE_RATIO = 0.4
+
+# 可以重试的HTTP状态码
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+
+class ConnectionStats:
+    """统计HTTP请求数、新建TCP连接数和TLS握手次数，用于确认连接复用效果"""
+    
+    def __init__(self):
+        self.requests = 0
+        self.connections = 0
+        self.tls_handshakes = 0
+        self._lock = threading.Lock()
+        
+    def trace(self, event_name, info):
+        """httpcore的trace回调，统计新建连接和TLS握手"""
+        if event_name == 'connection.connect_tcp.complete':
+            with self._lock:
+                self.connections += 1
+        elif event_name == 'connection.start_tls.complete':
+            with self._lock:
+                self.tls_handshakes += 1
+                
+    @property
+    def reused(self):
+        """复用已有连接的请求数"""
+        return max(self.requests - self.connections, 0)
+    
+    def summary(self):
+        """返回统计摘要"""
+        return (f"HTTP请求: {self.requests}, 新建连接: {self.connections}, "
+                f"TLS握手: {self.tls_handshakes}, 复用连接: {self.reused}")
+
+
+class _TracingTransport(httpx.HTTPTransport):
+    """在每个请求上挂载trace回调的HTTP传输层"""
+    
+    def __init__(self, stats, **kwargs):
+        super().__init__(**kwargs)
+        self.stats = stats
+        
+    def handle_request(self, request):
+        with self.stats._lock:
+            self.stats.requests += 1
+        request.extensions['trace'] = self.stats.trace
+        return super().handle_request(request)
+
+
+# 进程内共享的回复缓存：相同的上下文不会重复调用AI模型
+shared_response_cache = ResponseCache()
+
+# 进程内共享的限流器和首字延迟统计（所有聊天共用）
+shared_rate_limiter = TokenBucket(REQUEST_POLICY['requests_per_second'], REQUEST_POLICY['burst'])
+shared_first_token_latency = LatencyTracker()
+
+# 进程内共享的AI客户端 {(api_key, base_url): (client, stats)}
+_shared_clients = {}
+_shared_clients_lock = threading.Lock()
+
+
+def get_shared_client(api_key, base_url=DEFAULT_BASE_URL):
+    """获取进程内共享的OpenAI客户端，首次调用时创建
+    
+    Args:
+        api_key: API密钥
+        base_url: API地址
+        
+    Returns:
+        tuple: (openai.OpenAI客户端, ConnectionStats连接统计)
+    """
+    key = (api_key, base_url)
+    with _shared_clients_lock:
+        if key not in _shared_clients:
+            stats = ConnectionStats()
+            transport = _TracingTransport(
+                stats,
+                limits=httpx.Limits(
+                    max_connections=POOL_CONFIG['max_connections'],
+                    max_keepalive_connections=POOL_CONFIG['max_keepalive_connections'],
+                    keepalive_expiry=POOL_CONFIG['keepalive_expiry'],
+                ),
+            )
+            # 重试由ChatAI按REQUEST_POLICY统一处理，关闭openai客户端自带的重试
+            client = openai.OpenAI(
+                api_key=api_key,
+                base_url=base_url,
+                max_retries=0,
+                http_client=httpx.Client(transport=transport, timeout=httpx.Timeout(60.0, connect=10.0)),
+            )
+            _shared_clients[key] = (client, stats)
+            print(f"AI客户端初始化成功")
+        return _shared_clients[key]
+
+
+def is_retryable(error):
+    """判断AI请求的错误是否可以重试：限流(429)、服务端错误(5xx)、连接错误、超时和首字超时"""
+    if isinstance(error, FirstTokenTimeout):
+        return True
+    if isinstance(error, DeadlineExceeded):
+        return False
+    if isinstance(error, (openai.APIConnectionError, httpx.TransportError)):
+        return True
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code in RETRYABLE_STATUS
+    return False
+
+
+def retry_after(error):
+    """读取429等响应中的Retry-After头（秒），没有时返回None"""
+    response = getattr(error, 'response', None)
+    try:
+        return float(response.headers.get('retry-after'))
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+
+class _StreamAttempt:
+    """一次流式请求尝试：在后台线程中发出请求，读到第一个字后交给调用方继续读取"""
+
+    _ids = itertools.count(1)
+
+    def __init__(self, hedge=False):
+        self.id = next(self._ids)
+        self.hedge = hedge  # 是否为对冲请求
+        self.started = time.monotonic()
+        self.stream = None
+        self.first_chunks = []  # 读到第一个字为止的分块
+        self.abandoned = False
+
+
 class ChatAI:
     """聊天AI处理器，读取聊天记录并调用AI模型生成回复"""
     
-    def __init__(self, log_file='chat_log.txt'):
+    def __init__(self, log_file='chat_log.txt', base_url=DEFAULT_BASE_URL, history_db=None, chat_name=None,
+                 response_cache=shared_response_cache, history_segments=0, rate_limiter=shared_rate_limiter,
+                 request_policy=None, log=None, index=None, retrieval_k=3, retrieval_budget=300, system_prompt=None,
+                 token_budget=DEFAULT_TOKEN_BUDGET):
         """初始化聊天AI处理器
         
         Args:
             log_file: 聊天日志文件路径
+            base_url: API地址（OpenAI兼容接口）
+            history_db: 可选的HistoryDB，提供时从数据库读取最近消息构建上下文
+            chat_name: 使用history_db时对应的聊天名称
+            response_cache: 回复缓存，为None时不使用缓存
+            history_segments: 解析聊天日志时额外读取的已轮转压缩分段数，默认只读取活动日志
+            rate_limiter: 请求限流器（TokenBucket），默认所有聊天共享一个，为None时不限流
+            request_policy: 覆盖REQUEST_POLICY中部分配置的字典
+            log: 可选的RotatingLog（对应log_file），提供时AI回复通过它写入（可由后台线程批量写入），
+                解析日志前先等待其中排队的内容写入
+            index: 可选的HistoryIndex，提供时检索与对方最新消息相关的较早消息，放在上下文之前
+            retrieval_k: 最多检索的较早消息数，0表示不检索
+            retrieval_budget: 检索到的较早消息的token预算
+            system_prompt: 系统提示词，None表示使用SYSTEM_PROMPT
+            token_budget: 上下文消息的token预算，应与会话ContextWindow的预算一致
         """
         self.log_file = log_file
+        self.log = log
+        self.index = index
+        self.retrieval_k = retrieval_k
+        self.retrieval_budget = retrieval_budget
+        self.system_prompt = system_prompt or SYSTEM_PROMPT
+        self.token_budget = token_budget
+        self.base_url = base_url
+        self.history_db = history_db
+        self.chat_name = chat_name
+        self.response_cache = response_cache
+        self.model = "qwen-turbo"  # 使用默认模型
+        self.log_parser = ChatLogParser(log_file, history_segments)  # 增量解析聊天日志
+        self.rate_limiter = rate_limiter
+        self.policy = dict(REQUEST_POLICY, **(request_policy or {}))
+        self.first_token_latency = shared_first_token_latency
         
         # 固定API密钥设置
         self.api_key = 'sk-4e3469a3dd8f493e83f683218cbbbb7c'
@@ -24,69 +227,44 @@ class ChatAI:
         self.setup_openai()
         
     def setup_openai(self):
-        """设置OpenAI API客户端"""
+        """设置OpenAI API客户端（同一进程内共享同一个客户端和连接池）"""
         # 设置环境变量
         os.environ['OPENAI_API_KEY'] = self.api_key
         
-        # 初始化OpenAI客户端
-        self.client = openai.OpenAI(
-            api_key=self.api_key, # 如果你没有配置环境变量，使用 api_key="your-api-key" 替换
-            base_url="https://dashscope.aliyuncs.com/compatible-mode/v1", # 这里使用的是阿里云的大模型，如果需要使用其他平台，请参考对应的开发文档后对应修改
-        )
-        print(f"AI客户端初始化成功")
+        # 获取共享的OpenAI客户端
+        self.client, self.connection_stats = get_shared_client(self.api_key, self.base_url)
         
-    def parse_chat_messages(self):
-        """解析聊天日志文件
+    def warm_up(self):
+        """预热连接：提前完成TCP/TLS握手，使第一次回复可以直接复用连接
         
         Returns:
-            list: 解析后的聊天消息列表
+            bool: 预热请求是否成功
         """
-        messages = []
-        current_time = None
+        try:
+            start_time = time.time()
+            self.client.models.list()
+            print(f"AI连接预热完成，用时: {time.time() - start_time:.2f}秒")
+            return True
+        except Exception as e:
+            # 即使接口不支持也已经建立了连接，仅提示
+            print(f"AI连接预热请求失败: {str(e)}")
+            return False
         
+    def parse_chat_messages(self):
+        """解析聊天日志文件（增量解析，只处理上次解析之后追加的内容）
+        
+        Returns:
+            list: 解析后的消息记录（Message）列表（解析器内部的列表，不复制）
+        """
         try:
             if not os.path.exists(self.log_file):
                 print(f"聊天日志文件 {self.log_file} 不存在")
                 return []
-                
-            with open(self.log_file, 'r', encoding='utf-8') as f:
-                lines = f.readlines()
-            
-            for line in lines:
-                line = line.strip()
-                if not line:
-                    continue
-                
-                # 匹配时间消息
-                time_match = re.search(r'\[(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2})\] \[时间\] (.+)', line)
-                if time_match:
-                    current_time = time_match.group(2)
-                    messages.append(['Time', current_time])
-                    continue
-                
-                # 匹配自己发送的消息
-                self_match = re.search(r'\[(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2})\] \[自己\] (.+)', line)
-                if self_match:
-                    content = self_match.group(2)
-                    messages.append(['Self', content])
-                    continue
-                
-                # 匹配系统消息
-                sys_match = re.search(r'\[(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2})\] \[系统\] (.+)', line)
-                if sys_match:
-                    content = sys_match.group(2)
-                    if not content.startswith('错误:'):  # 忽略错误消息
-                        messages.append(['SYS', content])
-                    continue
-                
-                # 匹配聊天消息 [时间] [聊天名称] 内容
-                chat_match = re.search(r'\[(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2})\] \[([^\]]+)\] (.+)', line)
-                if chat_match:
-                    chat_name = chat_match.group(2)
-                    content = chat_match.group(3)
-                    if chat_name not in ['时间', '系统', '自己']:
-                        messages.append([chat_name, content])
             
+            if self.log is not None:
+                self.log.flush()
+            with metrics.timer('parse'):
+                messages = self.log_parser.parse()
             print(f"从聊天日志文件解析出 {len(messages)} 条消息")
             return messages
         
@@ -95,57 +273,294 @@ class ChatAI:
             traceback.print_exc()
             return []
     
-    def format_messages_for_ai(self, messages, max_messages=20):
+    def format_messages_for_ai(self, messages, max_messages=None, token_budget=None):
         """将聊天消息格式化为AI输入格式
         
+        从最新的消息往前选取，直到达到token预算（或最大消息数量）。
+        会话的ContextWindow按相同的预算维护窗口时，窗口内的消息都能放下；
+        这里的预算更小时，超出预算的较早消息会被直接丢弃（不并入摘要）；
+        第一项为摘要记录（MessageKind.SUMMARY）时作为较早对话的摘要发送；
+        提供了历史索引时，与对方最新消息相关的较早消息放在摘要和上下文之前。
+        
         Args:
-            messages: 聊天消息列表
-            max_messages: 最大消息数量
+            messages: 聊天消息列表，每项为消息记录（Message）或 [类型, 内容] 列表
+            max_messages: 最大消息数量，None表示只按token预算限制
+            token_budget: 上下文消息的token预算，None表示使用创建时的token_budget
             
         Returns:
             list: OpenAI格式的消息列表
         """
-        # 系统提示词
-        system_prompt = "给你一段对话，是A正在和B进行对话。请一句话一句话的思考A下一句会说什么，然后直接返回要发送的内容。不要在返回的内容里出现A和B，只返回要发送的内容。"
-        
+        if token_budget is None:
+            token_budget = self.token_budget
         # 初始化消息列表，添加系统消息
-        ai_messages = [{"role": "system", "content": system_prompt}]
+        ai_messages = [{"role": "system", "content": self.system_prompt}]
         
-        # 如果消息超过限制，只取最后max_messages条
-        if len(messages) > max_messages:
-            messages = messages[-max_messages:]
+        # 较早对话的滚动摘要
+        summary = None
+        first = 0
+        if messages and Message.coerce(messages[0]).kind == MessageKind.SUMMARY:
+            summary = messages[0][1]
+            first = 1
         
-        # 跳过Time和SYS类型的消息，将其他消息添加到AI输入中
-        for msg in messages:
-            msg_type = msg[0]
-            content = msg[1]
-            
-            # 跳过Time和空消息
-            if msg_type == 'Time' or not content:
-                continue
-                
-            # 跳过系统消息
-            if msg_type == 'SYS':
+        # 从最新的消息往前选取，直到达到token预算或消息数量限制
+        # 时间、系统消息和空消息不发送给AI；解析器和会话中的消息已经是消息记录，
+        # 只有旧格式的列表才在这里转换，而且只转换窗口内访问到的消息
+        selected = []
+        used_tokens = 0
+        for position in range(len(messages) - 1, first - 1, -1):
+            msg = Message.coerce(messages[position])
+            if msg.kind in (MessageKind.TIME, MessageKind.SYS) or not msg.content:
                 continue
-                
-            # 所有消息都使用user角色，但添加标识符区分
-            if msg_type == 'Self':
-                ai_messages.append({"role": "user", "content": f"A: {content}"})
-            else:
-                # 其他消息也是user角色，但用B标识
-                ai_messages.append({"role": "user", "content": f"B: {content}"})
+            if max_messages is not None and len(selected) >= max_messages:
+                break
+            # 优先使用上下文窗口中缓存的token数
+            tokens = msg.tokens if msg.tokens is not None else estimate_tokens(msg.content)
+            if selected and used_tokens + tokens > token_budget:
+                break
+            selected.append(msg)
+            used_tokens += tokens
+        selected.reverse()
+        
+        # 已在本次上下文或摘要中的消息不再检索
+        exclude = {msg.content for msg in selected}
+        if summary:
+            exclude.update(line[3:] for line in summary.split("\n"))
+        related = self.retrieve_related(selected, exclude)
+        if related:
+            lines = "\n".join(f"{'A' if msg.kind == MessageKind.SELF else 'B'}: {msg.content}" for msg in related)
+            ai_messages.append({"role": "system", "content": f"与当前话题相关的较早对话（A是你，B是对方）：\n{lines}"})
+        
+        if summary:
+            ai_messages.append({"role": "system", "content": f"之前的对话摘要（A是你，B是对方）：\n{summary}"})
+        
+        # 所有消息都使用user角色，自己的消息用A标识，对方的消息用B标识
+        for msg in selected:
+            speaker = 'A' if msg.kind == MessageKind.SELF else 'B'
+            ai_messages.append({"role": "user", "content": f"{speaker}: {msg.content}"})
         
         return ai_messages
     
-    def call_ai_model(self, messages=None, stream=True):
+    def retrieve_related(self, selected, exclude=()):
+        """用对方最近的连续消息检索历史索引，返回相关的较早消息（按时间顺序，不超过retrieval_budget）
+        
+        分数低于最高分RELATED_MIN_SCORE_RATIO倍的结果被丢弃；每条结果之后的一条消息
+        （通常是对它的回答）一并返回。
+        
+        Args:
+            selected: 将要发送的上下文消息
+            exclude: 不检索的消息内容（已经在上下文中的消息）
+        """
+        if self.index is None or not self.retrieval_k:
+            return []
+        query = []
+        for msg in reversed(selected):
+            if msg.kind != MessageKind.FRIEND:
+                break
+            query.append(msg.content)
+        if not query:
+            return []
+        
+        with metrics.timer('retrieval'):
+            results = self.index.search(" ".join(reversed(query)), self.retrieval_k, exclude)
+        if not results:
+            return []
+        
+        related = {}  # {消息编号: 消息记录}
+        used_tokens = 0
+        per_message = max(self.retrieval_budget // (2 * self.retrieval_k), 1)
+        for score, doc_id, msg in results:
+            if score < results[0][0] * RELATED_MIN_SCORE_RATIO:
+                break
+            for related_id, related_msg in [(doc_id, msg)] + self.index.following(doc_id):
+                if related_id in related or related_msg.content in exclude:
+                    continue
+                content = clip_to_budget(related_msg.content, per_message)
+                tokens = estimate_tokens(content)
+                if used_tokens + tokens > self.retrieval_budget:
+                    break
+                related[related_id] = Message(related_msg.kind, content, related_msg.sender, related_msg.chat,
+                                              related_msg.timestamp)
+                used_tokens += tokens
+        metrics.inc('retrieval_messages', len(related))
+        return [related[related_id] for related_id in sorted(related)]
+    
+    def _request_timeout(self, deadline, stream=True):
+        """单次请求的httpx超时：连接超时和首字（读取）超时，且都不超过剩余的总时间"""
+        remaining = max(deadline - time.monotonic(), 0.1)
+        read = min(self.policy['first_token_timeout'], remaining) if stream else remaining
+        return httpx.Timeout(remaining, connect=min(self.policy['connect_timeout'], remaining), read=read)
+    
+    def _acquire(self, deadline):
+        """从限流器取得令牌，等待超过总截止时间时抛出DeadlineExceeded"""
+        if self.rate_limiter is None:
+            return
+        started = time.monotonic()
+        if not self.rate_limiter.acquire(timeout=max(deadline - started, 0)):
+            metrics.inc('ai_limiter_timeouts')
+            raise DeadlineExceeded("等待请求限流超时")
+        metrics.observe('ai_limiter_wait', time.monotonic() - started)
+    
+    @staticmethod
+    def _sleep(seconds, cancel_check=None):
+        """等待seconds秒，期间生成被中止时提前返回True"""
+        end = time.monotonic() + seconds
+        while True:
+            remaining = end - time.monotonic()
+            if remaining <= 0:
+                return False
+            if cancel_check is not None and cancel_check():
+                return True
+            time.sleep(min(remaining, 0.1))
+    
+    def _with_retries(self, request, deadline, cancel_check=None):
+        """执行请求，可重试的错误按带随机抖动的指数退避重试（遵循Retry-After）
+        
+        Args:
+            request: 执行一次请求的函数
+            deadline: 总截止时间（单调时钟），重试等待会超过它时不再重试
+            cancel_check: 可选的回调函数，返回True时中止重试
+            
+        Returns:
+            request的返回值，重试等待期间生成被中止时返回None
+        """
+        backoff = Backoff(self.policy['backoff_base'], self.policy['backoff_cap'])
+        for retry in itertools.count():
+            try:
+                return request()
+            except Exception as e:
+                if not is_retryable(e) or retry >= self.policy['max_retries']:
+                    raise
+                delay = max(backoff.next_delay(), retry_after(e) or 0)
+                if time.monotonic() + delay >= deadline:
+                    raise
+                if isinstance(e, openai.RateLimitError):
+                    metrics.inc('ai_rate_limited')
+                metrics.inc('ai_retries')
+                print(f"AI请求失败（{type(e).__name__}），{delay:.1f}秒后第{retry + 1}次重试")
+                if self._sleep(delay, cancel_check):
+                    return None
+    
+    @staticmethod
+    def _close_attempt(attempt):
+        if attempt.stream is not None:
+            try:
+                attempt.stream.close()
+            except Exception:
+                pass
+    
+    def _open_stream(self, messages, deadline, cancel_check=None):
+        """发出流式请求并等待第一个字，必要时发出对冲请求
+        
+        首字延迟超过最近请求的hedge_percentile百分位数时（且限流器还有令牌），
+        再发出一个相同的请求，先收到第一个字的请求胜出，其余的请求被关闭。
+        
+        Returns:
+            _StreamAttempt: 胜出的请求，等待期间生成被中止时返回None
+            
+        Raises:
+            FirstTokenTimeout: 首字超时（可重试）
+        """
+        results = queue.Queue()
+        attempts = []
+        winner = []
+        lock = threading.Lock()
+        
+        def run(attempt):
+            error = None
+            try:
+                attempt.stream = self.client.chat.completions.create(
+                    model=self.model,
+                    messages=messages,
+                    stream=True,
+                    timeout=self._request_timeout(deadline),
+                )
+                for chunk in attempt.stream:
+                    attempt.first_chunks.append(chunk)
+                    if attempt.abandoned or (chunk.choices and chunk.choices[0].delta.content):
+                        break
+            except Exception as e:
+                error = e
+            with lock:
+                lost = attempt.abandoned or bool(winner)
+                if not lost and error is None:
+                    winner.append(attempt)
+            if lost:
+                self._close_attempt(attempt)
+            else:
+                results.put((attempt, error))
+        
+        def launch(hedge=False):
+            attempt = _StreamAttempt(hedge)
+            attempts.append(attempt)
+            threading.Thread(target=run, args=(attempt,), name=f"AIRequest-{attempt.id}", daemon=True).start()
+        
+        self._acquire(deadline)
+        launch()
+        started = attempts[0].started
+        first_token_deadline = min(started + self.policy['first_token_timeout'], deadline)
+        hedge_at = None
+        if self.policy['hedge_percentile'] and len(self.first_token_latency) >= self.policy['hedge_min_samples']:
+            hedge_at = started + self.first_token_latency.percentile(self.policy['hedge_percentile'])
+        
+        errors = []
+        try:
+            while True:
+                if cancel_check is not None and cancel_check():
+                    return None
+                now = time.monotonic()
+                if now >= first_token_deadline:
+                    metrics.inc('ai_first_token_timeouts')
+                    raise FirstTokenTimeout(f"{now - started:.1f}秒内没有收到AI回复")
+                if (hedge_at is not None and now >= hedge_at and len(attempts) == 1
+                        and (self.rate_limiter is None or self.rate_limiter.try_acquire())):
+                    print(f"首字延迟已超过 {now - started:.2f}秒，发出对冲请求")
+                    metrics.inc('ai_hedged')
+                    launch(hedge=True)
+                try:
+                    attempt, error = results.get(timeout=min(0.05, first_token_deadline - now))
+                except queue.Empty:
+                    continue
+                if error is None:
+                    self.first_token_latency.observe(time.monotonic() - started)
+                    if attempt.hedge:
+                        metrics.inc('ai_hedge_wins')
+                    return attempt
+                errors.append(error)
+                if len(errors) == len(attempts):
+                    raise error
+        finally:
+            # 关闭未胜出的请求（仍在等待的请求读到第一个字后自行关闭）
+            with lock:
+                losers = [attempt for attempt in attempts if attempt not in winner]
+                for attempt in losers:
+                    attempt.abandoned = True
+            for attempt in losers:
+                self._close_attempt(attempt)
+    
+    def _create_completion(self, messages, deadline):
+        """发出一次非流式请求"""
+        self._acquire(deadline)
+        return self.client.chat.completions.create(
+            model=self.model,
+            messages=messages,
+            stream=False,
+            timeout=self._request_timeout(deadline, stream=False),
+        )
+    
+    def call_ai_model(self, messages=None, stream=True, cancel_check=None, on_sentence=None):
         """调用AI模型生成回复
         
         Args:
             messages: 消息列表，如果为None则自动从文件加载
             stream: 是否使用流式输出
+            cancel_check: 可选的回调函数，返回True时中止生成（例如聊天中出现了新消息）
+            on_sentence: 可选的回调函数，流式输出时每完成一句（已去掉A:/B:前缀）就调用一次
+            
+        请求经过共享的令牌桶限流，按REQUEST_POLICY设置连接、首字和总超时，
+        429、5xx、连接错误和首字超时按带随机抖动的指数退避重试。
             
         Returns:
-            str: AI模型的回复
+            str: AI模型的回复，生成被中止时返回None
         """
         # 如果没有提供消息，从文件加载
         if messages is None:
@@ -160,40 +575,81 @@ class ChatAI:
             print(f"{i+1}. [{role}]: {content_preview}")
         print("--------------------------------\n")
         
+        # 相同的上下文直接返回缓存的回复
+        cache_key = None
+        if self.response_cache is not None:
+            cache_key = self.response_cache.make_key(messages, self.model)
+            cached_response = self.response_cache.get(cache_key)
+            if cached_response is not None:
+                print(f"命中回复缓存，跳过AI调用: {cached_response[:50]}")
+                metrics.inc('ai_cache_hits')
+                return cached_response
+        
         try:
             # 调用AI模型
             print(f"正在调用AI模型...")
             start_time = time.time()
-            
-            response = self.client.chat.completions.create(
-                model="qwen-turbo",  # 使用默认模型
-                messages=messages,
-                stream=stream
-            )
+            deadline = time.monotonic() + self.policy['total_timeout']
+            metrics.inc('ai_calls')
             
             # 处理响应
             if stream:
-                # 流式响应
+                # 流式响应：先等到第一个字（含重试和对冲），再继续读取胜出的请求
+                attempt = self._with_retries(lambda: self._open_stream(messages, deadline, cancel_check),
+                                             deadline, cancel_check)
+                if attempt is None:
+                    print("\n已中止AI生成: 聊天中有新消息")
+                    return None
                 full_response = ""
+                first_token_time = None
+                splitter = SentenceSplitter() if on_sentence is not None else None
                 print("\n-------- AI回复 --------")
-                for chunk in response:
-                    if chunk.choices[0].delta.content:
-                        content = chunk.choices[0].delta.content
-                        full_response += content
-                        print(content, end='', flush=True)
+                try:
+                    for chunk in itertools.chain(attempt.first_chunks, attempt.stream):
+                        if cancel_check is not None and cancel_check():
+                            print("\n已中止AI生成: 聊天中有新消息")
+                            return None
+                        if time.monotonic() > deadline:
+                            metrics.inc('ai_total_timeouts')
+                            raise DeadlineExceeded(f"AI回复超过 {self.policy['total_timeout']} 秒仍未生成完毕")
+                        if chunk.choices and chunk.choices[0].delta.content:
+                            content = chunk.choices[0].delta.content
+                            if first_token_time is None:
+                                first_token_time = time.time()
+                                metrics.observe('ai_first_token', first_token_time - start_time)
+                            full_response += content
+                            print(content, end='', flush=True)
+                            if splitter is not None:
+                                for sentence in splitter.feed(content):
+                                    on_sentence(sentence)
+                    if splitter is not None:
+                        for sentence in splitter.flush():
+                            on_sentence(sentence)
+                finally:
+                    # 中止、超时或读取出错时同样关闭HTTP响应
+                    self._close_attempt(attempt)
                 print("\n-------------------------\n")
                 
                 elapsed_time = time.time() - start_time
                 print(f"AI响应完成，用时: {elapsed_time:.2f}秒")
+                metrics.observe('ai_total', elapsed_time)
+                if first_token_time is not None:
+                    metrics.observe('ai_stream', time.time() - first_token_time)
                 
                 # 记录AI回复到文件
                 self.log_ai_response(full_response)
+                if cache_key is not None:
+                    self.response_cache.put(cache_key, full_response)
                 
                 return full_response
             else:
                 # 非流式响应
+                response = self._with_retries(lambda: self._create_completion(messages, deadline), deadline, cancel_check)
+                if response is None:
+                    return None
                 response_content = response.choices[0].message.content
                 elapsed_time = time.time() - start_time
+                metrics.observe('ai_total', elapsed_time)
                 
                 print("\n-------- AI回复 --------")
                 print(response_content)
@@ -202,15 +658,54 @@ class ChatAI:
                 
                 # 记录AI回复到文件
                 self.log_ai_response(response_content)
+                if cache_key is not None:
+                    self.response_cache.put(cache_key, response_content)
                 
                 return response_content
                 
         except Exception as e:
             error_msg = f"调用AI模型时出错: {str(e)}"
             print(error_msg)
+            metrics.inc('ai_errors')
             traceback.print_exc()
             return f"错误: {error_msg}"
     
+    def complete(self, messages, stream=False):
+        """发出一次补全请求并返回回复内容（用于离线批量回放）
+        
+        与call_ai_model使用相同的限流、超时和重试策略，但不使用回复缓存、不写入聊天日志，
+        出错时直接抛出异常，由调用方记录。
+        
+        Args:
+            messages: OpenAI格式的消息列表
+            stream: 是否使用流式请求（可以测得首字延迟）
+            
+        Returns:
+            tuple: (回复内容, 首字延迟秒数)，非流式请求的首字延迟为整个请求的耗时
+        """
+        start_time = time.monotonic()
+        deadline = start_time + self.policy['total_timeout']
+        metrics.inc('ai_calls')
+        if not stream:
+            response = self._with_retries(lambda: self._create_completion(messages, deadline), deadline)
+            return response.choices[0].message.content or "", time.monotonic() - start_time
+        
+        attempt = self._with_retries(lambda: self._open_stream(messages, deadline), deadline)
+        parts = []
+        first_token = None
+        try:
+            for chunk in itertools.chain(attempt.first_chunks, attempt.stream):
+                if time.monotonic() > deadline:
+                    metrics.inc('ai_total_timeouts')
+                    raise DeadlineExceeded(f"AI回复超过 {self.policy['total_timeout']} 秒仍未生成完毕")
+                if chunk.choices and chunk.choices[0].delta.content:
+                    if first_token is None:
+                        first_token = time.monotonic() - start_time
+                    parts.append(chunk.choices[0].delta.content)
+        finally:
+            self._close_attempt(attempt)
+        return "".join(parts), first_token
+    
     def log_ai_response(self, response):
         """记录AI的回复到日志文件
         
@@ -218,19 +713,35 @@ class ChatAI:
             response: AI的回复内容
         """
         current_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        text = f"\n[{current_time}] [AI回复]\n{response}\n"
         try:
-            with open(self.log_file, 'a', encoding='utf-8') as f:
-                f.write(f"\n[{current_time}] [AI回复]\n{response}\n")
+            if self.log is not None:
+                self.log.write(text)
+            else:
+                with open(self.log_file, 'a', encoding='utf-8') as f:
+                    f.write(text)
             print(f"AI回复已记录到日志文件: {self.log_file}")
         except Exception as e:
             print(f"记录AI回复时出错: {str(e)}")
     
-    def run(self):
-        """执行AI调用流程"""
-        print(f"开始运行聊天AI处理，读取聊天记录: {self.log_file}")
+    def run(self, chat_messages=None, cancel_check=None, on_sentence=None):
+        """执行AI调用流程
         
-        # 解析聊天记录
-        chat_messages = self.parse_chat_messages()
+        Args:
+            chat_messages: 最近的聊天消息列表（格式同parse_chat_messages的返回值），
+                为None时从历史数据库读取，没有数据库时从聊天日志文件解析（冷启动时的后备方案）
+            cancel_check: 可选的回调函数，返回True时中止生成
+            on_sentence: 可选的回调函数，流式输出时每完成一句就调用一次
+        """
+        if chat_messages is None and self.history_db is not None and self.chat_name is not None:
+            chat_messages = self.history_db.last_messages(self.chat_name)
+            print(f"开始运行聊天AI处理，从历史数据库读取 {len(chat_messages)} 条最近消息")
+        elif chat_messages is None:
+            print(f"开始运行聊天AI处理，读取聊天记录: {self.log_file}")
+            # 解析聊天记录
+            chat_messages = self.parse_chat_messages()
+        else:
+            print(f"开始运行聊天AI处理，使用内存中的 {len(chat_messages)} 条最近消息")
         
         if not chat_messages:
             print("未找到有效的聊天记录，无法调用AI")
@@ -238,7 +749,7 @@ class ChatAI:
         
         # 格式化消息并调用AI
         ai_messages = self.format_messages_for_ai(chat_messages)
-        return self.call_ai_model(ai_messages)
+        return self.call_ai_model(ai_messages, cancel_check=cancel_check, on_sentence=on_sentence)
 
 
 # 如果直接运行此脚本
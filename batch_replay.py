@@ -0,0 +1,433 @@
+import argparse
+import fnmatch
+import hashlib
+import json
+import os
+import queue
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from chat_log_parser import ChatLogParser
+from context_window import DEFAULT_TOKEN_BUDGET, ContextWindow, estimate_tokens
+from message_record import MessageKind
+
+# 回放模式
+MODE_TURNS = 'turns'  # 对方每说完一轮、自己开始回复时生成一次（结果中附带当时实际的回复，便于对比）
+MODE_LAST = 'last'  # 每个日志只用最后的上下文生成一次（与 python AI.py 相同）
+MODES = (MODE_TURNS, MODE_LAST)
+
+# 结果状态
+STATUS_OK = 'ok'
+STATUS_ERROR = 'error'
+
+
+def iter_log_files(paths, pattern='*.txt'):
+    """逐个产生要回放的日志文件（目录按名称顺序递归查找，不预先列出全部文件）"""
+    for path in paths:
+        if not os.path.isdir(path):
+            yield path
+            continue
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for name in sorted(files):
+                if fnmatch.fnmatch(name, pattern):
+                    yield os.path.join(root, name)
+
+
+def file_signature(path):
+    """文件的 (大小, 修改时间)，用于判断检查点中记录的文件之后是否被修改过"""
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def build_windows(path, mode=MODE_TURNS, token_budget=DEFAULT_TOKEN_BUDGET, max_windows=None, history_segments=0):
+    """解析一个聊天日志并构建要回放的上下文窗口（在工作进程中运行）
+
+    按消息顺序把消息加入ContextWindow，与在线回复时一样按token预算淘汰旧消息并折叠成摘要；
+    turns模式下对方的一轮发言之后出现自己的消息时，取此时的窗口作为一次回放的上下文，
+    之后连续的自己的消息作为参考回复。
+
+    Args:
+        path: 聊天日志文件路径
+        mode: 'turns' 或 'last'
+        token_budget: 上下文窗口的token预算
+        max_windows: 每个日志最多回放的窗口数（保留最近的），None表示不限制
+        history_segments: 额外解析的已轮转压缩分段数
+
+    Returns:
+        dict: {'file', 'windows': [[轮次, 上下文, 参考回复], ...], 'messages', 'parse_seconds'}，
+            上下文为 [类型, 内容] 列表（可以在进程间传递）
+    """
+    started = time.perf_counter()
+    messages = ChatLogParser(path, history_segments).parse()
+
+    # 第一遍找出每轮的位置和参考回复，只为要回放的轮次构建窗口快照
+    turns = []  # [(自己开始回复的消息位置, [参考回复, ...]), ...]
+    if mode == MODE_TURNS:
+        friend_spoke = False
+        for position, msg in enumerate(messages):
+            if msg.kind == MessageKind.FRIEND:
+                friend_spoke = True
+            elif msg.kind == MessageKind.SELF:
+                if friend_spoke:
+                    friend_spoke = False
+                    turns.append((position, []))
+                if turns:
+                    turns[-1][1].append(msg.content)
+    else:
+        turns.append((len(messages), None))
+    first_turn = 0 if max_windows is None else max(len(turns) - max_windows, 0)
+
+    window = ContextWindow(token_budget)
+    windows = []
+    position = 0
+    for turn in range(first_turn, len(turns)):
+        end, reference = turns[turn]
+        window.extend(messages[position:end])
+        position = end
+        if len(window):
+            windows.append([turn, [msg.to_list() for msg in window.messages()],
+                            "\n".join(reference) if reference is not None else None])
+    return {
+        'file': path,
+        'windows': windows,
+        'messages': len(messages),
+        'parse_seconds': time.perf_counter() - started,
+    }
+
+
+def read_jsonl(path):
+    """逐条读取JSONL文件中的记录（文件不存在时为空，跳过中断时写了一半的行）"""
+    if not os.path.exists(path):
+        return
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                yield json.loads(line)
+            except ValueError:
+                continue
+
+
+def open_append(path):
+    """以追加方式打开文件；上次中断时最后一行没有写完的，先补上换行"""
+    if os.path.exists(path) and os.path.getsize(path):
+        with open(path, 'rb+') as f:
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b'\n':
+                f.write(b'\n')
+    return open(path, 'a', encoding='utf-8')
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, max(0, int(round(pct / 100 * (len(values) - 1)))))]
+
+
+class BatchReplay:
+    """离线批量回放：用归档的聊天日志批量生成回复，评估提示词修改或更换模型的效果
+
+    日志文件逐个读取，由进程池并行解析并构建上下文窗口（同时在解析的文件不超过进程数的两倍）；
+    上下文窗口放入有界队列，由concurrency个线程并发请求AI，队列满时暂停解析。
+    每个结果立即追加到JSONL结果文件；一个日志的所有窗口都成功后记入检查点文件（结果文件名加 .checkpoint），
+    中断后重新运行时跳过检查点中未修改的日志和结果文件中已成功的窗口，失败的窗口会重新请求。
+    检查点和结果都记录模型和提示词编号（提示词的哈希），只跳过用相同模型和提示词完成的日志和窗口，
+    因此修改提示词或更换模型后写入同一个结果文件时会重新请求全部窗口。
+    """
+
+    def __init__(self, output, base_url=None, model=None, system_prompt=None, concurrency=8, processes=None,
+                 mode=MODE_TURNS, max_windows=None, token_budget=DEFAULT_TOKEN_BUDGET, history_segments=0,
+                 rate=0.0, stream=False, request_policy=None, resume=True, progress_interval=5.0):
+        """
+        Args:
+            output: JSONL结果文件路径
+            base_url: API地址，None表示使用AI.py中的默认地址
+            model: 模型名称，None表示使用ChatAI的默认模型
+            system_prompt: 系统提示词，None表示使用AI.SYSTEM_PROMPT
+            concurrency: 同时进行的AI请求数
+            processes: 解析日志的进程数，None表示CPU核数
+            mode: 'turns'（每轮回复一次）或 'last'（每个日志一次）
+            max_windows: 每个日志最多回放的窗口数（保留最近的）
+            token_budget: 上下文窗口的token预算
+            history_segments: 解析日志时额外读取的已轮转压缩分段数
+            rate: 每秒最多发出的请求数，0表示不限流
+            stream: 是否使用流式请求（结果中记录首字延迟）
+            request_policy: 覆盖AI.REQUEST_POLICY中部分配置的字典（超时、重试等）
+            resume: 是否从已有的结果和检查点继续，False时清空后重新开始
+            progress_interval: 打印进度的间隔(秒)
+        """
+        # 工作进程只需要解析日志，openai等依赖只在主进程中导入
+        import AI
+        from request_policy import TokenBucket
+
+        if mode not in MODES:
+            raise ValueError(f"未知的回放模式: {mode}，可选: {', '.join(MODES)}")
+        self.output = output
+        self.checkpoint_file = output + '.checkpoint'
+        self.concurrency = concurrency
+        self.processes = processes or os.cpu_count() or 1
+        self.mode = mode
+        self.max_windows = max_windows
+        self.token_budget = token_budget
+        self.history_segments = history_segments
+        self.stream = stream
+        self.resume = resume
+        self.progress_interval = progress_interval
+
+        # 连接池至少要能容纳所有并发请求
+        AI.POOL_CONFIG['max_connections'] = max(AI.POOL_CONFIG['max_connections'], concurrency)
+        AI.POOL_CONFIG['max_keepalive_connections'] = max(AI.POOL_CONFIG['max_keepalive_connections'], concurrency)
+        self.chat_ai = AI.ChatAI(base_url=base_url or AI.DEFAULT_BASE_URL, response_cache=None,
+                                 rate_limiter=TokenBucket(rate, max(int(rate), 1)) if rate else None,
+                                 request_policy=request_policy, retrieval_k=0, system_prompt=system_prompt,
+                                 token_budget=token_budget)
+        if model:
+            self.chat_ai.model = model
+        self.prompt_id = hashlib.sha1(self.chat_ai.system_prompt.encode('utf-8')).hexdigest()[:12]
+
+        self._jobs = queue.Queue(maxsize=concurrency * 4)
+        self._lock = threading.Lock()
+        self._results = None
+        self._checkpoint = None
+        self._pending = {}  # {日志文件: [未完成的窗口数, 是否有失败, 文件签名, 窗口总数]}
+        self._stopping = False
+        self._last_progress = 0.0
+        self.stats = {
+            'files': 0, 'files_skipped': 0, 'files_parsed': 0, 'parse_errors': 0, 'messages': 0,
+            'windows': 0, 'windows_skipped': 0, 'ok': 0, 'errors': 0,
+            'parse_seconds': 0.0, 'prompt_tokens': 0, 'completion_tokens': 0,
+        }
+        self.latencies = []
+        self.first_tokens = []
+
+    def _load_checkpoint(self):
+        """读取用当前模型和提示词完成的日志 {文件: 签名} 和已成功的窗口编号集合"""
+        if not self.resume:
+            for path in (self.output, self.checkpoint_file):
+                if os.path.exists(path):
+                    os.remove(path)
+            return {}, set()
+        key = (self.chat_ai.model, self.prompt_id)
+        finished_files = {record['file']: record['signature'] for record in read_jsonl(self.checkpoint_file)
+                          if (record.get('model'), record.get('prompt')) == key}
+        finished_windows = {record['id'] for record in read_jsonl(self.output)
+                            if record.get('status') == STATUS_OK and (record.get('model'), record.get('prompt')) == key}
+        return finished_files, finished_windows
+
+    def run(self, paths, pattern='*.txt'):
+        """回放paths中的所有日志文件（可以是文件或目录），返回吞吐统计"""
+        finished_files, finished_windows = self._load_checkpoint()
+        if finished_files or finished_windows:
+            print(f"从检查点继续: 跳过 {len(finished_files)} 个已完成的日志、{len(finished_windows)} 个已成功的窗口")
+        started = time.perf_counter()
+        self._results = open_append(self.output)
+        self._checkpoint = open_append(self.checkpoint_file)
+        threads = [threading.Thread(target=self._complete_loop, name=f"BatchReplay-{i}", daemon=True)
+                   for i in range(self.concurrency)]
+        for thread in threads:
+            thread.start()
+        pool = ProcessPoolExecutor(self.processes)
+        in_flight = set()
+        try:
+            for path in iter_log_files(paths, pattern):
+                self.stats['files'] += 1
+                try:
+                    signature = file_signature(path)
+                except OSError as e:
+                    print(f"无法读取日志 {path}: {str(e)}")
+                    self.stats['parse_errors'] += 1
+                    continue
+                if finished_files.get(path) == signature:
+                    self.stats['files_skipped'] += 1
+                    continue
+                # 同时解析的文件不超过进程数的两倍，解析结果来不及请求时也不会堆积在内存中
+                while len(in_flight) >= self.processes * 2:
+                    done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        self._enqueue(future, finished_windows)
+                future = pool.submit(build_windows, path, self.mode, self.token_budget, self.max_windows,
+                                     self.history_segments)
+                future.signature = signature
+                in_flight.add(future)
+            while in_flight:
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    self._enqueue(future, finished_windows)
+        except KeyboardInterrupt:
+            print("\n已中断，正在等待进行中的请求完成（重新运行即可从检查点继续）")
+            self._stopping = True
+            for future in in_flight:
+                future.cancel()
+        finally:
+            for _ in threads:
+                self._jobs.put(None)
+            for thread in threads:
+                thread.join()
+            pool.shutdown()
+            self._results.close()
+            self._checkpoint.close()
+        return self.report(time.perf_counter() - started)
+
+    def _enqueue(self, future, finished_windows):
+        """把一个日志解析出的窗口放入请求队列（队列满时等待）"""
+        try:
+            parsed = future.result()
+        except Exception as e:
+            print(f"解析日志时出错: {str(e)}")
+            self.stats['parse_errors'] += 1
+            return
+        path = parsed['file']
+        self.stats['files_parsed'] += 1
+        self.stats['messages'] += parsed['messages']
+        self.stats['parse_seconds'] += parsed['parse_seconds']
+        todo = []
+        for turn, context, reference in parsed['windows']:
+            window_id = f"{path}#{turn}"
+            if window_id in finished_windows:
+                self.stats['windows_skipped'] += 1
+            else:
+                todo.append((path, window_id, turn, context, reference))
+        self.stats['windows'] += len(parsed['windows'])
+        # 计数多加1，防止窗口还没全部放入队列时就被认为已经完成
+        self._pending[path] = [len(todo) + 1, False, future.signature, len(parsed['windows'])]
+        for job in todo:
+            if self._stopping:
+                break
+            self._jobs.put(job)
+        self._finish_window(path, failed=self._stopping)
+
+    def _finish_window(self, path, failed=False):
+        """一个窗口完成；日志的所有窗口都成功后记入检查点"""
+        with self._lock:
+            state = self._pending[path]
+            state[0] -= 1
+            state[1] = state[1] or failed
+            if state[0]:
+                return
+            del self._pending[path]
+            if not state[1]:
+                record = {'file': path, 'signature': state[2], 'windows': state[3], 'model': self.chat_ai.model,
+                          'prompt': self.prompt_id}
+                self._checkpoint.write(json.dumps(record, ensure_ascii=False) + "\n")
+                self._checkpoint.flush()
+
+    def _complete_loop(self):
+        while True:
+            job = self._jobs.get()
+            if job is None:
+                return
+            if self._stopping:
+                self._finish_window(job[0], failed=True)
+                continue
+            self._complete(*job)
+
+    def _complete(self, path, window_id, turn, context, reference):
+        """请求一个窗口的回复并写入结果文件"""
+        messages = self.chat_ai.format_messages_for_ai(context)
+        prompt_tokens = sum(estimate_tokens(msg['content']) for msg in messages)
+        record = {'id': window_id, 'file': path, 'turn': turn, 'model': self.chat_ai.model, 'prompt': self.prompt_id}
+        started = time.perf_counter()
+        try:
+            reply, first_token = self.chat_ai.complete(messages, stream=self.stream)
+            failed = False
+        except Exception as e:
+            reply, first_token = None, None
+            failed = True
+            record['error'] = f"{type(e).__name__}: {str(e)}"
+        latency = time.perf_counter() - started
+        record.update(status=STATUS_ERROR if failed else STATUS_OK, reply=reply, reference=reference,
+                      prompt_tokens=prompt_tokens, latency=round(latency, 4))
+        if self.stream and first_token is not None:
+            record['first_token'] = round(first_token, 4)
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self._lock:
+            self._results.write(line)
+            self._results.flush()
+            if failed:
+                self.stats['errors'] += 1
+            else:
+                self.stats['ok'] += 1
+                self.stats['prompt_tokens'] += prompt_tokens
+                self.stats['completion_tokens'] += estimate_tokens(reply)
+                self.latencies.append(latency)
+                if self.stream and first_token is not None:
+                    self.first_tokens.append(first_token)
+            now = time.monotonic()
+            if now - self._last_progress >= self.progress_interval:
+                self._last_progress = now
+                print(f"进度: 已解析 {self.stats['files_parsed']} 个日志，"
+                      f"成功 {self.stats['ok']} / 失败 {self.stats['errors']} 个窗口")
+        self._finish_window(path, failed)
+
+    def report(self, elapsed):
+        """打印并返回吞吐统计"""
+        stats = dict(self.stats)
+        completed = stats['ok'] + stats['errors']
+        stats.update(
+            elapsed=round(elapsed, 3),
+            files_per_second=round(stats['files_parsed'] / elapsed, 2) if elapsed else 0.0,
+            completions_per_second=round(completed / elapsed, 2) if elapsed else 0.0,
+            prompt_tokens_per_second=round(stats['prompt_tokens'] / elapsed, 1) if elapsed else 0.0,
+            latency_p50=round(percentile(self.latencies, 50), 4),
+            latency_p99=round(percentile(self.latencies, 99), 4),
+            parse_seconds=round(stats['parse_seconds'], 3),
+        )
+        if self.first_tokens:
+            stats.update(first_token_p50=round(percentile(self.first_tokens, 50), 4),
+                         first_token_p99=round(percentile(self.first_tokens, 99), 4))
+        print("\n===== 批量回放统计 =====")
+        print(f"日志: {stats['files']} 个（解析 {stats['files_parsed']}，检查点跳过 {stats['files_skipped']}，"
+              f"出错 {stats['parse_errors']}），消息 {stats['messages']} 条")
+        print(f"解析: 工作进程累计 {stats['parse_seconds']:.2f} 秒，{stats['files_per_second']} 个日志/秒")
+        print(f"窗口: {stats['windows']} 个（已完成跳过 {stats['windows_skipped']}），"
+              f"成功 {stats['ok']}，失败 {stats['errors']}")
+        print(f"吞吐: {stats['completions_per_second']} 次请求/秒，提示词 {stats['prompt_tokens_per_second']} tokens/秒")
+        print(f"请求耗时: p50 = {stats['latency_p50'] * 1000:.1f} ms, p99 = {stats['latency_p99'] * 1000:.1f} ms")
+        if self.first_tokens:
+            print(f"首字延迟: p50 = {stats['first_token_p50'] * 1000:.1f} ms, "
+                  f"p99 = {stats['first_token_p99'] * 1000:.1f} ms")
+        print(f"总耗时: {elapsed:.2f} 秒，结果: {self.output}")
+        return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="用归档的聊天日志批量生成AI回复（评估提示词或模型），结果写入JSONL文件")
+    parser.add_argument('paths', nargs='+', help="聊天日志文件或目录（目录递归查找）")
+    parser.add_argument('-o', '--output', default='replay_results.jsonl', help="JSONL结果文件")
+    parser.add_argument('--pattern', default='*.txt', help="在目录中查找的日志文件名模式")
+    parser.add_argument('--base-url', help="API地址（OpenAI兼容接口）")
+    parser.add_argument('--model', help="模型名称")
+    parser.add_argument('--system-prompt-file', help="从文件读取系统提示词")
+    parser.add_argument('--mode', choices=MODES, default=MODE_TURNS, help="turns: 每轮回复一次；last: 每个日志一次")
+    parser.add_argument('--max-windows', type=int, help="每个日志最多回放的窗口数（保留最近的）")
+    parser.add_argument('--token-budget', type=int, default=DEFAULT_TOKEN_BUDGET, help="上下文的token预算")
+    parser.add_argument('--history-segments', type=int, default=0, help="额外读取的已轮转压缩分段数")
+    parser.add_argument('-c', '--concurrency', type=int, default=8, help="同时进行的AI请求数")
+    parser.add_argument('-p', '--processes', type=int, help="解析日志的进程数（默认CPU核数）")
+    parser.add_argument('--rate', type=float, default=0.0, help="每秒最多发出的请求数，0表示不限流")
+    parser.add_argument('--stream', action='store_true', help="使用流式请求并记录首字延迟")
+    parser.add_argument('--no-resume', action='store_true', help="清空已有的结果和检查点，重新开始")
+    parser.add_argument('--report', help="把吞吐统计写入JSON文件")
+    args = parser.parse_args(argv)
+
+    system_prompt = None
+    if args.system_prompt_file:
+        with open(args.system_prompt_file, 'r', encoding='utf-8') as f:
+            system_prompt = f.read().strip()
+    replay = BatchReplay(args.output, base_url=args.base_url, model=args.model, system_prompt=system_prompt,
+                         concurrency=args.concurrency, processes=args.processes, mode=args.mode,
+                         max_windows=args.max_windows, token_budget=args.token_budget,
+                         history_segments=args.history_segments, rate=args.rate, stream=args.stream,
+                         resume=not args.no_resume)
+    stats = replay.run(args.paths, args.pattern)
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump(stats, f, ensure_ascii=False, indent=2)
+    return 0 if not stats['errors'] and not stats['parse_errors'] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,67 @@
+"""AI客户端连接复用基准：比较每次回复新建客户端与进程内共享客户端
+
+对本地模拟服务器连续发起多次流式回复，统计服务端收到的连接数、
+客户端新建连接数/复用数以及平均每次回复的耗时。
+
+运行方式（在仓库根目录）：
+    python benchmarks/bench_ai_client.py
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import openai
+
+from AI import ChatAI
+from mock_openai_server import MockOpenAIServer
+
+MESSAGES = [{"role": "user", "content": "B: 今天吃什么"}]
+
+
+def stream_reply(client):
+    """发起一次流式回复并读取完整内容"""
+    response = client.chat.completions.create(model="qwen-turbo", messages=MESSAGES, stream=True)
+    return "".join(chunk.choices[0].delta.content or "" for chunk in response)
+
+
+def bench_per_reply_client(base_url, replies):
+    """旧方式：每次回复都新建 openai.OpenAI 客户端"""
+    start = time.perf_counter()
+    for _ in range(replies):
+        client = openai.OpenAI(api_key="mock", base_url=base_url)
+        stream_reply(client)
+        client.close()
+    return (time.perf_counter() - start) / replies * 1e3
+
+
+def bench_shared_client(base_url, replies):
+    """新方式：通过 ChatAI 复用进程内共享的客户端"""
+    chat_ai = ChatAI(base_url=base_url)
+    chat_ai.warm_up()
+    start = time.perf_counter()
+    for _ in range(replies):
+        stream_reply(ChatAI(base_url=base_url).client)
+    elapsed = (time.perf_counter() - start) / replies * 1e3
+    return elapsed, chat_ai.connection_stats
+
+
+def main(replies=50):
+    with MockOpenAIServer() as server:
+        per_reply_ms = bench_per_reply_client(server.base_url, replies)
+        per_reply_connections = server.connections
+
+    with MockOpenAIServer() as server:
+        shared_ms, stats = bench_shared_client(server.base_url, replies)
+        shared_connections = server.connections
+
+    print(f"回复次数: {replies}")
+    print(f"每次新建客户端: 服务端连接数 {per_reply_connections}, 平均 {per_reply_ms:.2f} ms/次")
+    print(f"共享客户端:     服务端连接数 {shared_connections}, 平均 {shared_ms:.2f} ms/次")
+    print(f"共享客户端统计: {stats.summary()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""AI请求容错基准：对注入了429和卡顿的本地模拟服务器发起回复请求
+
+比较三种策略：
+    - 不重试：max_retries=0（相当于旧实现，失败直接变成"错误:"回复）
+    - 重试：首字超时 + 带随机抖动的指数退避重试
+    - 重试 + 对冲：首字延迟超过最近请求的p90时再发出一个请求
+
+报告成功率、回复耗时 p50/p99，以及重试、对冲和限流相关的事件计数。
+
+运行方式（在仓库根目录）：
+    python benchmarks/bench_ai_resilience.py
+    python benchmarks/bench_ai_resilience.py --requests 200 --error-rate 0.2 --stall-rate 0.1
+"""
+import argparse
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from AI import ChatAI
+from metrics import metrics
+from mock_openai_server import MockOpenAIServer
+from request_policy import LatencyTracker, TokenBucket
+
+MESSAGES = [{"role": "user", "content": "B: 今天吃什么"}]
+
+EVENTS = ('ai_retries', 'ai_rate_limited', 'ai_first_token_timeouts', 'ai_hedged', 'ai_hedge_wins', 'ai_errors')
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    if not values:
+        return float('nan')
+    return values[min(len(values) - 1, max(0, int(round(pct / 100 * (len(values) - 1)))))]
+
+
+def run_requests(args, policy):
+    """按指定策略并发发起请求，返回 (成功耗时列表, 失败数, 事件计数, 服务端统计)"""
+    with tempfile.TemporaryDirectory() as workdir, \
+            MockOpenAIServer(first_token_delay=0.02, chunk_delay=0.002, error_rate=args.error_rate,
+                             stall_rate=args.stall_rate, stall_seconds=args.stall_seconds, seed=args.seed) as server:
+        limiter = TokenBucket(args.rate, args.burst)
+        latency = LatencyTracker()
+        before = dict(metrics.counters)
+        durations = []
+        failures = []
+        lock = threading.Lock()
+
+        def worker(count):
+            chat_ai = ChatAI(os.path.join(workdir, "chat_log.txt"), base_url=server.base_url, response_cache=None,
+                             rate_limiter=limiter, request_policy=policy)
+            chat_ai.first_token_latency = latency
+            for _ in range(count):
+                start = time.perf_counter()
+                reply = chat_ai.call_ai_model(MESSAGES)
+                with lock:
+                    if reply and not reply.startswith("错误:"):
+                        durations.append(time.perf_counter() - start)
+                    else:
+                        failures.append(reply)
+
+        per_worker = args.requests // args.concurrency
+        threads = [threading.Thread(target=worker, args=(per_worker,)) for _ in range(args.concurrency)]
+        # 屏蔽ChatAI的控制台输出和错误堆栈（重定向是进程级的，在所有线程结束后恢复）
+        with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        events = {name: metrics.counters.get(name, 0) - before.get(name, 0) for name in EVENTS}
+        return durations, len(failures), events, (server.requests, server.rejected, server.stalled)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="AI请求容错基准")
+    parser.add_argument('--requests', type=int, default=120, help="请求总数")
+    parser.add_argument('--concurrency', type=int, default=4, help="并发的聊天数")
+    parser.add_argument('--error-rate', type=float, default=0.15, help="模拟服务器返回429的比例")
+    parser.add_argument('--stall-rate', type=float, default=0.1, help="模拟服务器卡住的比例")
+    parser.add_argument('--stall-seconds', type=float, default=5.0, help="卡住的时间(秒)")
+    parser.add_argument('--rate', type=float, default=50.0, help="令牌桶速率(请求/秒)")
+    parser.add_argument('--burst', type=int, default=10, help="令牌桶容量")
+    parser.add_argument('--seed', type=int, default=1, help="故障注入的随机数种子")
+    args = parser.parse_args()
+
+    metrics.enable()
+    base = {'first_token_timeout': 1.0, 'total_timeout': 20.0, 'backoff_base': 0.1, 'backoff_cap': 1.0}
+    strategies = [
+        ("不重试", dict(base, max_retries=0)),
+        ("重试", dict(base, max_retries=4)),
+        ("重试 + 对冲(p90)", dict(base, max_retries=4, hedge_percentile=90, hedge_min_samples=10)),
+    ]
+
+    print(f"{args.requests} 次请求，并发 {args.concurrency}，429比例 {args.error_rate:.0%}，"
+          f"卡住比例 {args.stall_rate:.0%}（{args.stall_seconds}秒）")
+    for name, policy in strategies:
+        durations, failed, events, (requests, rejected, stalled) = run_requests(args, policy)
+        total = len(durations) + failed
+        print(f"\n[{name}]")
+        print(f"  成功率: {len(durations) / total:.1%} ({len(durations)}/{total})")
+        print(f"  回复耗时: p50 = {percentile(durations, 50) * 1e3:.0f} ms, p99 = {percentile(durations, 99) * 1e3:.0f} ms")
+        print(f"  服务端: 请求 {requests}，返回429 {rejected}，卡住 {stalled}")
+        print("  事件: " + ", ".join(f"{key}={value}" for key, value in events.items()))
+
+
+if __name__ == "__main__":
+    main()
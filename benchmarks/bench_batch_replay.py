@@ -0,0 +1,118 @@
+"""离线批量回放基准：在本地模拟服务器上回放一批模拟的聊天日志
+
+比较：
+    - 顺序回放：1个解析进程、1个并发请求（相当于对每个日志依次运行 python AI.py）
+    - 并行回放：多进程解析 + 有界并发请求
+    - 断点续跑：第一次运行注入429且不重试，部分窗口失败；再次运行时只请求失败的窗口，
+      检查点中已完成的日志不再解析
+    - 修改提示词：用另一个系统提示词写入同一个结果文件，检查全部窗口都重新请求（不符合时退出）
+
+报告日志解析和请求的吞吐、请求耗时，以及续跑时实际发出的请求数。
+
+运行方式（在仓库根目录）：
+    python benchmarks/bench_batch_replay.py
+    python benchmarks/bench_batch_replay.py --files 400 --messages 3000 --concurrency 32
+"""
+import argparse
+import contextlib
+import io
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from batch_replay import BatchReplay, read_jsonl
+from mock_openai_server import MockOpenAIServer
+
+
+def write_logs(workdir, files, messages):
+    """生成模拟的聊天日志：对方连续说1~3句，自己回复1~2句"""
+    paths = []
+    for n in range(files):
+        path = os.path.join(workdir, f"好友{n:04d}.txt")
+        lines = ["===== 微信聊天记录 - 开始时间: 2025-05-02 20:06:16 =====", ""]
+        for i in range(messages):
+            ts = f"[2025-05-02 {(i // 3600) % 24:02d}:{(i // 60) % 60:02d}:{i % 60:02d}]"
+            if i % 5 in (0, 1, 2):
+                lines.append(f"{ts} [好友{n:04d}] 第{i}条消息，周末要不要一起去爬山？顺便吃个火锅")
+            else:
+                lines.append(f"{ts} [自己] 好呀，第{i}条回复")
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write("\n".join(lines) + "\n")
+        paths.append(path)
+    return paths
+
+
+def replay(server, output, paths, quiet=True, **kwargs):
+    replay = BatchReplay(output, base_url=server.base_url, progress_interval=3600, **kwargs)
+    output_buffer = io.StringIO()
+    with contextlib.redirect_stdout(output_buffer) if quiet else contextlib.nullcontext():
+        return replay.run(paths)
+
+
+def show(name, stats, requests):
+    print(f"\n[{name}]")
+    print(f"  日志: 解析 {stats['files_parsed']}，检查点跳过 {stats['files_skipped']}；"
+          f"窗口: 成功 {stats['ok']}，失败 {stats['errors']}，已完成跳过 {stats['windows_skipped']}")
+    print(f"  解析: 工作进程累计 {stats['parse_seconds']:.2f} 秒")
+    print(f"  吞吐: {stats['completions_per_second']:.1f} 次请求/秒，总耗时 {stats['elapsed']:.2f} 秒")
+    print(f"  请求耗时: p50 = {stats['latency_p50'] * 1e3:.1f} ms, p99 = {stats['latency_p99'] * 1e3:.1f} ms")
+    print(f"  服务端收到请求: {requests}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="离线批量回放基准")
+    parser.add_argument('--files', type=int, default=100, help="日志文件数")
+    parser.add_argument('--messages', type=int, default=2000, help="每个日志的消息数")
+    parser.add_argument('--max-windows', type=int, default=3, help="每个日志回放的窗口数")
+    parser.add_argument('--concurrency', type=int, default=16, help="并行回放的并发请求数")
+    parser.add_argument('--processes', type=int, default=os.cpu_count() or 1, help="并行回放的解析进程数")
+    parser.add_argument('--latency', type=float, default=0.02, help="模拟服务器的首字延迟(秒)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        logs = os.path.join(workdir, "logs")
+        os.makedirs(logs)
+        paths = write_logs(logs, args.files, args.messages)
+        size_mb = sum(os.path.getsize(path) for path in paths) / 1024 / 1024
+        print(f"{args.files} 个日志（共 {size_mb:.1f} MB），每个日志回放最近 {args.max_windows} 轮，"
+              f"模拟首字延迟 {args.latency * 1e3:.0f} ms")
+
+        common = dict(max_windows=args.max_windows)
+        with MockOpenAIServer(first_token_delay=args.latency) as server:
+            stats = replay(server, os.path.join(workdir, "sequential.jsonl"), [logs],
+                           processes=1, concurrency=1, **common)
+            show("顺序回放（1进程，并发1）", stats, server.requests)
+
+        with MockOpenAIServer(first_token_delay=args.latency) as server:
+            stats = replay(server, os.path.join(workdir, "parallel.jsonl"), [logs],
+                           processes=args.processes, concurrency=args.concurrency, **common)
+            show(f"并行回放（{args.processes}进程，并发{args.concurrency}）", stats, server.requests)
+
+        output = os.path.join(workdir, "resume.jsonl")
+        policy = {'max_retries': 0}
+        with MockOpenAIServer(first_token_delay=args.latency, error_rate=0.2, seed=1) as server:
+            stats = replay(server, output, [logs], processes=args.processes, concurrency=args.concurrency,
+                           request_policy=policy, **common)
+            show("断点续跑：第一次（20%请求返回429，不重试）", stats, server.requests)
+            server.httpd.error_rate = 0.0
+            before = server.requests
+            stats = replay(server, output, [logs], processes=args.processes, concurrency=args.concurrency,
+                           request_policy=policy, **common)
+            show("断点续跑：再次运行", stats, server.requests - before)
+            before = server.requests
+            stats = replay(server, output, [logs], processes=args.processes, concurrency=args.concurrency,
+                           request_policy=policy, system_prompt="请用一句话回复B。", **common)
+            show("修改提示词后再次运行", stats, server.requests - before)
+            changed_prompt_requests = server.requests - before
+        finished = {(record['id'], record['prompt']) for record in read_jsonl(output) if record['status'] == 'ok'}
+        print(f"\n结果文件中成功的窗口: {len(finished)} / {args.files * args.max_windows * 2}（两个提示词）")
+        if changed_prompt_requests != args.files * args.max_windows:
+            print(f"修改提示词后应重新请求 {args.files * args.max_windows} 个窗口，实际 {changed_prompt_requests} 个")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
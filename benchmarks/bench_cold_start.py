@@ -0,0 +1,108 @@
+"""冷启动基准：在新的Python进程中从导入chat_logger到添加完监听的耗时
+
+比较并行启动（连接微信的同时在后台导入openai、创建AI客户端、读取已有的消息记录和恢复会话）
+与按顺序启动（parallel_startup=False）。模拟微信驱动在创建时等待attach_delay秒（模拟连接微信），
+AI连接预热请求发往本地模拟服务器。每种方式先运行一次生成日志，之后的运行从已有记录继续（resume），
+报告每次运行的总耗时和启动各阶段的耗时。
+
+运行方式（在仓库根目录）：
+    python benchmarks/bench_cold_start.py
+    python benchmarks/bench_cold_start.py --targets 20 --history 500 --attach-delay 1.0 --runs 5
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from mock_openai_server import MockOpenAIServer
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 在子进程中运行：导入chat_logger、创建ChatLogger并添加监听，将JSON格式的耗时写入结果文件
+# （后台的AI连接预热线程可能在屏蔽输出结束后才打印，不能从标准输出读取结果）
+CHILD = r'''
+import contextlib, io, json, sys, time
+started = time.perf_counter()
+sys.path.insert(0, sys.argv[1])
+config = json.loads(sys.argv[2])
+with contextlib.redirect_stdout(io.StringIO()):
+    # chat_logger本身的导入在创建ChatLogger之前，由这里计时并记录导入的模块
+    from startup_profile import ImportRecorder
+    recorder = ImportRecorder().install()
+    import_started = time.perf_counter()
+    from chat_logger import ChatLogger
+    from wechat_driver import FakeWeChat
+    imported = time.perf_counter()
+    recorder.remove()
+    targets = config['targets']
+    history = {name: [('friend', f"{name}的第{j}条消息，周末一起去爬山吗") for j in range(config['history'])]
+               for name in targets}
+    logger = ChatLogger(driver=lambda: FakeWeChat(sessions=targets, history=history,
+                                                 attach_delay=config['attach_delay']),
+                        ai_base_url=config['base_url'], preload_chats=targets,
+                        parallel_startup=config['parallel'], profile_startup=True)
+    created = time.perf_counter()
+    logger.startup.record('import_chat_logger', import_started, imported,
+                          recorder.modules(import_started, imported))
+    logger.add_listen_chats(targets)
+    ready = time.perf_counter()
+phases = {}
+for name, thread, start, elapsed, modules in logger.startup.phases:
+    name = name.split(':')[0]
+    phases[name] = phases.get(name, 0.0) + elapsed
+with open(config['result_file'], 'w', encoding='utf-8') as f:
+    json.dump({'import': imported - started, 'init': created - imported, 'listen': ready - created,
+               'total': ready - started, 'phases': phases}, f)
+'''
+
+# 报告中列出的阶段
+PHASES = ('import_chat_logger', 'connect_wechat', 'import_ai', 'create_ai_client', 'init_log_file', 'restore',
+          'wait_background', 'add_listen_chats')
+
+
+def run_child(config):
+    started = time.perf_counter()
+    result_file = os.path.join(config['workdir'], 'cold_start_result.json')
+    subprocess.run([sys.executable, '-c', CHILD, REPO, json.dumps(dict(config, result_file=result_file))],
+                   cwd=config['workdir'], capture_output=True, text=True, check=True)
+    with open(result_file, encoding='utf-8') as f:
+        result = json.load(f)
+    result['process'] = time.perf_counter() - started  # 包括启动Python解释器
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="冷启动基准")
+    parser.add_argument('--targets', type=int, default=10, help="监听的聊天数")
+    parser.add_argument('--history', type=int, default=200, help="每个聊天的历史消息数")
+    parser.add_argument('--attach-delay', type=float, default=0.5, help="模拟连接微信的耗时(秒)")
+    parser.add_argument('--runs', type=int, default=3, help="每种方式的运行次数（不含生成日志的第一次）")
+    args = parser.parse_args()
+
+    targets = [f"聊天{i}" for i in range(args.targets)]
+    print(f"{args.targets} 个聊天，每个聊天 {args.history} 条历史消息，模拟连接微信 {args.attach_delay:.1f} 秒")
+    with MockOpenAIServer() as server:
+        for parallel in (False, True):
+            with tempfile.TemporaryDirectory() as workdir:
+                config = {'workdir': workdir, 'targets': targets, 'history': args.history,
+                          'attach_delay': args.attach_delay, 'base_url': server.base_url, 'parallel': parallel}
+                run_child(config)
+                results = [run_child(config) for _ in range(args.runs)]
+            best = min(results, key=lambda result: result['total'])
+            average = sum(result['total'] for result in results) / len(results)
+            print(f"\n[{'并行启动' if parallel else '按顺序启动'}]")
+            print(f"  进程启动到添加完监听: 平均 {average:.3f} 秒，最快 {best['total']:.3f} 秒"
+                  f"（含解释器启动 {best['process']:.3f} 秒）")
+            print(f"  其中 导入 {best['import']:.3f} 秒，创建ChatLogger {best['init']:.3f} 秒，"
+                  f"添加监听 {best['listen']:.3f} 秒")
+            print("  各阶段（后台阶段与主线程重叠）: " + ", ".join(
+                f"{name}={best['phases'][name]:.3f}" for name in PHASES if name in best['phases']))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+"""端到端基准：模拟微信驱动 + 本地模拟AI服务器
+
+报告：
+    - 消息写入吞吐（条/秒）
+    - 从最后一条朋友消息到 SendMsg 的延迟 p50/p99（减去 reply_delay 即为系统开销）
+    - 每条消息写入磁盘的字节数
+    - 长时间运行的内存（RSS）增长
+
+运行方式（在仓库根目录）：
+    python benchmarks/bench_e2e.py
+    python benchmarks/bench_e2e.py --chats 8 --turns 30 --messages 200000
+"""
+import argparse
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from chat_logger import ChatLogger
+from mock_openai_server import MockOpenAIServer
+from wechat_driver import FakeWeChat
+
+
+def current_rss_mb():
+    """当前进程的常驻内存(MB)"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1024 / 1024
+    except (OSError, ValueError, AttributeError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    if not values:
+        return float('nan')
+    index = min(len(values) - 1, max(0, int(round(pct / 100 * (len(values) - 1)))))
+    return values[index]
+
+
+def dir_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            total += os.path.getsize(os.path.join(root, name))
+    return total
+
+
+@contextlib.contextmanager
+def quiet_workdir():
+    """在临时目录中运行，并屏蔽ChatLogger/ChatAI的控制台输出"""
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir)
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                yield workdir
+        finally:
+            os.chdir(cwd)
+
+
+def start_logger(driver, server, chats, reply_delay, **kwargs):
+    """创建ChatLogger、添加监听并在后台线程中开始记录"""
+    logger = ChatLogger(driver=driver, ai_base_url=server.base_url, reply_delay=reply_delay, **kwargs)
+    logger.add_listen_chats(chats)
+    thread = threading.Thread(target=logger.start_logging,
+                              kwargs={'interval': 0.05, 'min_interval': 0.02, 'max_interval': 0.2}, daemon=True)
+    thread.start()
+    return logger, thread
+
+
+def bench_reply_latency(chat_count, turns, reply_delay):
+    """每轮向所有聊天各发一条朋友消息，测量到对应SendMsg的延迟"""
+    chats = [f"好友{i}" for i in range(chat_count)]
+    sent_events = {name: threading.Event() for name in chats}
+    send_times = {}
+
+    def on_send(who, msg):
+        send_times[who] = time.monotonic()
+        sent_events[who].set()
+
+    latencies = []
+    with quiet_workdir(), MockOpenAIServer(first_token_delay=0.05, chunk_delay=0.005) as server:
+        driver = FakeWeChat(sessions=chats, on_send=on_send)
+        logger, thread = start_logger(driver, server, chats, reply_delay)
+        for turn in range(turns):
+            pushed_at = {}
+            for name in chats:
+                sent_events[name].clear()
+                driver.push(name, 'friend', f"第{turn}轮，{name}问：今晚吃什么？")
+                pushed_at[name] = time.monotonic()
+            for name in chats:
+                if sent_events[name].wait(timeout=reply_delay + 10):
+                    latencies.append(send_times[name] - pushed_at[name])
+        logger.stop()
+        thread.join(timeout=10)
+    return latencies
+
+
+def bench_ingestion(total, batch, sample_every):
+    """批量投递朋友消息（不触发回复），测量写入吞吐、每条消息的写入字节数和内存增长"""
+    chats = [f"群聊{i}" for i in range(4)]
+    rss_samples = []
+    with quiet_workdir() as workdir, MockOpenAIServer() as server:
+        driver = FakeWeChat(sessions=chats)
+        logger, thread = start_logger(driver, server, chats, reply_delay=3600)
+        base_count = logger.total_messages
+        base_bytes = dir_size(workdir)
+        rss_samples.append((0, current_rss_mb()))
+
+        start = time.perf_counter()
+        pushed = 0
+        while pushed < total:
+            for i in range(min(batch, total - pushed)):
+                driver.push(chats[(pushed + i) % len(chats)], 'friend', f"第{pushed + i}条消息：哈哈哈哈今天吃了火锅")
+            pushed += min(batch, total - pushed)
+            # 等待本批消息被轮询线程写入，避免收件箱无限堆积
+            while logger.total_messages - base_count < pushed:
+                time.sleep(0.001)
+            if pushed % sample_every == 0:
+                rss_samples.append((pushed, current_rss_mb()))
+        elapsed = time.perf_counter() - start
+
+        logger.stop()
+        thread.join(timeout=10)
+        bytes_per_message = (dir_size(workdir) - base_bytes) / total
+    return total / elapsed, bytes_per_message, rss_samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description="微信AI自动回复端到端基准")
+    parser.add_argument('--chats', type=int, default=4, help="并发聊天数")
+    parser.add_argument('--turns', type=int, default=20, help="每个聊天的对话轮数")
+    parser.add_argument('--reply-delay', type=float, default=0.3, help="自动回复前的空闲等待(秒)")
+    parser.add_argument('--messages', type=int, default=50000, help="写入吞吐测试的消息数")
+    parser.add_argument('--batch', type=int, default=500, help="每次轮询投递的消息数")
+    args = parser.parse_args()
+
+    latencies = bench_reply_latency(args.chats, args.turns, args.reply_delay)
+    throughput, bytes_per_message, rss_samples = bench_ingestion(args.messages, args.batch, max(args.messages // 5, 1))
+
+    expected = args.chats * args.turns
+    print(f"回复延迟（{len(latencies)}/{expected} 次回复，reply_delay={args.reply_delay}s）:")
+    print(f"  p50 = {percentile(latencies, 50) * 1e3:.1f} ms, p99 = {percentile(latencies, 99) * 1e3:.1f} ms")
+    print(f"  扣除reply_delay后的开销 p50 = {(percentile(latencies, 50) - args.reply_delay) * 1e3:.1f} ms")
+    print(f"消息写入吞吐: {throughput:,.0f} 条/秒")
+    print(f"每条消息写入磁盘: {bytes_per_message:.1f} 字节")
+    print("内存（RSS）增长:")
+    for count, rss in rss_samples:
+        print(f"  {count:>8} 条消息: {rss:8.1f} MB  (+{rss - rss_samples[0][1]:.1f} MB)")
+
+
+if __name__ == "__main__":
+    main()
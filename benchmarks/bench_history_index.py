@@ -0,0 +1,140 @@
+"""历史索引基准：增量建立倒排索引和检索相关较早消息的耗时
+
+报告：
+    - 建立索引：每条消息的耗时、索引占用的内存
+    - 检索：每次查询（对方最新消息，取前k条）的耗时 p50/p99
+    - 提示词大小：把全部历史发送给AI与"上下文窗口 + 检索结果"的token数
+    - 重启：会话日志轮转出多个压缩分段后重新创建会话，从日志恢复索引的耗时，
+      并检查早于日志末尾64KB的消息仍然可以检索到（检索不到时退出）
+
+运行方式（在仓库根目录）：
+    python benchmarks/bench_history_index.py
+    python benchmarks/bench_history_index.py --messages 5000 --queries 1000
+"""
+import argparse
+import gc
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chat_session import ChatSession
+from context_window import estimate_tokens
+from history_index import HistoryIndex
+from message_record import Message, MessageKind
+
+WORDS = ["今天", "明天", "周末", "吃饭", "火锅", "电影", "爬山", "加班", "开会", "项目", "猫", "狗", "医院", "天气",
+         "下雨", "出去", "玩", "学习", "考试", "工作", "老板", "地铁", "迟到", "咖啡", "奶茶", "游戏", "睡觉", "旅游",
+         "机票", "酒店", "生日", "礼物", "快递", "手机", "电脑", "好的", "哈哈", "真的吗", "为什么", "怎么样"]
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    if not values:
+        return float('nan')
+    return values[min(len(values) - 1, max(0, int(round(pct / 100 * (len(values) - 1)))))]
+
+
+def make_vocabulary(rng, size=2000):
+    """常用词加随机的双字词，按齐普夫分布（排名越靠前出现越频繁）抽取"""
+    words = list(WORDS)
+    while len(words) < size:
+        words.append(chr(rng.randint(0x4e00, 0x6fff)) + chr(rng.randint(0x4e00, 0x6fff)))
+    weights = [1 / (rank + 1) for rank in range(len(words))]
+    return words, weights
+
+
+def make_messages(n, rng):
+    words, weights = make_vocabulary(rng)
+    messages = []
+    for i in range(n):
+        content = "".join(rng.choices(words, weights, k=rng.randint(2, 8)))
+        kind = MessageKind.FRIEND if i % 2 == 0 else MessageKind.SELF
+        messages.append(Message(kind, content, '好友' if kind == MessageKind.FRIEND else '', '好友', timestamp=i))
+    return messages
+
+
+def bench_restart(messages, index_size):
+    """写入会话日志（小的轮转大小，产生多个压缩分段）后重新创建会话并恢复
+
+    Returns:
+        tuple: (恢复耗时(秒), 索引中的消息数, 只读取日志末尾64KB时索引中的消息数, 最早的消息是否可以检索到)
+    """
+    with tempfile.TemporaryDirectory() as workdir:
+        session = ChatSession('好友', workdir, max_log_bytes=256 * 1024, index_size=index_size)
+        session.init_log_file("===== 好友 的聊天记录 =====")
+        for msg in messages:
+            session.append_to_log(f"[2025-05-02 20:00:00] [{'自己' if msg.kind == MessageKind.SELF else '好友'}] {msg.content}")
+        session.log.close()
+
+        restarted = ChatSession('好友', workdir, index_size=index_size)
+        started = time.perf_counter()
+        restarted.restore(restarted.read_log_tail(min_messages=index_size))
+        elapsed = time.perf_counter() - started
+        tail_only = ChatSession('好友', workdir, index_size=index_size)
+        tail_only.restore(tail_only.read_log_tail())
+
+        # 索引中最早的一条消息，用它的内容检索
+        oldest = messages[-len(restarted.index)].content
+        found = any(msg.content == oldest for _, _, msg in restarted.index.search(oldest, 5))
+        return elapsed, len(restarted.index), len(tail_only.index), found
+
+
+def main():
+    parser = argparse.ArgumentParser(description="历史索引基准")
+    parser.add_argument('--messages', type=int, default=20000, help="索引的消息数")
+    parser.add_argument('--queries', type=int, default=1000, help="查询次数")
+    parser.add_argument('--k', type=int, default=3, help="每次检索的消息数")
+    parser.add_argument('--context', type=int, default=20, help="上下文窗口的消息数（用于比较提示词大小）")
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    messages = make_messages(args.messages, rng)
+
+    index = HistoryIndex(max_documents=args.messages)
+    started = time.perf_counter()
+    for msg in messages:
+        index.add(msg)
+    build = time.perf_counter() - started
+
+    # 单独统计内存（tracemalloc会拖慢建立索引）
+    gc.collect()
+    tracemalloc.start()
+    measured = HistoryIndex(max_documents=args.messages)
+    measured.extend(messages)
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del measured
+
+    queries = [messages[rng.randrange(len(messages))].content for _ in range(args.queries)]
+    durations = []
+    retrieved_tokens = []
+    for query in queries:
+        started = time.perf_counter()
+        results = index.search(query, args.k)
+        durations.append(time.perf_counter() - started)
+        retrieved_tokens.append(sum(estimate_tokens(msg.content) for _, _, msg in results))
+
+    full_tokens = sum(estimate_tokens(msg.content) for msg in messages)
+    context_tokens = sum(estimate_tokens(msg.content) for msg in messages[-args.context:])
+    average_retrieved = sum(retrieved_tokens) / len(retrieved_tokens)
+
+    print(f"{args.messages} 条消息，{len(index.postings)} 个词项")
+    print(f"  建立索引: {build / args.messages * 1e6:.1f} us/条（共 {build:.2f} 秒），内存 {memory / 1024 / 1024:.1f} MB")
+    print(f"  检索（k={args.k}）: p50 = {percentile(durations, 50) * 1e3:.2f} ms, p99 = {percentile(durations, 99) * 1e3:.2f} ms")
+    print(f"  提示词: 全部历史 {full_tokens} tokens，上下文窗口 {context_tokens} + 检索结果 {average_retrieved:.0f} tokens")
+
+    index_size = min(args.messages, 5000)
+    elapsed, restored, tail_only, found = bench_restart(messages, index_size)
+    print(f"  重启: 从日志和压缩分段恢复 {restored} 条消息的索引用时 {elapsed * 1e3:.0f} ms"
+          f"（只读取日志末尾64KB时为 {tail_only} 条），最早的消息{'可以' if found else '无法'}检索到")
+    if not found:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
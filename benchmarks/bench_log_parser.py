@@ -0,0 +1,112 @@
+"""聊天日志解析基准：比较旧的逐行多正则全量解析与增量解析器
+
+生成一个数MB的模拟聊天日志（含引用续行和AI回复段落），分别测量：
+    - 旧实现全量解析一次的耗时
+    - 增量解析器首次全量解析的耗时
+    - 追加少量新消息后增量解析的耗时
+
+运行方式（在仓库根目录）：
+    python benchmarks/bench_log_parser.py
+"""
+import os
+import re
+import sys
+import time
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chat_log_parser import ChatLogParser
+
+
+def legacy_parse(log_file):
+    """旧的 ChatAI.parse_chat_messages 实现（每行依次尝试四个未编译的正则）"""
+    messages = []
+    with open(log_file, 'r', encoding='utf-8') as f:
+        lines = f.readlines()
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        time_match = re.search(r'\[(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2})\] \[时间\] (.+)', line)
+        if time_match:
+            messages.append(['Time', time_match.group(2)])
+            continue
+        self_match = re.search(r'\[(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2})\] \[自己\] (.+)', line)
+        if self_match:
+            messages.append(['Self', self_match.group(2)])
+            continue
+        sys_match = re.search(r'\[(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2})\] \[系统\] (.+)', line)
+        if sys_match:
+            if not sys_match.group(2).startswith('错误:'):
+                messages.append(['SYS', sys_match.group(2)])
+            continue
+        chat_match = re.search(r'\[(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2})\] \[([^\]]+)\] (.+)', line)
+        if chat_match and chat_match.group(2) not in ['时间', '系统', '自己']:
+            messages.append([chat_match.group(2), chat_match.group(3)])
+    return messages
+
+
+def synthetic_lines(count, start=0):
+    """生成模拟日志行"""
+    lines = []
+    for i in range(start, start + count):
+        ts = f"[2025-05-02 20:{(i // 60) % 60:02d}:{i % 60:02d}]"
+        kind = i % 10
+        if kind == 0:
+            lines.append(f"{ts} [时间] 2025-05-02 16:08:00")
+        elif kind in (1, 2, 3, 4):
+            lines.append(f"{ts} [关键词] 第{i}条消息，我们三个人点了五个菜哈哈哈哈哈")
+        elif kind == 5:
+            lines.append(f"{ts} [关键词] 我才收回脚")
+            lines.append("引用  的消息 : 猛的把他一扯，疯狂给我道歉")
+        elif kind in (6, 7):
+            lines.append(f"{ts} [自己] 好嘞，第{i}条")
+        elif kind == 8:
+            lines.append("")
+            lines.append(f"{ts} [AI回复]")
+            lines.append("哈哈，原来是在搞定位啊，怪不得这么麻烦 😊")
+        else:
+            lines.append(f"{ts} [系统] 已自动发送AI回复: 哈哈，原来是在搞定位啊")
+    return lines
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, (time.perf_counter() - start) * 1e3
+
+
+def main(target_mb=8):
+    with tempfile.TemporaryDirectory() as workdir:
+        log_file = os.path.join(workdir, "chat_log.txt")
+        written, index = 0, 0
+        with open(log_file, 'w', encoding='utf-8') as f:
+            f.write("===== 微信聊天记录 - 开始时间: 2025-05-02 20:06:16 =====\n\n")
+            while written < target_mb * 1024 * 1024:
+                block = "\n".join(synthetic_lines(1000, index)) + "\n"
+                f.write(block)
+                written += len(block.encode('utf-8'))
+                index += 1000
+        size_mb = os.path.getsize(log_file) / 1024 / 1024
+
+        legacy, legacy_ms = timed(legacy_parse, log_file)
+        parser = ChatLogParser(log_file)
+        parsed, full_ms = timed(parser.parse)
+        full_count = len(parsed)
+
+        # 追加少量新消息后再次解析
+        with open(log_file, 'a', encoding='utf-8') as f:
+            f.write("\n".join(synthetic_lines(20, index)) + "\n")
+        legacy_again, legacy_again_ms = timed(legacy_parse, log_file)
+        parsed, incremental_ms = timed(parser.parse)
+
+        print(f"日志大小: {size_mb:.1f} MB")
+        print(f"旧实现全量解析:       {legacy_ms:8.1f} ms  ({len(legacy)} 条消息)")
+        print(f"增量解析器首次解析:   {full_ms:8.1f} ms  ({full_count} 条消息，续行已合并)")
+        print(f"追加20行后旧实现解析: {legacy_again_ms:8.1f} ms")
+        print(f"追加20行后增量解析:   {incremental_ms:8.3f} ms  (新增 {len(parsed) - full_count} 条消息)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""日志写入基准：比较在轮询线程中直接写入与后台批量写入线程（LogWriter）
+
+对每种配置记录N条消息（ChatLogger._add_message，写入主日志、会话日志和格式化消息），报告：
+    - 轮询线程中每条消息的耗时 p50/p99
+    - 写完全部内容（包括后台线程排空队列）的总耗时
+    - 后台写入的批数
+
+--disk-latency 为每次写入文件额外增加固定延迟，模拟较慢的磁盘。
+
+运行方式（在仓库根目录）：
+    python benchmarks/bench_log_writer.py
+    python benchmarks/bench_log_writer.py --messages 20000 --disk-latency 0.002
+"""
+import argparse
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chat_logger import ChatLogger
+from log_rotation import RotatingLog
+from message_store import MessageStore
+from wechat_driver import FakeWeChat
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    if not values:
+        return float('nan')
+    return values[min(len(values) - 1, max(0, int(round(pct / 100 * (len(values) - 1)))))]
+
+
+@contextlib.contextmanager
+def slow_disk(latency):
+    """为RotatingLog和MessageStore的每次写入增加延迟"""
+    if not latency:
+        yield
+        return
+    originals = {cls: cls.write_batch for cls in (RotatingLog, MessageStore)}
+
+    def make_slow(write_batch):
+        def slow_write_batch(self, text):
+            time.sleep(latency)
+            return write_batch(self, text)
+        return slow_write_batch
+
+    for cls, write_batch in originals.items():
+        cls.write_batch = make_slow(write_batch)
+    try:
+        yield
+    finally:
+        for cls, write_batch in originals.items():
+            cls.write_batch = write_batch
+
+
+def run(messages, disk_latency, **kwargs):
+    """返回 (每条消息耗时列表, 总耗时, 批数)"""
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as workdir, slow_disk(disk_latency):
+        os.chdir(workdir)
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                logger = ChatLogger(driver=FakeWeChat(sessions=['好友']), **kwargs)
+                logger.add_listen_chat('好友')
+                durations = []
+                started = time.perf_counter()
+                for i in range(messages):
+                    t0 = time.perf_counter()
+                    logger._add_message('好友', '好友', f"第{i}条消息，今天吃了什么呀哈哈哈", '好友')
+                    durations.append(time.perf_counter() - t0)
+                if logger.log_writer is not None:
+                    logger.log_writer.close()
+                total = time.perf_counter() - started
+        finally:
+            os.chdir(cwd)
+    return durations, total, logger.log_writer.batches if logger.log_writer else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="后台批量写入基准")
+    parser.add_argument('--messages', type=int, default=10000, help="消息数")
+    parser.add_argument('--disk-latency', type=float, default=0.0, help="每次写入文件额外的延迟(秒)")
+    args = parser.parse_args()
+
+    configs = [
+        ("轮询线程直接写入", dict(write_delay=None)),
+        ("后台批量写入", dict(write_delay=0.2)),
+        ("后台批量写入 + 每批fsync", dict(write_delay=0.2, fsync='batch')),
+    ]
+    print(f"{args.messages} 条消息，模拟磁盘延迟 {args.disk_latency * 1e3:.1f} ms/次写入")
+    for name, kwargs in configs:
+        durations, total, batches = run(args.messages, args.disk_latency, **kwargs)
+        print(f"\n[{name}]")
+        print(f"  轮询线程每条消息: p50 = {percentile(durations, 50) * 1e6:.0f} us, "
+              f"p99 = {percentile(durations, 99) * 1e6:.0f} us")
+        print(f"  全部写完: {total:.2f} 秒（{args.messages / total:.0f} 条/秒）"
+              + (f"，{batches} 批" if batches is not None else ""))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""消息记录的内存基准：比较 Message（__slots__ + 驻留的聊天名称）与旧的 [类型, 内容] 列表
+
+分别统计：
+    - 旧格式：[聊天名称, 内容] 列表，聊天名称每条消息一个字符串对象（从日志解析、
+      从JSON加载时的情况）
+    - 旧格式（共享名称）：同上，但聊天名称共用同一个字符串对象（轮询时的情况，也是列表格式最省内存的情况）
+    - Message：包含聊天、发送者、种类、单调时钟时间、内容和消息文件序号的消息记录
+    - Message + (序号, Message) 元组：把序号放在每条消息一个元组中（而不是记录的槽位中）的开销
+
+每条消息的内存占用不含消息内容本身（三种格式的内容字符串相同）。
+
+运行方式（在仓库根目录）：
+    python benchmarks/bench_message_record.py
+    python benchmarks/bench_message_record.py --messages 200000
+"""
+import argparse
+import gc
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from message_record import Message, MessageKind
+
+CHATS = [f"工作群{i}" for i in range(8)]
+
+
+def make_contents(n):
+    return [f"第{i}条消息，今天吃了什么呀哈哈哈" for i in range(n)]
+
+
+def measure(build):
+    """返回build()所创建对象占用的字节数"""
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = build()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del result
+    return after - before
+
+
+def legacy_lists(contents):
+    # ''.join 每次生成新的字符串对象，模拟从日志或JSON中解析出的聊天名称
+    return [[''.join(CHATS[i % len(CHATS)]), content] for i, content in enumerate(contents)]
+
+
+def legacy_lists_shared(contents):
+    return [[CHATS[i % len(CHATS)], content] for i, content in enumerate(contents)]
+
+
+def message_records(contents):
+    records = []
+    for i, content in enumerate(contents):
+        chat = ''.join(CHATS[i % len(CHATS)])
+        records.append(Message(MessageKind.FRIEND, content, chat, chat, seq=i + 1000))
+    return records
+
+
+def message_records_with_seq(contents):
+    records = []
+    for i, content in enumerate(contents):
+        chat = ''.join(CHATS[i % len(CHATS)])
+        records.append((i + 1000, Message(MessageKind.FRIEND, content, chat, chat)))
+    return records
+
+
+def main():
+    parser = argparse.ArgumentParser(description="消息记录内存基准")
+    parser.add_argument('--messages', type=int, default=100000, help="消息数")
+    args = parser.parse_args()
+
+    contents = make_contents(args.messages)
+    results = [
+        ("[类型, 内容] 列表", measure(lambda: legacy_lists(contents))),
+        ("[类型, 内容] 列表（共享名称）", measure(lambda: legacy_lists_shared(contents))),
+        ("Message（__slots__）", measure(lambda: message_records(contents))),
+        ("Message + (序号, Message) 元组", measure(lambda: message_records_with_seq(contents))),
+    ]
+
+    print(f"{args.messages} 条消息，每条消息的内存占用（不含内容字符串）:")
+    baseline, shared = results[0][1], results[1][1]
+    print(f"  {'':<24} {'':>13}  相对列表  相对共享名称的列表")
+    for name, size in results:
+        print(f"  {name:<24} {size / args.messages:7.1f} 字节/条  {size / baseline:6.0%}  {size / shared:10.0%}")
+    print(f"  注: Message 比共享名称的列表每条多 {(results[2][1] - shared) / args.messages:.0f} 字节（不是更省内存），"
+          f"换来所属聊天、种类、单调时钟时间戳和序号（旧格式没有这些信息）；"
+          f"序号放在槽位中比每条消息一个元组少 {(results[3][1] - results[2][1]) / args.messages:.0f} 字节")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""格式化消息存储的微基准：比较追加写入与旧的整表重写的单条消息成本
+
+运行方式（在仓库根目录）：
+    python benchmarks/bench_message_store.py
+"""
+import os
+import sys
+import time
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from message_store import MessageStore
+
+
+def make_message(i):
+    """生成一条模拟消息"""
+    return ['关键词', f"第{i}条消息，今天吃了什么呀哈哈哈"]
+
+
+def bench_append(n, workdir):
+    """追加写入 n 条消息，返回每条消息的平均耗时（微秒）"""
+    store = MessageStore(os.path.join(workdir, f"append_{n}.jsonl"))
+    store.reset()
+    message_list = []
+    start = time.perf_counter()
+    for i in range(n):
+        message_list.append(make_message(i))
+        store.append(message_list[-1])
+        store.maybe_snapshot(message_list)
+    elapsed = time.perf_counter() - start
+    store.close()
+    return elapsed / n * 1e6
+
+
+def bench_rewrite(n, workdir):
+    """旧实现：每条消息都重写完整列表，返回每条消息的平均耗时（微秒）"""
+    path = os.path.join(workdir, f"rewrite_{n}.txt")
+    message_list = []
+    start = time.perf_counter()
+    for i in range(n):
+        message_list.append(make_message(i))
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write("# 微信聊天记录（格式化）\n\n")
+            f.write(str(message_list))
+    elapsed = time.perf_counter() - start
+    return elapsed / n * 1e6
+
+
+def bench_load(n, workdir):
+    """快照 + 日志混合加载 n 条消息的耗时（毫秒）"""
+    store = MessageStore(os.path.join(workdir, f"load_{n}.jsonl"))
+    store.reset()
+    message_list = [make_message(i) for i in range(n)]
+    store.snapshot(message_list[: n // 2])
+    for msg in message_list[n // 2:]:
+        store.append(msg)
+    store.close()
+    start = time.perf_counter()
+    loaded = store.load()
+    elapsed = time.perf_counter() - start
+    assert loaded == message_list
+    return elapsed * 1e3
+
+
+def main():
+    with tempfile.TemporaryDirectory() as workdir:
+        print(f"{'消息数':>8} | {'追加写入 us/条':>14} | {'整表重写 us/条':>14} | {'加载 ms':>8}")
+        for n in (100, 1000, 10000, 100000):
+            append_us = bench_append(n, workdir)
+            # 整表重写是 O(n²)，超过 1 万条耗时过长，不再测量
+            rewrite_us = f"{bench_rewrite(n, workdir):14.1f}" if n <= 10000 else f"{'-':>14}"
+            load_ms = bench_load(n, workdir)
+            print(f"{n:>8} | {append_us:14.1f} | {rewrite_us} | {load_ms:8.1f}")
+
+
+if __name__ == "__main__":
+    main()
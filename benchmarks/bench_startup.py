@@ -0,0 +1,73 @@
+"""启动基准：批量添加监听（轮询等待界面就绪）与旧实现的固定等待时间比较
+
+模拟微信驱动为窗口切换、历史消息加载和搜索设置了界面延迟，
+旧实现每个聊天在切换窗口和加载历史后各等待1秒，不在会话列表中的聊天搜索后再等待1秒，
+这里按这些固定等待时间估算旧实现的启动耗时（不含界面操作本身）。
+
+运行方式（在仓库根目录）：
+    python benchmarks/bench_startup.py
+    python benchmarks/bench_startup.py --targets 50 --missing 10 --switch-delay 0.1 --load-delay 0.3
+"""
+import argparse
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chat_logger import ChatLogger
+from wechat_driver import FakeWeChat
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    if not values:
+        return float('nan')
+    return values[min(len(values) - 1, max(0, int(round(pct / 100 * (len(values) - 1)))))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="批量添加监听的启动基准")
+    parser.add_argument('--targets', type=int, default=50, help="监听的聊天数")
+    parser.add_argument('--missing', type=int, default=10, help="不在会话列表中、需要搜索的聊天数")
+    parser.add_argument('--history', type=int, default=40, help="每个聊天的历史消息数")
+    parser.add_argument('--switch-delay', type=float, default=0.05, help="窗口切换耗时(秒)")
+    parser.add_argument('--load-delay', type=float, default=0.1, help="加载更多历史消息耗时(秒)")
+    parser.add_argument('--search-delay', type=float, default=0.3, help="搜索后出现在会话列表中的耗时(秒)")
+    args = parser.parse_args()
+
+    targets = [f"聊天{i}" for i in range(args.targets)]
+    history = {name: [('friend', f"{name}的第{j}条消息") for j in range(args.history)] for name in targets}
+    driver = FakeWeChat(sessions=targets[args.missing:], history=history, switch_delay=args.switch_delay,
+                        load_delay=args.load_delay, search_delay=args.search_delay)
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir)
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                logger = ChatLogger(driver=driver)
+                started = time.perf_counter()
+                added = logger.add_listen_chats(targets)
+                total = time.perf_counter() - started
+                # 临时目录删除前写完后台队列中的日志
+                logger.log_writer.close()
+        finally:
+            os.chdir(cwd)
+
+    per_target = list(logger.listen_startup.values())
+    legacy_sleeps = 2.0 * args.targets + 1.0 * args.missing
+    print(f"{args.targets} 个聊天（{args.missing} 个需要搜索），每个聊天 {args.history} 条历史消息")
+    print(f"  界面延迟: 切换 {args.switch_delay * 1e3:.0f} ms, 加载 {args.load_delay * 1e3:.0f} ms, "
+          f"搜索 {args.search_delay * 1e3:.0f} ms")
+    print(f"  成功添加: {len(added)}/{args.targets}")
+    print(f"  总耗时: {total:.2f} 秒")
+    print(f"  每个聊天: p50 = {percentile(per_target, 50) * 1e3:.0f} ms, p99 = {percentile(per_target, 99) * 1e3:.0f} ms")
+    print(f"  旧实现的固定等待: {legacy_sleeps:.0f} 秒（{args.targets} x 2秒 + {args.missing} x 1秒，不含界面操作）")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""触发规则基准：每条朋友消息判断是否需要回复的耗时，以及各类消息被过滤的比例
+
+分别测试默认规则（跳过表情、媒体、撤回和引用）与群聊规则（另加@检测、
+50个触发关键词和忽略正则，合并编译为一个正则）。计时前先用CASES检查默认规则的判断结果，
+有不符合预期的消息时列出并退出。
+
+运行方式（在仓库根目录）：
+    python benchmarks/bench_trigger_rules.py
+    python benchmarks/bench_trigger_rules.py --messages 500000
+"""
+import argparse
+import os
+import sys
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from trigger_rules import DEFAULT_TRIGGER_RULES, TriggerRules
+
+SAMPLES = [
+    "今天晚上一起吃饭吗？", "[调皮]", "[呲牙][呲牙]", "😂😂😂", "[图片]", "[语音]5秒,未播放", "[动画表情]",
+    "对方撤回了一条消息", "「小明：明天几点开会」\n- - - - - - - - - - - - - - -\n", "好的\n引用 小明 的消息 : 明天几点开会",
+    "@小助手 帮我查一下明天的天气", "哈哈哈哈哈哈", "这个周末有什么安排吗，要不要去爬山", "收到", "点击链接领取优惠券",
+]
+
+
+# 默认规则下每条消息预期的判断结果（None表示需要回复）
+CASES = [
+    ("今天晚上一起吃饭吗？", None),
+    ("[调皮]", 'emoji'),
+    ("[呲牙][呲牙]", 'emoji'),
+    ("😂😂😂", 'emoji'),
+    ("👍🏻", 'emoji'),
+    ("[微笑]！", 'emoji'),
+    ("哈哈[微笑]", None),
+    ("？", None),  # 只有标点不是表情，单独的问号是在提问
+    ("...", None),
+    ("!!", None),
+    ("[OK]", None),  # 不认识的方括号内容不当作表情
+    ("[图片]", 'media'),
+    ("[语音]5秒,未播放", 'media'),
+    ("对方撤回了一条消息", 'recall'),
+    ("「小明：明天几点开会」\n- - - - - - - - - - - - - - -\n", 'quote'),
+    ("引用 小明 的消息 : 明天几点开会", 'quote'),
+    ("引用  的消息 : 你好", 'quote'),  # 昵称为空的引用
+    ("好的\n引用 小明 的消息 : 明天几点开会", None),
+    ("好的\n引用  的消息 : 你好", None),
+]
+
+
+def check(rules, cases):
+    """返回判断结果与预期不符的 [(消息, 预期, 实际)]"""
+    return [(content, expected, rules.filter_reason(content)) for content, expected in cases
+            if rules.filter_reason(content) != expected]
+
+
+def bench(rules, messages, repeat):
+    reasons = Counter()
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for content in messages:
+            reasons[rules.filter_reason(content)] += 1
+    elapsed = time.perf_counter() - started
+    return elapsed / (repeat * len(messages)), reasons
+
+
+def main():
+    parser = argparse.ArgumentParser(description="触发规则基准")
+    parser.add_argument('--messages', type=int, default=150000, help="判断的消息总数")
+    args = parser.parse_args()
+
+    failures = check(DEFAULT_TRIGGER_RULES, CASES)
+    for content, expected, actual in failures:
+        print(f"判断错误: {content!r} 预期 {expected}，实际 {actual}")
+    if failures:
+        sys.exit(1)
+    print(f"默认规则的 {len(CASES)} 条预期判断全部正确")
+
+    group_rules = TriggerRules(keywords=[f"关键词{i}" for i in range(48)] + ["天气", "安排"],
+                               ignore_patterns=[r"领取.*优惠", r"^收到$"], mention_names=["小助手"])
+    repeat = max(1, args.messages // len(SAMPLES))
+    for name, rules in [("默认规则", DEFAULT_TRIGGER_RULES), ("群聊规则（@、50个关键词、忽略规则）", group_rules)]:
+        per_message, reasons = bench(rules, SAMPLES, repeat)
+        total = sum(reasons.values())
+        print(f"[{name}] 每条消息 {per_message * 1e6:.2f} us")
+        print("  " + ", ".join(f"{reason or '需要回复'}={count / total:.0%}" for reason, count in reasons.most_common()))
+
+
+if __name__ == "__main__":
+    main()
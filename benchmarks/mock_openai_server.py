@@ -0,0 +1,187 @@
+"""本地模拟的 OpenAI 兼容接口，用于基准测试（不需要网络和API密钥）
+
+支持：
+    GET  /v1/models
+    POST /v1/chat/completions  （stream=True 时以 SSE 分块返回）
+
+服务端使用 HTTP/1.1 长连接，并统计收到的连接数和请求数。
+可以按比例注入故障：返回429（限流）或在第一个分块前卡住，用于测试重试、超时和对冲请求。
+"""
+import json
+import random
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True  # 流式小分块立即发出，避免延迟确认带来的额外等待
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def log_message(self, format, *args):
+        pass  # 基准测试时不打印访问日志
+
+    def _send_json(self, status, payload, headers=None):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _write_chunk(self, data):
+        self.wfile.write(f"{len(data):x}\r\n".encode('ascii') + data + b"\r\n")
+        self.wfile.flush()
+
+    def do_GET(self):
+        with self.server.lock:
+            self.server.requests += 1
+        if self.path.rstrip('/').endswith('/models'):
+            self._send_json(200, {"object": "list", "data": [{"id": "qwen-turbo", "object": "model", "owned_by": "mock"}]})
+        else:
+            self._send_json(404, {"error": {"message": "not found"}})
+
+    def do_POST(self):
+        with self.server.lock:
+            self.server.requests += 1
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        if not self.path.rstrip('/').endswith('/chat/completions'):
+            self._send_json(404, {"error": {"message": "not found"}})
+            return
+
+        server = self.server
+        with server.lock:
+            fault = server.random.random()
+            reject = fault < server.error_rate
+            stall = not reject and fault < server.error_rate + server.stall_rate
+            server.rejected += reject
+            server.stalled += stall
+        if reject:
+            headers = {"Retry-After": str(server.retry_after)} if server.retry_after is not None else None
+            self._send_json(429, {"error": {"message": "rate limited (mock)", "type": "rate_limit_error"}}, headers)
+            return
+        try:
+            self._complete(request, stall)
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # 客户端已放弃该请求（超时或对冲请求胜出）
+
+    def _complete(self, request, stall):
+        server = self.server
+        if server.first_token_delay:
+            time.sleep(server.first_token_delay)
+        if stall:
+            time.sleep(server.stall_seconds)
+
+        created = int(time.time())
+        model = request.get("model", "qwen-turbo")
+        if not request.get("stream"):
+            self._send_json(200, {
+                "id": "chatcmpl-mock", "object": "chat.completion", "created": created, "model": model,
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": "".join(server.reply_chunks)}}],
+            })
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for piece in server.reply_chunks:
+            chunk = {
+                "id": "chatcmpl-mock", "object": "chat.completion.chunk", "created": created, "model": model,
+                "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}],
+            }
+            self._write_chunk(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode('utf-8'))
+            if server.chunk_delay:
+                time.sleep(server.chunk_delay)
+        self._write_chunk(b"data: [DONE]\n\n")
+        self._write_chunk(b"")
+
+
+class MockOpenAIServer:
+    """在后台线程中运行的模拟服务器
+
+    Args:
+        reply: 回复内容
+        chunk_size: 流式返回时每个分块的字符数
+        first_token_delay: 返回第一个分块前的等待时间(秒)
+        chunk_delay: 每个分块之间的等待时间(秒)
+        error_rate: 返回429的请求比例
+        stall_rate: 在第一个分块前卡住stall_seconds秒的请求比例
+        stall_seconds: 卡住的时间(秒)
+        retry_after: 429响应中的Retry-After头(秒)，None表示不返回
+        seed: 故障注入的随机数种子
+    """
+
+    def __init__(self, reply="哈哈，好呀。我也想去看看！", chunk_size=4, first_token_delay=0.0, chunk_delay=0.0,
+                 error_rate=0.0, stall_rate=0.0, stall_seconds=10.0, retry_after=None, seed=None):
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+        self.httpd.daemon_threads = True
+        self.httpd.lock = threading.Lock()
+        self.httpd.connections = 0
+        self.httpd.requests = 0
+        self.httpd.reply_chunks = [reply[i:i + chunk_size] for i in range(0, len(reply), chunk_size)]
+        self.httpd.first_token_delay = first_token_delay
+        self.httpd.chunk_delay = chunk_delay
+        self.httpd.error_rate = error_rate
+        self.httpd.stall_rate = stall_rate
+        self.httpd.stall_seconds = stall_seconds
+        self.httpd.retry_after = retry_after
+        self.httpd.random = random.Random(seed)
+        self.httpd.rejected = 0  # 返回429的请求数
+        self.httpd.stalled = 0  # 卡住的请求数
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    @property
+    def connections(self):
+        return self.httpd.connections
+
+    @property
+    def requests(self):
+        return self.httpd.requests
+
+    @property
+    def rejected(self):
+        return self.httpd.rejected
+
+    @property
+    def stalled(self):
+        return self.httpd.stalled
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+if __name__ == "__main__":
+    with MockOpenAIServer() as server:
+        print(f"模拟服务器已启动: {server.base_url}  (Ctrl+C 退出)")
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,143 @@
+import os
+import re
+
+from log_rotation import read_segments
+from message_record import Message, MessageKind
+
+# 日志消息行：[记录时间] [类型或聊天名称] 内容
+LINE_PATTERN = re.compile(r'\[(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2})\] \[([^\]]+)\](?: (.*))?$')
+
+# 日志中不属于任何消息的结构性文本行
+STRUCTURAL_PREFIXES = ('===== ', '--- ', '开始记录 - ', '结束记录 - ', '监听的聊天: ')
+
+
+class ChatLogParser:
+    """聊天日志的增量解析器
+
+    记录上次解析到的字节位置，每次只解析新追加的内容；
+    每行只匹配一个预编译的正则表达式，紧跟在消息后的续行（如引用消息）
+    会合并到上一条消息的内容中。解析出的消息直接创建为消息记录（Message），之后不需要再转换。
+    默认只解析活动日志文件；history_segments大于0时，先解析最近几个已轮转的压缩分段。
+    """
+
+    def __init__(self, log_file, history_segments=0):
+        """
+        Args:
+            log_file: 聊天日志文件路径
+            history_segments: 额外解析的最近压缩分段数
+        """
+        self.log_file = log_file
+        self.history_segments = history_segments
+        self._segments_loaded = False
+        self.offset = 0  # 已解析到的字节位置（总是位于行首）
+        self.messages = []  # 已解析的消息记录（Message）列表
+        self._last_message = None  # 可以接收续行的上一条消息
+        self._in_ai_reply = False  # 是否处于 [AI回复] 段落中
+
+    def reset(self):
+        """清空解析状态，从文件开头重新解析"""
+        self.offset = 0
+        self.messages = []
+        self._last_message = None
+        self._in_ai_reply = False
+        self._segments_loaded = False
+
+    def seek_tail(self, max_bytes=65536):
+        """跳到文件末尾max_bytes字节内的第一个行首，之后只解析文件末尾的部分
+
+        用于重启时只读取日志最近的消息，读取量与日志总长度无关。
+        """
+        self.reset()
+        if not os.path.exists(self.log_file):
+            return
+        size = os.path.getsize(self.log_file)
+        if size <= max_bytes:
+            return
+        with open(self.log_file, 'rb') as f:
+            f.seek(size - max_bytes)
+            data = f.read(max_bytes)
+        newline = data.find(b'\n')
+        self.offset = size if newline < 0 else size - max_bytes + newline + 1
+
+    def parse(self):
+        """解析日志文件中新追加的内容
+
+        Returns:
+            list: 截至目前解析出的全部消息
+        """
+        if not os.path.exists(self.log_file):
+            self.reset()
+            return self.messages
+
+        # 文件被截断、重新创建或轮转时从头解析
+        if os.path.getsize(self.log_file) < self.offset:
+            self.reset()
+
+        if self.history_segments and not self._segments_loaded:
+            self._segments_loaded = True
+            for text in read_segments(self.log_file, self.history_segments):
+                self.feed(text)
+
+        with open(self.log_file, 'rb') as f:
+            f.seek(self.offset)
+            data = f.read()
+
+        # 只处理完整的行，末尾未写完的半行留到下次解析
+        end = data.rfind(b'\n')
+        if end < 0:
+            return self.messages
+        self.offset += end + 1
+
+        for line in data[:end].decode('utf-8', errors='replace').split('\n'):
+            self._parse_line(line.strip())
+        return self.messages
+
+    def feed(self, text):
+        """解析一段完整的日志文本（如压缩分段的内容），不改变文件中已解析到的位置
+
+        Returns:
+            list: 截至目前解析出的全部消息
+        """
+        for line in text.split('\n'):
+            self._parse_line(line.strip())
+        self._parse_line('')
+        return self.messages
+
+    def _parse_line(self, line):
+        """解析一行日志"""
+        if not line:
+            # 空行之后的文本不再视为续行
+            self._last_message = None
+            self._in_ai_reply = False
+            return
+
+        match = LINE_PATTERN.match(line)
+        if match is None:
+            if self._in_ai_reply or line.startswith(STRUCTURAL_PREFIXES):
+                # AI回复正文会以"自己"发送的消息再次出现，不重复记录
+                return
+            if self._last_message is not None:
+                self._last_message.content += '\n' + line
+            return
+
+        kind, content = match.group(2), match.group(3)
+        self._last_message = None
+        self._in_ai_reply = kind == 'AI回复'
+        if not content:
+            return
+
+        if kind == '时间':
+            msg = Message(MessageKind.TIME, content)
+        elif kind == '自己':
+            msg = Message(MessageKind.SELF, content)
+        elif kind == '系统':
+            if content.startswith('错误:'):  # 忽略错误消息
+                return
+            msg = Message(MessageKind.SYS, content)
+        elif kind == 'AI回复':
+            return
+        else:
+            msg = Message(MessageKind.FRIEND, content, kind)
+
+        self.messages.append(msg)
+        self._last_message = msg
@@ -1,35 +1,174 @@
-from wxauto import WeChat
 import time
 from datetime import datetime
 import os
 import re
 import sys
 import json
+import threading
+import heapq
+from collections import deque
+
+from chat_session import ChatSession
+from history_db import HistoryDB
+from history_index import DEFAULT_INDEX_SIZE
+from history_sync import FINGERPRINT_HISTORY
+from log_rotation import DEFAULT_MAX_BYTES, RotatingLog
+from log_writer import FSYNC_NEVER, LogWriter
+from message_record import KIND_BY_TYPE, Message, MessageKind
+from message_store import MessageStore
+from metrics import metrics
+from reply_worker import ReplyWorker
+from scheduler import AdaptivePoller, Backoff, DeadlineScheduler, wait_until
+from sentence_stream import SentenceSplitter, strip_speaker_prefix
+from startup_profile import StartupProfile
+from trigger_rules import DEFAULT_TRIGGER_RULES
+from wechat_driver import WeChatDriver, WxautoDriver
+
+# 日志行中的时间戳 [YYYY-MM-DD HH:MM:SS]
+TIMESTAMP_PATTERN = re.compile(r'\[(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2})\]')
 
 class ChatLogger:
     """聊天日志记录器：将微信消息记录到文本文件中"""
     
-    def __init__(self, log_file="chat_log.txt", format_file="chat_messages.txt"):
+    def __init__(self, log_file="chat_log.txt", format_file="chat_messages.jsonl", snapshot_every=0, context_size=100,
+                 log_dir="chat_logs", max_workers=4, history_db=None, token_budget=1500, reply_delay=10,
+                 driver=None, ai_base_url=None, metrics_port=None, metrics_file=None,
+                 stream_sentences=False, sentence_interval=1.0, max_sends_per_reply=5, resume=True,
+                 message_retention=1000, log_max_bytes=DEFAULT_MAX_BYTES, log_max_age=None, speculative=False,
+                 ready_timeout=5.0, history_settle=0.5, write_delay=0.2, write_batch_bytes=64 * 1024,
+                 fsync=FSYNC_NEVER, trigger_rules=DEFAULT_TRIGGER_RULES, chat_rules=None,
+                 retrieval_k=3, index_size=DEFAULT_INDEX_SIZE, preload_chats=(), parallel_startup=True,
+                 profile_startup=False):
         """初始化聊天日志记录器
         
         Args:
-            log_file: 日志文件名（详细日志）
-            format_file: 格式化消息文件名（仅包含格式化的消息列表）
+            log_file: 日志文件名（详细日志，记录不属于具体聊天的系统信息）
+            format_file: 格式化消息文件名（JSON Lines，每行一条消息）
+            snapshot_every: 每记录多少条消息压缩生成一次快照，0 表示追加日志中的记录超过内存保留的消息数时生成
+            context_size: 每个聊天的AI上下文中最多保留的消息数量
+            log_dir: 每个聊天的日志分段所在目录
+            max_workers: 同时生成AI回复的最大聊天数
+            history_db: 可选的SQLite历史数据库文件路径（或HistoryDB实例），
+                提供时消息同时写入数据库，AI上下文从数据库读取，历史在重启后保留
+            token_budget: 每个聊天AI上下文的token预算，超出时较早的消息折叠为摘要
+            reply_delay: 朋友消息后多少秒内没有新消息则自动回复
+            driver: 微信驱动（WeChatDriver）或创建驱动的函数，默认使用wxauto连接真实微信
+            ai_base_url: AI接口地址（OpenAI兼容），默认使用AI.py中的配置
+            metrics_port: 提供时开启指标收集，并在该端口提供Prometheus格式的 /metrics 接口
+            metrics_file: 提供时开启指标收集，并定期将指标写入该JSON文件
+            stream_sentences: 是否逐句发送AI回复（生成出第一句就发送，不等待整段回复）
+            sentence_interval: 逐句发送时同一聊天两次发送之间的最短间隔(秒)
+            max_sends_per_reply: 逐句发送时每条回复最多拆成几次发送，超出的句子合并到最后一次
+            resume: 为True时保留上次运行的日志和消息记录并在其后继续记录，
+                加载微信历史消息时只写入尚未记录的部分；为False时清空后重新开始
+            message_retention: 每个聊天在内存中保留的最近消息数（更早的消息只保存在日志和数据库中）
+            log_max_bytes: 日志文件（详细日志和每个聊天的日志）超过多少字节时轮转为gzip压缩分段
+            log_max_age: 日志文件写入超过多少秒后轮转，None表示不按时间轮转
+            speculative: 是否预生成回复：朋友消息一到就开始生成，期间有新消息则丢弃重新生成，
+                回复截止时间到达时直接发送已生成的回复（以额外的AI调用换取更低的回复延迟）
+            ready_timeout: 添加监听时等待搜索结果、窗口切换和历史消息加载的最长时间(秒)
+            history_settle: 加载更多历史消息后消息数一直没有增加（没有更多历史）时，等待多少秒视为加载完成
+            write_delay: 日志和格式化消息由后台线程批量写入，一批最多等待多少秒后提交；
+                None表示不使用后台线程，在轮询线程中直接写入
+            write_batch_bytes: 后台写入时一批累积到多少字符立即提交
+            fsync: 后台写入的磁盘同步策略：'never'（只刷新到系统缓存）、'batch'（每批fsync）
+                或 'interval'（每秒最多fsync一次）
+            trigger_rules: 自动回复的触发规则（TriggerRules），默认跳过只有表情、媒体、撤回提示和引用内容的消息；
+                None表示每条朋友消息都需要回复
+            chat_rules: 单独指定某些聊天的触发规则 {聊天名称: TriggerRules}，例如群聊只回复@自己的消息
+            retrieval_k: 回复时从每个聊天的历史索引中检索多少条与对方最新消息相关的较早消息，0表示不检索
+            index_size: 每个聊天的历史索引最多保留的消息数，0表示不建立索引
+            preload_chats: 启动时预先恢复会话（读取日志末尾或数据库中的历史）的聊天名称，通常为要监听的聊天
+            parallel_startup: 是否在连接微信的同时，在后台导入并预热AI客户端、读取已有的消息记录和预先恢复会话；
+                False时按顺序执行
+            profile_startup: 是否记录启动各阶段导入的模块，并在开始记录时输出启动耗时明细
         """
+        self.startup = StartupProfile(profile_startup)  # 启动各阶段的耗时
         self.log_file = log_file
         self.format_file = format_file
+        self.log_writer = None  # 后台批量写入线程
+        if write_delay is not None:
+            self.log_writer = LogWriter(write_batch_bytes, write_delay, fsync)
+        self.message_store = MessageStore(format_file, snapshot_every=snapshot_every, writer=self.log_writer)
+        self.snapshot_every = snapshot_every
         self.listen_list = []
         self.last_message_time = None
-        self.message_list = []  # 存储所有消息的列表
-        self.current_chat = None  # 保存当前活跃的聊天对象
+        self.message_retention = message_retention
+        self.recent_messages = {}  # 每个聊天内存中保留的最近消息 {聊天名称: deque[Message]}，系统消息的聊天名称为''
+        self.total_messages = 0  # 本次运行记录的消息总数
+        self.log_max_bytes = log_max_bytes
+        self.log_max_age = log_max_age
+        self.ready_timeout = ready_timeout
+        self.history_settle = history_settle
+        self.listen_startup = {}  # 每个聊天添加监听的耗时 {聊天名称: 秒}
+        self.main_log = RotatingLog(log_file, log_max_bytes, log_max_age, header="===== 微信聊天记录（续） =====\n\n",
+                                    writer=self.log_writer)
+        self.context_size = context_size
+        self.token_budget = token_budget
+        self.log_dir = log_dir
+        self.max_workers = max_workers
+        self.sessions = {}  # 每个聊天的会话 {聊天名称: ChatSession}
+        if isinstance(history_db, str):
+            history_db = HistoryDB(history_db)
+        self.history_db = history_db
+        self.chat_ai = None  # 进程内复用的AI处理器（在后台创建）
+        self._chat_ai_class = None  # 在后台导入的AI.ChatAI
+        self._ai_error = None  # 导入AI模块时的错误
+        self._ai_ready = threading.Event()  # AI模块导入完成（或失败）
+        self._background = []  # 启动时的后台线程
+        self._startup_error = None  # 后台读取消息记录时的错误，等待后台任务时重新抛出
+        self._session_list = None  # 连接微信时获取的会话列表，第一次添加监听时直接使用
+        self.skipped_checks = 0  # 因没有未回复的朋友消息而跳过的空闲检查次数
+        self.trigger_rules = trigger_rules
+        self.chat_rules = dict(chat_rules or {})
+        self.suppressed_replies = 0  # 被触发规则跳过的AI调用次数
+        self.retrieval_k = retrieval_k
+        self.index_size = index_size
+        self.reply_delay = reply_delay
+        self.scheduler = DeadlineScheduler()  # 每个聊天的回复截止时间
+        self.ai_base_url = ai_base_url
+        self._stop_event = threading.Event()  # 设置后start_logging结束记录
+        self.metrics_file = metrics_file
+        self.resume = resume
+        self.stream_sentences = stream_sentences
+        self.sentence_interval = sentence_interval
+        self.max_sends_per_reply = max(1, max_sends_per_reply)
+        self.streaming_jobs = {}  # 正在逐句发送的回复 {聊天名称: ReplyJob}
+        self._next_send_time = {}  # 每个聊天下一次允许发送的时间 {聊天名称: 单调时钟时间}
+        self.speculative = speculative
+        self.speculative_jobs = {}  # 预生成、尚未到截止时间的回复 {聊天名称: ReplyJob}
+        self._to_speculate = set()  # 等待开始预生成的聊天名称
+        self.speculative_hits = 0  # 截止时间到达时直接使用了预生成结果的次数
+        self.speculative_wasted = 0  # 因新消息等原因被丢弃的预生成次数
+        if metrics_port:
+            metrics.start_http_server(metrics_port)
+        if metrics_file:
+            metrics.start_json_flush(metrics_file)
         
-        # 检查并初始化微信
+        # 读取已有的消息记录、导入openai并创建AI客户端都不依赖微信，与连接微信并行
+        self.reply_worker = ReplyWorker(self.max_workers)  # 后台生成AI回复的工作线程池
+        startup_tasks = [('prepare_ai', self._prepare_ai),
+                         ('restore_history', lambda: self._restore_history(preload_chats))]
+        if parallel_startup:
+            self._background = [self.startup.start_thread(name, task) for name, task in startup_tasks]
+            self._connect_wechat(driver)
+        else:
+            self._connect_wechat(driver)
+            for name, task in startup_tasks:
+                with self.startup.phase(name):
+                    task()
+            self._raise_startup_error()
+        
+    def _connect_wechat(self, driver):
+        """连接微信并获取一次会话列表（测试连接是否成功），失败时退出程序"""
         try:
             print("正在连接微信，请确保微信已经打开并处于前台...")
-            self.wx = WeChat()
-            # 尝试获取微信窗口信息，测试连接是否成功
-            wx_title = self.wx.GetSessionList()
-            print(f"微信连接成功！找到 {len(wx_title) if wx_title else 0} 个会话")
+            with self.startup.phase('connect_wechat'):
+                # 默认的wxauto驱动在创建时才导入wxauto
+                self.wx = driver if isinstance(driver, WeChatDriver) else (driver or WxautoDriver)()
+            with self.startup.phase('session_list'):
+                self._session_list = self.wx.GetSessionList()
+            print(f"微信连接成功！找到 {len(self._session_list) if self._session_list else 0} 个会话")
         except Exception as e:
             print(f"连接微信失败: {str(e)}")
             print("请确保：")
@@ -37,67 +176,224 @@ class ChatLogger:
             print("2. 微信窗口处于可见状态（不在其他窗口下方）")
             print("3. 您当前的微信版本与wxauto库兼容")
             sys.exit(1)
-            
-        self._init_log_file()
+        
+    def _prepare_ai(self):
+        """导入AI模块（openai、httpx），创建复用的AI处理器，并在后台预热连接"""
+        try:
+            with self.startup.phase('import_ai'):
+                from AI import ChatAI
+            self._chat_ai_class = ChatAI
+        except Exception as e:
+            self._ai_error = e
+            print(f"导入AI模块失败: {str(e)}，只记录聊天消息，不自动回复")
+            return
+        finally:
+            self._ai_ready.set()
+        with self.startup.phase('create_ai_client'):
+            self.chat_ai = self._create_chat_ai(self.log_file, log=self.main_log)
+        self.startup.start_thread('ai_warm_up', self.chat_ai.warm_up)
+        
+    def _restore_history(self, chats=()):
+        """初始化日志文件并读取已有的消息记录，预先恢复chats中各聊天的会话"""
+        try:
+            with self.startup.phase('init_log_file'):
+                self._init_log_file()
+            for chat_name in chats:
+                with self.startup.phase(f'restore:{chat_name}'):
+                    self._get_session(chat_name)
+        except Exception as e:
+            self._startup_error = e
+        
+    def _wait_for_startup(self):
+        """等待启动时的后台任务（读取消息记录、恢复会话、创建AI客户端）完成，AI连接预热不等待"""
+        if self._background:
+            with self.startup.phase('wait_background'):
+                for thread in self._background:
+                    thread.join()
+            self._background = []
+        self._raise_startup_error()
+        
+    def _raise_startup_error(self):
+        if self._startup_error is not None:
+            error, self._startup_error = self._startup_error, None
+            raise error
+        
+    def _create_chat_ai(self, log_file, chat_name=None, log=None, index=None):
+        """创建AI处理器（所有实例共享同一个客户端和连接池），AI模块仍在后台导入时等待其完成
+        
+        Returns:
+            ChatAI: AI处理器，AI模块导入失败时返回None（会话照常记录消息，但不自动回复）
+        """
+        if not self._ai_ready.is_set():
+            with self.startup.phase('wait_import_ai'):
+                self._ai_ready.wait()
+        if self._chat_ai_class is None:
+            return None
+        kwargs = {'history_db': self.history_db, 'chat_name': chat_name, 'log': log,
+                  'index': index, 'retrieval_k': self.retrieval_k, 'token_budget': self.token_budget}
+        if self.ai_base_url:
+            kwargs['base_url'] = self.ai_base_url
+        return self._chat_ai_class(log_file, **kwargs)
         
     def _init_log_file(self):
-        """初始化日志文件"""
-        with open(self.log_file, 'w', encoding='utf-8') as f:
+        """初始化日志文件，resume为True时在已有记录之后继续记录"""
+        resume = self.resume and os.path.exists(self.log_file)
+        with open(self.log_file, 'a' if resume else 'w', encoding='utf-8') as f:
             f.write(f"===== 微信聊天记录 - 开始时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} =====\n\n")
         
         # 初始化格式化消息文件
-        with open(self.format_file, 'w', encoding='utf-8') as f:
-            f.write("# 微信聊天记录（格式化）\n\n")
-            
-        print(f"已创建聊天日志文件: {self.log_file}")
-        print(f"已创建格式化消息文件: {self.format_file}")
+        if resume:
+            self.recent_messages = {}
+            for seq, msg in enumerate(self.message_store.load()):
+                self._retain(seq, Message.from_list(msg[:2], msg[2] if len(msg) > 2 else ''))
+            print(f"继续记录聊天日志文件: {self.log_file}")
+            print(f"继续记录格式化消息文件: {self.format_file}（已有 {self.message_store.count} 条消息）")
+        else:
+            self.message_store.reset()
+            print(f"已创建聊天日志文件: {self.log_file}")
+            print(f"已创建格式化消息文件: {self.format_file}")
         self.last_message_time = datetime.now()
+        self._update_snapshot_every()
+        
+    def _retain(self, seq, msg):
+        """在消息所属聊天的最近消息中保留一条消息（每个聊天最多message_retention条），seq为其在消息文件中的序号"""
+        recent = self.recent_messages.get(msg.chat)
+        if recent is None:
+            recent = self.recent_messages[msg.chat] = deque(maxlen=self.message_retention)
+            self._update_snapshot_every()
+        msg.seq = seq
+        recent.append(msg)
+        
+    def _retained_messages(self):
+        """所有聊天保留的最近消息，按记录顺序合并（用于压缩消息文件）"""
+        return list(heapq.merge(*list(self.recent_messages.values()), key=lambda msg: msg.seq))
+        
+    def _update_snapshot_every(self):
+        """未设置snapshot_every时，按保留的消息总数上限（每个聊天message_retention条）设置快照间隔
+        
+        追加日志中的记录数达到这个上限就用各聊天保留的最近消息生成快照，
+        使消息文件的大小同样有界。
+        """
+        if not self.snapshot_every:
+            self.message_store.snapshot_every = self.message_retention * max(len(self.recent_messages), 1)
+        
+    def _get_session(self, chat_name, chat=None):
+        """获取聊天会话，不存在时创建
+        
+        Args:
+            chat_name: 聊天名称
+            chat: wxauto的聊天对象，提供时更新会话的聊天对象
+            
+        Returns:
+            ChatSession: 聊天会话
+        """
+        session = self.sessions.get(chat_name)
+        if session is None:
+            session = ChatSession(chat_name, self.log_dir, self.context_size, token_budget=self.token_budget,
+                                  max_log_bytes=self.log_max_bytes, max_log_age=self.log_max_age,
+                                  writer=self.log_writer, rules=self.chat_rules.get(chat_name, self.trigger_rules),
+                                  index_size=self.index_size if self.retrieval_k else 0)
+            # 继续记录时先读取日志末尾（建立历史索引时读取到索引大小，包括已轮转的分段），之后再追加标题
+            index_size = session.index.max_documents if session.index is not None else 0
+            stored = session.read_log_tail(min_messages=index_size) if self.resume and self.history_db is None else []
+            session.init_log_file(f"===== {chat_name} 的聊天记录 - 开始时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} =====",
+                                  resume=self.resume)
+            session.chat_ai = self._create_chat_ai(session.log_file, chat_name, log=session.log, index=session.index)
+            if self.history_db is not None:
+                # 用数据库中保存的历史恢复上下文和历史索引
+                stored = self.history_db.last_messages(chat_name, max(FINGERPRINT_HISTORY, index_size))
+            session.restore(stored)
+            self.sessions[chat_name] = session
+        if chat is not None:
+            session.chat = chat
+        return session
         
     def _append_to_file(self, text):
-        """追加内容到日志文件"""
-        with open(self.log_file, 'a', encoding='utf-8') as f:
-            f.write(text + "\n")
+        """追加内容到日志文件（超过大小或时间限制时轮转）"""
+        self.main_log.write(text + "\n")
+            
+    def _update_formatted_messages(self, record):
+        """将一条消息追加到格式化消息文件并在所属聊天中保留，必要时生成快照"""
+        self._retain(self.message_store.append(record), record)
+        self._maybe_snapshot()
             
-    def _update_formatted_messages(self):
-        """更新格式化消息文件，写入完整的消息列表"""
-        with open(self.format_file, 'w', encoding='utf-8') as f:
-            f.write("# 微信聊天记录（格式化）\n\n")
-            f.write(str(self.message_list))
+    def _maybe_snapshot(self):
+        """追加日志的记录数达到快照间隔时，用各聊天保留的最近消息压缩消息文件"""
+        if self.message_store.snapshot_due():
+            self.message_store.snapshot(self._retained_messages())
+            
+    @staticmethod
+    def _format_log_line(msg, current_time):
+        """将消息格式化为一行日志
+        
+        Args:
+            msg: 消息记录（Message）
+            current_time: 记录时间文本
+        """
+        label = {MessageKind.TIME: '时间', MessageKind.SYS: '系统', MessageKind.SELF: '自己'}.get(msg.kind, msg.sender)
+        return f"[{current_time}] [{label}] {msg.content}"
             
-    def _add_message(self, msg_type, sender, content):
+    def _add_message(self, msg_type, sender, content, chat_name=None):
         """添加消息到消息列表并更新文件
         
         Args:
             msg_type: 消息类型 ('Time', 'Self', 'SYS' 或聊天名称)
             sender: 发送者
             content: 消息内容
+            chat_name: 消息所属的聊天名称，提供时写入该聊天的会话（上下文和日志分段）
         """
-        # 添加到消息列表
-        if msg_type == 'Time':
-            self.message_list.append(['Time', content])
-        elif msg_type == 'SYS':
-            self.message_list.append(['SYS', content])
-        elif msg_type == 'Self':
-            self.message_list.append(['Self', content])
-        else:
-            # 朋友消息，使用聊天名称
-            self.message_list.append([sender, content])
+        started = time.perf_counter()
+        
+        # 添加到消息列表（朋友消息以发送者区分）
+        kind = KIND_BY_TYPE.get(msg_type, MessageKind.FRIEND)
+        record = Message(kind, content, sender if kind == MessageKind.FRIEND else '', chat_name or '')
+        self.total_messages += 1
             
         # 更新格式化消息文件
-        self._update_formatted_messages()
+        self._update_formatted_messages(record)
         
         # 记录到详细日志
-        current_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        if msg_type == 'Time':
-            log_text = f"[{current_time}] [时间] {content}"
-        elif msg_type == 'SYS':
-            log_text = f"[{current_time}] [系统] {content}"
-        elif msg_type == 'Self':
-            log_text = f"[{current_time}] [自己] {content}"
+        now = datetime.now()
+        log_text = self._format_log_line(record, now.strftime('%Y-%m-%d %H:%M:%S'))
+        
+        # 属于具体聊天的消息写入该聊天的会话，同时更新其上下文和最后活动时间
+        if chat_name is not None:
+            session = self._get_session(chat_name)
+            session.add_message(record, now)
+            session.append_to_log(log_text)
+            if self.history_db is not None:
+                self.history_db.add(chat_name, record.type, content, now)
         else:
-            log_text = f"[{current_time}] [{sender}] {content}"
-            
-        self._append_to_file(log_text)
+            self._append_to_file(log_text)
+        
+        metrics.observe('add_message', time.perf_counter() - started)
+        
+    def _add_history_messages(self, chat_name, messages):
+        """批量添加一个聊天的历史消息：消息文件、会话日志和数据库各只写入一次
+        
+        Args:
+            chat_name: 聊天名称
+            messages: 消息记录（Message）列表
+        """
+        if not messages:
+            return
+        started = time.perf_counter()
+        now = datetime.now()
+        current_time = now.strftime('%Y-%m-%d %H:%M:%S')
+        session = self._get_session(chat_name)
+        
+        self.total_messages += len(messages)
+        first_seq = self.message_store.extend(messages)
+        for offset, msg in enumerate(messages):
+            self._retain(first_seq + offset, msg)
+        self._maybe_snapshot()
+        for msg in messages:
+            session.add_message(msg, now)
+        session.append_to_log("\n".join(self._format_log_line(msg, current_time) for msg in messages))
+        if self.history_db is not None:
+            self.history_db.add_many(chat_name, messages, now)
+        
+        metrics.observe('add_history', time.perf_counter() - started)
         
     def _load_history_messages(self, chat_name):
         """加载并保存聊天的历史消息
@@ -111,44 +407,40 @@ class ChatLogger:
         try:
             print(f"正在加载 '{chat_name}' 的历史消息...")
             
-            # 确保切换到正确的聊天窗口
+            # 切换到聊天窗口，轮询当前聊天直到切换完成
             self.wx.ChatWith(chat_name)
-            time.sleep(1)  # 等待窗口切换完成
-            
-            # 加载更多历史消息
-            self.wx.LoadMoreMessage()
-            time.sleep(1)  # 等待加载完成
+            if not wait_until(lambda: self._current_chat(chat_name) == chat_name, self.ready_timeout):
+                print(f"警告: 等待切换到 '{chat_name}' 的聊天窗口超时")
             
-            # 获取当前聊天窗口的所有消息
-            messages = self.wx.GetAllMessage()
+            # 加载更多历史消息并等待加载完成，获取当前聊天窗口的所有消息
+            messages = self._load_more_messages()
             
             if not messages:
                 print(f"未找到 '{chat_name}' 的历史消息")
                 return False
                 
-            print(f"成功加载 '{chat_name}' 的 {len(messages)} 条历史消息")
-            
-            # 记录历史消息到文件
-            self._append_to_file(f"\n--- {chat_name} 的历史消息 ---\n")
-            
-            # 处理历史消息
+            # 根据消息类型转换格式
+            history = []
             for msg in messages:
-                # 根据消息类型格式化
                 if msg.type == 'time':
-                    # 时间类型消息
-                    self._add_message('Time', '', msg.time)
-                    
+                    history.append(Message(MessageKind.TIME, msg.time, chat=chat_name))
                 elif msg.type == 'sys':
-                    # 系统消息
-                    self._add_message('SYS', '', msg.content)
-                    
+                    history.append(Message(MessageKind.SYS, msg.content, chat=chat_name))
                 elif msg.type == 'friend':
-                    # 朋友发送的消息
-                    self._add_message(chat_name, chat_name, msg.content)
-                    
+                    # 朋友发送的消息，发送者为聊天名称
+                    history.append(Message(MessageKind.FRIEND, msg.content, chat_name, chat_name))
                 elif msg.type == 'self':
-                    # 自己发送的消息
-                    self._add_message('Self', '自己', msg.content)
+                    history.append(Message(MessageKind.SELF, msg.content, chat=chat_name))
+            
+            # 与已记录的消息比对，只保存尚未记录的部分
+            session = self._get_session(chat_name)
+            new_messages = session.history.new_messages(history)
+            metrics.inc('history_deduplicated', len(history) - len(new_messages))
+            print(f"成功加载 '{chat_name}' 的 {len(messages)} 条历史消息，其中 {len(new_messages)} 条尚未记录")
+            
+            if new_messages:
+                session.append_to_log(f"\n--- {chat_name} 的历史消息 ---\n")
+                self._add_history_messages(chat_name, new_messages)
             
             return True
             
@@ -158,36 +450,108 @@ class ChatLogger:
             self._append_to_file(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] [系统] 错误: {error_msg}")
             return False
     
+    def _current_chat(self, default=None):
+        """当前打开的聊天窗口名称，驱动不支持查询时返回default（视为已切换完成）"""
+        if not getattr(self.wx, 'has_current_chat', False):
+            return default
+        return self.wx.CurrentChat()
+    
+    def _load_more_messages(self):
+        """加载更多历史消息，轮询直到加载完成，返回当前聊天窗口的所有消息
+        
+        消息数超过加载前的数量即视为加载完成；没有更多历史消息时消息数不会增加，
+        持续history_settle秒后同样视为完成。
+        """
+        before = len(self.wx.GetAllMessage() or [])
+        self.wx.LoadMoreMessage()
+        started = time.monotonic()
+        messages = []
+        
+        def loaded():
+            messages[:] = self.wx.GetAllMessage() or []
+            return len(messages) > before or time.monotonic() - started >= self.history_settle
+        
+        wait_until(loaded, self.ready_timeout)
+        return messages
+    
+    def add_listen_chats(self, targets):
+        """批量添加监听的聊天对象
+        
+        只获取一次会话列表，列表中没有的聊天全部发起搜索后，轮询会话列表直到都出现
+        （最多ready_timeout秒）；之后逐个加载历史消息并添加监听，最后输出每个聊天的启动耗时。
+        
+        Args:
+            targets: 好友或群聊的昵称列表
+            
+        Returns:
+            list: 成功添加的聊天名称
+        """
+        started = time.perf_counter()
+        targets = list(dict.fromkeys(targets))
+        try:
+            # 第一次添加时直接使用连接微信时获取的会话列表
+            session_list, self._session_list = self._session_list, None
+            if session_list is None:
+                session_list = self.wx.GetSessionList()
+            sessions = set(session_list or [])
+            missing = [who for who in targets if who not in sessions]
+            if missing:
+                print(f"警告: 未找到聊天对象 {', '.join(missing)}，尝试在微信中搜索...")
+                for who in missing:
+                    self.wx.Search(who)
+                
+                def all_found():
+                    sessions.update(self.wx.GetSessionList() or [])
+                    return all(who in sessions for who in missing)
+                
+                wait_until(all_found, self.ready_timeout)
+        except Exception as e:
+            print(f"获取会话列表时出错: {str(e)}")
+            self._append_to_file(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] [系统] 错误: 获取会话列表失败: {str(e)}")
+            return []
+        resolve_time = time.perf_counter() - started
+        self.startup.record('resolve_targets', started, started + resolve_time)
+        
+        # 查找聊天对象期间后台任务仍在进行，加载历史消息前等待它们完成
+        self._wait_for_startup()
+        added = []
+        for who in targets:
+            if who not in sessions:
+                print(f"无法找到聊天对象 '{who}'，跳过添加")
+                self._append_to_file(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] [系统] 警告: 未能添加聊天对象 '{who}'")
+                continue
+            target_started = time.perf_counter()
+            if self._add_listen_target(who):
+                added.append(who)
+            self.listen_startup[who] = time.perf_counter() - target_started
+            metrics.observe('listen_target_startup', self.listen_startup[who])
+        
+        total = time.perf_counter() - started
+        self.startup.record('add_listen_chats', started, started + total)
+        print(f"添加监听耗时: 共 {total:.2f} 秒，其中查找聊天对象 {resolve_time:.2f} 秒")
+        for who in targets:
+            if who in self.listen_startup:
+                print(f"  {who}: {self.listen_startup[who]:.2f} 秒")
+        return added
+    
     def add_listen_chat(self, who):
         """添加监听的聊天对象
         
         Args:
             who: 好友或群聊的昵称
         """
+        return who in self.add_listen_chats([who])
+    
+    def _add_listen_target(self, who):
+        """加载已在会话列表中的聊天的历史消息并添加监听"""
         try:
-            # 先检查会话是否存在
-            sessions = self.wx.GetSessionList()
-            if not sessions or who not in sessions:
-                print(f"警告: 未找到聊天对象 '{who}'，尝试在微信中搜索...")
-                # 尝试搜索并打开聊天
-                self.wx.Search(who)
-                time.sleep(1)
-                # 再次检查
-                sessions = self.wx.GetSessionList()
-                if not sessions or who not in sessions:
-                    print(f"无法找到聊天对象 '{who}'，跳过添加")
-                    self._append_to_file(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] [系统] 警告: 未能添加聊天对象 '{who}'")
-                    return False
-            
             # 先加载历史消息
             self._load_history_messages(who)
             
-            # 添加聊天监听
+            # 添加聊天监听，保存聊天对象用于发送回复
             chat = self.wx.AddListenChat(who=who)
+            self._get_session(who, chat)
             self.listen_list.append(who)
-            # 设置当前聊天对象，确保后续可以使用
-            if self.current_chat is None:
-                self.current_chat = chat
             print(f"已添加聊天监听: {who}")
             return True
         except Exception as e:
@@ -195,110 +559,335 @@ class ChatLogger:
             self._append_to_file(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] [系统] 错误: 添加聊天对象 '{who}' 失败: {str(e)}")
             return False
     
-    def _get_last_message_time(self):
-        """从日志文件中获取最后一条消息的时间戳
+    def _get_last_message_time(self, session):
+        """获取聊天最后一条消息的时间戳
+        
+        优先使用内存中记录的最后活动时间；重启后内存中没有记录时，
+        才从会话日志末尾向前分块读取查找。
         
+        Args:
+            session: 聊天会话
+            
         Returns:
             datetime: 最后一条消息的时间戳，如果没有找到则返回None
         """
-        if not os.path.exists(self.log_file):
+        if session.last_activity is not None:
+            return session.last_activity
+        session.log.flush()
+        return self._read_last_log_timestamp(session.log_file)
+    
+    def _read_last_log_timestamp(self, log_file=None, block_size=4096, max_bytes=65536):
+        """从日志文件末尾向前分块读取，查找最后一个时间戳
+        
+        Args:
+            log_file: 日志文件路径，默认为详细日志文件
+            block_size: 每次向前读取的字节数
+            max_bytes: 最多读取的字节数，超过后放弃查找
+            
+        Returns:
+            datetime: 最后一个时间戳，如果没有找到则返回None
+        """
+        log_file = log_file or self.log_file
+        if not os.path.exists(log_file):
             return None
             
         try:
-            # 读取文件最后几行来查找最后一条消息
-            with open(self.log_file, 'r', encoding='utf-8') as f:
-                lines = f.readlines()
-            
-            # 从后往前遍历，查找包含时间戳的行
-            for line in reversed(lines):
-                # 使用正则表达式匹配时间戳 [YYYY-MM-DD HH:MM:SS]
-                match = re.search(r'\[(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2})\]', line)
-                if match:
-                    time_str = match.group(1)
-                    return datetime.strptime(time_str, '%Y-%m-%d %H:%M:%S')
+            with open(log_file, 'rb') as f:
+                f.seek(0, os.SEEK_END)
+                position = f.tell()
+                data = b''
+                while position > 0 and len(data) < max_bytes:
+                    read_size = min(block_size, position)
+                    position -= read_size
+                    f.seek(position)
+                    data = f.read(read_size) + data
+                    
+                    # 块边界可能截断多字节字符，解码时忽略不完整的字节
+                    text = data.decode('utf-8', errors='ignore')
+                    matches = TIMESTAMP_PATTERN.findall(text)
+                    if matches:
+                        return datetime.strptime(matches[-1], '%Y-%m-%d %H:%M:%S')
             
             return None
         except Exception as e:
             print(f"获取最后消息时间时出错: {str(e)}")
             return None
     
-    def _check_time_gap(self, chat=None):
-        """检查最后一条消息与当前时间的差距，如果超过1分钟则提示
+    def _schedule_reply(self, session, now=None):
+        """根据聊天最后一条消息的时间设置回复截止时间
+        
+        Args:
+            session: 聊天会话
+            now: 当前的单调时钟时间，默认为time.monotonic()
+        """
+        now = time.monotonic() if now is None else now
+        delay = self.reply_delay
+        last_time = self._get_last_message_time(session)
+        if last_time is not None:
+            # 重启后恢复的会话按日志中的最后消息时间计算剩余等待时间
+            elapsed = (datetime.now() - last_time).total_seconds()
+            delay = min(max(self.reply_delay - elapsed, 0), self.reply_delay)
+        self.scheduler.schedule(session.name, now + delay)
+    
+    def _on_reply_deadline(self, session):
+        """聊天的回复截止时间已到（期间没有新消息），提交后台AI回复任务
         
         Args:
-            chat: 当前聊天对象，用于发送消息
+            session: 聊天会话
             
         Returns:
-            bool: 如果超过1分钟返回True，否则返回False
+            bool: 如果提交了回复任务返回True，否则返回False
         """
-        current_time = datetime.now()
-        last_time = self._get_last_message_time() or self.last_message_time
+        # 没有聊天对象（未添加监听）的会话无法发送消息，没有AI处理器（AI模块导入失败）时无法生成回复
+        if session.chat is None or session.chat_ai is None:
+            return False
         
-        # 如果没有提供chat参数，使用保存的最后一个活跃聊天对象
-        if chat is None:
-            chat = self.current_chat
-            
-        # 如果没有可用的聊天对象，则不执行后续操作
-        if chat is None:
-            print("无法调用AI: 没有可用的聊天对象")
+        # 免打扰时段不自动回复（之后对方再发消息时会按完整的上下文回复）
+        if session.awaiting_reply and session.rules is not None and session.rules.in_quiet_hours():
+            self._drop_speculation(session.name)
+            self._suppress_reply(session, 'quiet_hours')
+            return False
+        
+        # 有预生成的回复时直接使用：已生成完毕的立即发送，仍在生成的完成后立即发送
+        if self._release_speculation(session):
+            return True
+        
+        # 该聊天已有正在生成的回复，稍后再检查（该回复可能因新消息而被丢弃）
+        if self.reply_worker.is_busy(session.name):
+            self.scheduler.schedule(session.name, time.monotonic() + 1)
+            return False
+        
+        # 对方自上次回复后没有新消息，不需要再次回复
+        if not session.awaiting_reply:
+            if session.filtered_pending:
+                # 有新消息，但都被触发规则过滤（只有表情、媒体等）
+                self._suppress_reply(session, 'filtered')
+                return False
+            self.skipped_checks += 1
+            metrics.inc('reply_skipped_no_new_message')
             return False
         
+        last_time = self._get_last_message_time(session)
         if last_time:
-            time_diff = current_time - last_time
-            # 如果时间差超过1分钟（60秒）
-            if time_diff.total_seconds() > 10:
-                print(f"需要调用AI！最后消息时间: {last_time.strftime('%Y-%m-%d %H:%M:%S')}, 已过去: {int(time_diff.total_seconds())}秒")
-                
+            print(f"'{session.name}' 需要调用AI！最后消息时间: {last_time.strftime('%Y-%m-%d %H:%M:%S')}, 已过去: {int((datetime.now() - last_time).total_seconds())}秒")
+        
+        # 提交后台回复任务，优先使用内存中该聊天的最近消息
+        job = self.reply_worker.submit(session, session.context.messages() if len(session.context) else None,
+                                       stream_sentences=self.stream_sentences)
+        if job is None:
+            return False
+        if job.stream_sentences:
+            self.streaming_jobs[session.name] = job
+        return True
+    
+    def _suppress_reply(self, session, reason):
+        """记录一次被触发规则跳过的AI调用"""
+        session.filtered_pending = False
+        self.suppressed_replies += 1
+        metrics.inc('ai_calls_saved')
+        metrics.inc(f'ai_calls_saved_{reason}')
+        print(f"'{session.name}' 的新消息不需要回复（{'免打扰时段' if reason == 'quiet_hours' else '被触发规则过滤'}），跳过AI调用")
+    
+    def _release_speculation(self, session):
+        """回复截止时间到达时放行该聊天预生成的回复
+        
+        Returns:
+            bool: 是否使用了预生成的回复
+        """
+        job = self.speculative_jobs.pop(session.name, None)
+        if job is None:
+            return False
+        failed = job.finished and (not job.response or job.response.startswith("错误:"))
+        if not self.reply_worker.is_current(job) or not session.awaiting_reply or failed:
+            # 预生成失败或已过时，改为正常生成
+            self._count_speculation_waste()
+            return False
+        
+        job.released = True
+        self.speculative_hits += 1
+        metrics.inc('speculative_hits')
+        print(f"'{session.name}' 使用预生成的回复（{'已生成完毕' if job.finished else '仍在生成'}）")
+        if job.finished:
+            self._deliver_reply(job)
+        elif job.stream_sentences:
+            self.streaming_jobs[session.name] = job
+        return True
+    
+    def _drop_speculation(self, chat_name):
+        """聊天中出现新消息，丢弃该聊天预生成的回复（正在生成的任务已随消息代数增加而中止）"""
+        if self.speculative_jobs.pop(chat_name, None) is not None:
+            self._count_speculation_waste()
+    
+    def _count_speculation_waste(self):
+        """记录一次被丢弃的预生成回复"""
+        self.speculative_wasted += 1
+        metrics.inc('speculative_wasted')
+    
+    def _start_speculation(self):
+        """为收到朋友消息的聊天提交预生成任务（该聊天上一个任务结束后才提交）
+        
+        被触发规则过滤的消息不会使会话等待回复，免打扰时段也不预生成（截止时间到达时同样不会回复）。
+        """
+        for chat_name in list(self._to_speculate):
+            session = self.sessions.get(chat_name)
+            if session is None or session.chat is None or session.chat_ai is None or not session.awaiting_reply:
+                self._to_speculate.discard(chat_name)
+                continue
+            if session.rules is not None and session.rules.in_quiet_hours():
+                self._to_speculate.discard(chat_name)
+                continue
+            if self.reply_worker.is_busy(chat_name):
+                continue
+            job = self.reply_worker.submit(session, session.context.messages() if len(session.context) else None,
+                                           stream_sentences=self.stream_sentences, speculative=True)
+            if job is not None:
+                self.speculative_jobs[chat_name] = job
+                self._to_speculate.discard(chat_name)
+                metrics.inc('speculative_started')
+    
+    def speculation_summary(self):
+        """预生成的命中率和浪费率（按开始的预生成次数计算）"""
+        started = self.speculative_hits + self.speculative_wasted
+        if not started:
+            return "没有预生成"
+        return (f"命中 {self.speculative_hits} 次 ({self.speculative_hits / started:.0%}), "
+                f"浪费 {self.speculative_wasted} 次 ({self.speculative_wasted / started:.0%})")
+    
+    def _send_text(self, job, text):
+        """发送一段回复内容，并记录其回显以免被当作自己的新发言"""
+        job.session.expect_echo(text)
+        with metrics.timer('send_msg'):
+            job.session.chat.SendMsg(text)
+        if not job.sent:
+            metrics.observe('first_send', time.monotonic() - job.submitted_at)
+        job.sent.append(text)
+        self._next_send_time[job.chat_name] = time.monotonic() + self.sentence_interval
+    
+    def _send_streamed_sentences(self):
+        """逐句发送正在生成的回复：每个聊天每sentence_interval秒最多发送一次，
+        达到max_sends_per_reply-1次后剩余的句子等生成结束后合并成最后一次发送"""
+        now = time.monotonic()
+        for chat_name, job in list(self.streaming_jobs.items()):
+            if not self.reply_worker.is_current(job):
+                # 聊天中出现了新消息，不再发送剩余的句子
+                if job.sent:
+                    print(f"'{chat_name}' 在发送回复期间有新消息，停止发送剩余的 {len(job.sentences)} 句")
+                    self._add_message('SYS', '', f"已自动发送AI回复（部分）: {''.join(job.sent)}", chat_name)
+                    metrics.inc('replies_interrupted')
+                job.sentences.clear()
+                del self.streaming_jobs[chat_name]
+                continue
+            
+            if job.sentences and now >= self._next_send_time.get(chat_name, 0):
                 try:
-                    # 调用AI生成回复
-                    from AI import ChatAI
-                    chat_ai = ChatAI()
-                    ai_response = chat_ai.run()
-                    
-                    # 使用传入的聊天对象发送消息
-                    if ai_response and not ai_response.startswith("错误:"):
-                        
-                        print(f"正在发送AI回复: {ai_response[:50]}...")
-                        ai_response = ai_response.replace("A: ", "")
-                        chat.SendMsg(ai_response)
-                        self._add_message('SYS', '', f"已自动发送AI回复: {ai_response}")
-                    else:
-                        print(f"AI回复生成失败，不发送消息: {ai_response}")
-                        self._add_message('SYS', '', f"AI回复生成失败: {ai_response}")
-                        
+                    if len(job.sent) < self.max_sends_per_reply - 1:
+                        self._send_text(job, job.sentences.popleft())
+                        metrics.inc('sentences_sent')
+                    elif job.finished:
+                        # 已达到发送次数上限，剩余的句子合并成一条
+                        remaining = [job.sentences.popleft() for _ in range(len(job.sentences))]
+                        self._send_text(job, ''.join(remaining))
+                        metrics.inc('sentences_sent', len(remaining))
                 except Exception as e:
-                    error_msg = f"调用AI或发送消息时出错: {str(e)}"
+                    error_msg = f"发送AI回复时出错: {str(e)}"
                     print(error_msg)
                     self._add_message('SYS', '', error_msg)
-                    
-                return True
+                    job.sentences.clear()
+            
+            if job.finished and not job.sentences:
+                # 整条回复已发送完毕
+                del self.streaming_jobs[chat_name]
+                job.session.awaiting_reply = False
+                if job.sent:
+                    metrics.inc('replies_sent')
+                    self._add_message('SYS', '', f"已自动发送AI回复: {''.join(job.sent)}", chat_name)
+    
+    def _send_finished_replies(self):
+        """发送后台已生成完成的AI回复，丢弃生成期间聊天中出现新消息的过时回复
         
-        return False
+        预生成的回复在截止时间到达前只保留，不发送。
+        """
+        for job in self.reply_worker.get_finished():
+            job.finished = True
+            if not self.reply_worker.is_current(job):
+                print(f"'{job.chat_name}' 在生成回复期间有新消息，丢弃过时的AI回复")
+                metrics.inc('replies_discarded')
+                continue
+            if job.released:
+                self._deliver_reply(job)
+    
+    def _deliver_reply(self, job):
+        """发送一个已生成完毕、可以发送的回复（逐句发送时交给_send_streamed_sentences）"""
+        ai_response = job.response
+        if job.stream_sentences and ai_response and not ai_response.startswith("错误:"):
+            if not job.sent and not job.sentences:
+                # 命中缓存等没有经过流式生成的回复，整段切分后同样逐句发送
+                splitter = SentenceSplitter()
+                job.sentences.extend(splitter.feed(ai_response) + splitter.flush())
+            self.streaming_jobs[job.chat_name] = job
+            return
+        try:
+            # 使用提交任务时的聊天对象发送消息
+            if ai_response and not ai_response.startswith("错误:"):
+                
+                print(f"正在发送AI回复: {ai_response[:50]}...")
+                ai_response = strip_speaker_prefix(ai_response.replace("A: ", ""))
+                self._send_text(job, ai_response)
+                metrics.inc('replies_sent')
+                job.session.awaiting_reply = False
+                self._add_message('SYS', '', f"已自动发送AI回复: {ai_response}", job.chat_name)
+            else:
+                # 本轮不再重试，等待对方的新消息
+                self.streaming_jobs.pop(job.chat_name, None)
+                job.session.awaiting_reply = False
+                metrics.inc('replies_failed')
+                print(f"AI回复生成失败，不发送消息: {ai_response}")
+                self._add_message('SYS', '', f"AI回复生成失败: {ai_response}", job.chat_name)
+                
+        except Exception as e:
+            error_msg = f"调用AI或发送消息时出错: {str(e)}"
+            print(error_msg)
+            self._add_message('SYS', '', error_msg)
     
-    def start_logging(self, interval=1):
+    def start_logging(self, interval=1, min_interval=0.2, max_interval=5.0):
         """开始记录聊天消息
         
+        有新消息或正在生成回复时按min_interval轮询，空闲时轮询间隔逐步放慢到max_interval；
+        每个聊天的回复截止时间由最小堆管理，到期时立即触发，不受轮询间隔影响。
+        
         Args:
-            interval: 检查新消息的时间间隔(秒)
+            interval: 初始的检查新消息时间间隔(秒)
+            min_interval: 最短检查间隔(秒)
+            max_interval: 最长检查间隔(秒)
         """
+        self._wait_for_startup()
+        if self.startup.enabled:
+            self.startup.report()
+        
         # 检查是否有成功添加的聊天
         if not self.listen_list:
             print("错误: 没有添加任何聊天监听，无法开始记录")
             return
             
-        print(f"开始记录聊天消息，检查间隔: {interval}秒")
+        print(f"开始记录聊天消息，检查间隔: {min_interval}~{max_interval}秒，回复等待: {self.reply_delay}秒")
         print(f"正在监听以下聊天: {', '.join(self.listen_list)}")
         self._append_to_file(f"开始记录 - {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
         self._append_to_file(f"监听的聊天: {', '.join(self.listen_list)}\n")
         
-        check_counter = 0  # 计数器，用于控制时间差检查频率
+        poller = AdaptivePoller(min_interval, max_interval, initial=interval)
+        error_backoff = Backoff(base=1.0, cap=60.0)
+        
+        # 历史消息中有未回复的朋友消息时，启动后也按时回复
+        for session in self.sessions.values():
+            if session.awaiting_reply:
+                self._schedule_reply(session)
         
         try:
-            while True:
+            while not self._stop_event.is_set():
                 try:
-                    msgs = self.wx.GetListenMessage()
+                    with metrics.timer('poll'):
+                        msgs = self.wx.GetListenMessage()
                     has_new_message = False
-                    current_active_chat = None  # 记录当前循环中的活跃聊天
                     
                     if msgs:
                         for chat in msgs:
@@ -307,85 +896,143 @@ class ChatLogger:
                                 continue
                                 
                             chat_name = getattr(chat, 'who', '未知聊天')
-                            current_active_chat = chat  # 保存当前活跃的聊天对象
+                            self._get_session(chat_name, chat)
                             
+                            metrics.inc('messages_ingested', len(one_msgs))
                             for msg in one_msgs:
                                 has_new_message = True
                                 # 只记录'friend'和'self'类型的消息
                                 if msg.type == 'friend':
-                                    # 朋友发送的消息
-                                    self._add_message(chat_name, chat_name, msg.content)
+                                    # 朋友发送的消息，正在生成的回复随之过时，重新开始计时
+                                    self._add_message(chat_name, chat_name, msg.content, chat_name)
                                     self.last_message_time = datetime.now()
+                                    self.reply_worker.invalidate(chat_name)
+                                    self.scheduler.schedule(chat_name, time.monotonic() + self.reply_delay)
+                                    if self.speculative:
+                                        # 丢弃已有的预生成结果，按最新的上下文重新预生成
+                                        self._drop_speculation(chat_name)
+                                        self._to_speculate.add(chat_name)
                                     
                                 elif msg.type == 'self':
-                                    # 自己发送的消息
-                                    self._add_message('Self', '自己', msg.content)
+                                    session = self.sessions[chat_name]
+                                    if session.consume_echo(msg.content):
+                                        # 自动发送内容的回显：只记录，不影响正在发送的回复和回复轮次
+                                        awaiting_reply = session.awaiting_reply
+                                        self._add_message('Self', '自己', msg.content, chat_name)
+                                        session.awaiting_reply = awaiting_reply
+                                        continue
+                                    # 自己发送的消息，本轮不再需要回复
+                                    self._add_message('Self', '自己', msg.content, chat_name)
                                     self.last_message_time = datetime.now()
+                                    self.reply_worker.invalidate(chat_name)
+                                    self.scheduler.cancel(chat_name)
+                                    self._drop_speculation(chat_name)
+                                    self._to_speculate.discard(chat_name)
                                 
                                 elif msg.type == 'time':
                                     # 时间消息
-                                    self._add_message('Time', '', msg.time)
+                                    self._add_message('Time', '', msg.time, chat_name)
                                     
                                 elif msg.type == 'sys':
                                     # 系统消息
-                                    self._add_message('SYS', '', msg.content)
+                                    self._add_message('SYS', '', msg.content, chat_name)
+                    
+                    # 触发所有已到期的回复
+                    for chat_name in self.scheduler.pop_due(time.monotonic()):
+                        self._on_reply_deadline(self.sessions[chat_name])
+                    
+                    # 为收到朋友消息的聊天开始预生成回复
+                    if self._to_speculate:
+                        self._start_speculation()
                     
-                    # 更新当前聊天对象（如果有新消息）
-                    if current_active_chat:
-                        self.current_chat = current_active_chat
+                    # 发送后台已完成的回复和正在逐句发送的回复
+                    self._send_finished_replies()
+                    self._send_streamed_sentences()
                     
-                    # 如果没有新消息，每10次循环检查一次时间差
-                    if not has_new_message:
-                        check_counter += 1
-                        if check_counter >= 10:
-                            # 使用保存的聊天对象调用检查方法
-                            self._check_time_gap()
-                            check_counter = 0
+                    # 有活动时加快轮询，空闲时逐步放慢
+                    if has_new_message or self.reply_worker.has_pending() or self.streaming_jobs:
+                        poll_delay = poller.on_activity()
                     else:
-                        check_counter = 0
+                        poll_delay = poller.on_idle()
+                    error_backoff.reset()
                                 
                 except Exception as e:
                     error_msg = f"获取消息时出错: {str(e)}"
                     print(error_msg)
                     self._append_to_file(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] [系统] 错误: {error_msg}")
                     self._add_message('SYS', '', f"错误: {error_msg}")
-                    time.sleep(5)  # 发生错误时增加等待时间
+                    # 连续出错时指数退避（带随机抖动）
+                    poll_delay = error_backoff.next_delay()
+                    metrics.inc('poll_errors')
                 
-                time.sleep(interval)
+                # 等待到下一次轮询，或最近的回复截止时间（取较早者）
+                next_deadline = self.scheduler.next_deadline()
+                if next_deadline is not None:
+                    poll_delay = min(poll_delay, max(next_deadline - time.monotonic(), 0))
+                self._stop_event.wait(poll_delay)
+            
+            self._finish_logging()
                 
         except KeyboardInterrupt:
-            end_msg = f"结束记录 - {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
-            self._append_to_file(f"\n{end_msg}")
-            self._add_message('SYS', '', end_msg)
-            print(f"聊天记录已保存到: {self.log_file}")
-            print(f"格式化消息已保存到: {self.format_file}")
+            self._finish_logging()
         except Exception as e:
             error_msg = f"处理会话时出错: {str(e)}"
             print(error_msg)
             self._append_to_file(f"\n{error_msg}")
             self._add_message('SYS', '', error_msg)
 
+    
+    def stop(self):
+        """请求结束记录（可从其他线程调用），start_logging会在当前轮询结束后返回"""
+        self._stop_event.set()
+    
+    def _finish_logging(self):
+        """结束记录：停止后台回复线程，保存快照并关闭数据库"""
+        end_msg = f"结束记录 - {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
+        self._append_to_file(f"\n{end_msg}")
+        self._add_message('SYS', '', end_msg)
+        self.reply_worker.stop()
+        self.message_store.snapshot(self._retained_messages())
+        if self.log_writer is not None:
+            # 写完队列中剩余的日志和消息
+            self.log_writer.close()
+        self.message_store.close()
+        self.main_log.close()
+        for session in self.sessions.values():
+            session.log.close()
+        if self.history_db is not None:
+            self.history_db.close()
+        metrics.shutdown(self.metrics_file)
+        if self.chat_ai is not None:
+            print(f"AI连接统计: {self.chat_ai.connection_stats.summary()}")
+            print(f"{self.chat_ai.response_cache.summary()}, 无新消息跳过回复: {self.skipped_checks}, "
+                  f"触发规则跳过的AI调用: {self.suppressed_replies}")
+        if self.speculative:
+            print(f"预生成统计: {self.speculation_summary()}")
+        print(f"聊天记录已保存到: {self.log_file}")
+        print(f"格式化消息已保存到: {self.format_file}")
+
 
 if __name__ == "__main__":
-    # 使用示例
-    logger = ChatLogger()
-    
     # 添加要监听的聊天
     listen_targets = [
         '关键词',  # 将此替换为您实际想监听的聊天名称
         # 添加更多聊天对象...
     ]
     
-    # 记录成功添加的聊天数量
-    success_count = 0
-    for target in listen_targets:
-        if logger.add_listen_chat(target):
-            success_count += 1
+    # 使用示例：连接微信的同时在后台导入并预热AI客户端、恢复要监听的聊天的会话
+    # 加上 --profile-startup 参数运行时，开始记录前输出启动各阶段的耗时
+    logger = ChatLogger(preload_chats=listen_targets, profile_startup='--profile-startup' in sys.argv[1:])
+    
+    # 批量添加监听，记录成功添加的聊天数量
+    success_count = len(logger.add_listen_chats(listen_targets))
     
     # 如果成功添加了至少一个聊天，开始记录
     if success_count > 0:
         print(f"成功添加 {success_count} 个聊天监听")
-        # 开始记录，每1秒检查一次新消息
+        # 开始记录，空闲时检查间隔逐步从1秒放慢到5秒
         logger.start_logging(interval=1)
     else:
-        print("未能添加任何聊天监听，程序退出")
\ No newline at end of file
+        if logger.startup.enabled:
+            logger.startup.report()
+        print("未能添加任何聊天监听，程序退出")
@@ -0,0 +1,157 @@
+import os
+import re
+from collections import deque
+
+from chat_log_parser import ChatLogParser
+from context_window import ContextWindow, DEFAULT_TOKEN_BUDGET
+from history_index import DEFAULT_INDEX_SIZE, HistoryIndex
+from history_sync import FingerprintHistory
+from log_rotation import DEFAULT_MAX_BYTES, RotatingLog, read_segment, segment_files
+from metrics import metrics
+
+
+class ChatSession:
+    """单个聊天的会话：独立的上下文缓冲区、空闲计时和日志分段"""
+
+    def __init__(self, name, log_dir="chat_logs", context_size=20, chat=None, token_budget=DEFAULT_TOKEN_BUDGET,
+                 max_log_bytes=DEFAULT_MAX_BYTES, max_log_age=None, writer=None, rules=None,
+                 index_size=DEFAULT_INDEX_SIZE):
+        """初始化聊天会话
+
+        Args:
+            name: 聊天名称
+            log_dir: 会话日志分段所在的目录
+            context_size: 上下文中最多保留的消息数量
+            chat: wxauto的聊天对象，用于发送消息，添加监听后设置
+            token_budget: 上下文的token预算（直接作为AI上下文）
+            max_log_bytes: 会话日志超过多少字节时轮转为压缩分段
+            max_log_age: 会话日志写入超过多少秒后轮转，None表示不按时间轮转
+            writer: 可选的LogWriter，提供时会话日志由后台线程批量写入
+            rules: 自动回复的触发规则（TriggerRules），为None时每条朋友消息都需要回复
+            index_size: 检索较早消息的倒排索引最多保留的消息数，0表示不建立索引
+        """
+        self.name = name
+        self.chat = chat
+        self.context = ContextWindow(token_budget, max_messages=context_size)  # 按token预算维护的上下文
+        self.last_activity = None  # 最后一条消息的时间
+        self.awaiting_reply = False  # 是否有尚未回复、需要回复的朋友消息
+        self.rules = rules
+        self.filtered_pending = False  # 本轮是否有被触发规则过滤掉的朋友消息
+        self.chat_ai = None  # 该会话使用的AI处理器（共享同一个客户端）
+        self.pending_echoes = deque(maxlen=50)  # 已自动发送、等待在监听消息中回显的内容
+        self.history = FingerprintHistory()  # 已记录消息的指纹，加载微信历史消息时去重
+        self.index = HistoryIndex(index_size) if index_size else None  # 全部历史的倒排索引，回复时检索相关的较早消息
+
+        # 会话日志文件名只保留文件系统安全的字符
+        safe_name = re.sub(r'[\\/:*?"<>|\s]+', '_', name).strip('_') or 'chat'
+        self.log_file = os.path.join(log_dir, f"{safe_name}.txt")
+        self.log = RotatingLog(self.log_file, max_log_bytes, max_log_age,
+                               header=f"===== {name} 的聊天记录（续） =====\n\n", writer=writer)
+
+    def init_log_file(self, header, resume=False):
+        """创建会话日志分段并写入标题
+
+        Args:
+            header: 标题
+            resume: 为True时保留已有的日志，在末尾追加标题；否则清空日志
+        """
+        os.makedirs(os.path.dirname(self.log_file) or '.', exist_ok=True)
+        with open(self.log_file, 'a' if resume else 'w', encoding='utf-8') as f:
+            f.write(header + "\n\n")
+
+    def read_log_tail(self, max_bytes=65536, min_messages=0):
+        """读取会话日志末尾的消息（重启后没有历史数据库时用于恢复上下文和历史索引）
+
+        先读取活动日志末尾max_bytes字节；消息不到min_messages条时读取范围加倍，
+        活动日志读完仍不够（或日志刚轮转过、活动文件中还没有消息）时，从新到旧读取已轮转的压缩分段。
+
+        Args:
+            max_bytes: 第一次读取的字节数
+            min_messages: 至少读取的消息数（例如历史索引的大小），0表示只读取末尾max_bytes字节
+
+        Returns:
+            list: 消息记录（Message）列表，min_messages大于0时最多min_messages条
+        """
+        wanted = max(min_messages, 1)
+        size = os.path.getsize(self.log_file) if os.path.exists(self.log_file) else 0
+        while True:
+            parser = ChatLogParser(self.log_file)
+            parser.seek_tail(max_bytes)
+            messages = parser.parse()
+            if not min_messages or len(messages) >= wanted or max_bytes >= size:
+                break
+            max_bytes *= 2
+        for segment in reversed(segment_files(self.log_file)):
+            if len(messages) >= wanted:
+                break
+            messages = ChatLogParser(segment).feed(read_segment(segment)) + messages
+        return messages[-min_messages:] if min_messages else messages
+
+    def append_to_log(self, text):
+        """追加内容到会话日志分段（超过大小或时间限制时轮转）"""
+        self.log.write(text + "\n")
+
+    def add_message(self, msg, timestamp):
+        """记录一条消息到上下文窗口并更新最后活动时间
+
+        Args:
+            msg: 消息，格式为 [类型, 内容]
+            timestamp: 消息记录时间
+        """
+        self.context.append(msg)
+        self.history.add(msg)
+        if self.index is not None:
+            self.index.add(msg)
+        self.last_activity = timestamp
+        reason = self._update_turn(msg)
+        if reason is not None:
+            metrics.inc(f'trigger_filtered_{reason}')
+
+    def expect_echo(self, text):
+        """记录一条自动发送的内容，它稍后会作为"自己"的消息出现在监听消息中"""
+        self.pending_echoes.append(text)
+
+    def consume_echo(self, text):
+        """判断"自己"的消息是否为自动发送内容的回显（是则移除该记录）"""
+        try:
+            self.pending_echoes.remove(text)
+            return True
+        except ValueError:
+            return False
+
+    def restore(self, messages):
+        """用保存的历史消息恢复上下文和去重指纹（不更新最后活动时间）
+
+        Args:
+            messages: 按时间顺序排列的历史消息，全部加入历史索引，只有最近context_size条进入上下文
+        """
+        recent_start = max(len(messages) - self.context.max_messages, 0)
+        for position, msg in enumerate(messages):
+            self.history.add(msg)
+            if self.index is not None:
+                self.index.add(msg)
+            if position >= recent_start:
+                self.context.append(msg)
+            self._update_turn(msg)
+
+    def _update_turn(self, msg):
+        """根据消息更新回复轮次：朋友发言后等待回复，自己发言后轮次结束
+
+        时间、系统消息（包括错误和自动回复记录）不改变轮次；
+        被触发规则过滤的朋友消息（只有表情等）也不开始新的轮次。
+
+        Returns:
+            str: 朋友消息被触发规则过滤的原因，其余情况返回None
+        """
+        if msg[0] == 'Self':
+            self.awaiting_reply = False
+            self.filtered_pending = False
+        elif msg[0] not in ('Time', 'SYS'):
+            reason = self.rules.filter_reason(msg[1]) if self.rules is not None else None
+            if reason is None:
+                self.awaiting_reply = True
+                self.filtered_pending = False
+            else:
+                self.filtered_pending = True
+            return reason
+        return None
@@ -0,0 +1,115 @@
+import re
+from collections import deque
+
+from message_record import Message, MessageKind
+
+# 默认的上下文token预算（不含系统提示词）
+DEFAULT_TOKEN_BUDGET = 1500
+
+# 每条消息的格式开销（角色、"A: "/"B: " 前缀等）
+MESSAGE_OVERHEAD = 4
+
+# 中日韩文字及全角符号，每个字大约对应一个token
+CJK_PATTERN = re.compile(r'[\u2e80-\u9fff\uac00-\ud7af\uf900-\ufaff\uff00-\uffef]')
+
+
+def estimate_tokens(text):
+    """粗略估算一段文本的token数（中文按字计，其他字符约4个字符一个token）"""
+    cjk = len(CJK_PATTERN.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4 + MESSAGE_OVERHEAD
+
+
+def clip_to_budget(text, budget):
+    """将超长文本截断到大约budget个token以内（保留开头）"""
+    if estimate_tokens(text) <= budget:
+        return text
+    low, high = 0, len(text)
+    while low < high:
+        mid = (low + high + 1) // 2
+        if estimate_tokens(text[:mid]) + 1 <= budget:
+            low = mid
+        else:
+            high = mid - 1
+    return text[:low] + '…'
+
+
+class ContextWindow:
+    """按token预算维护的聊天上下文窗口
+
+    每条消息的token数只在加入时估算一次，缓存在窗口中消息记录的
+    tokens 字段中；新消息到来时
+    从窗口开头淘汰旧消息直到总量不超过预算。被淘汰的消息折叠成一段
+    滚动摘要，摘要只在有消息被淘汰时重新生成。
+    """
+
+    def __init__(self, token_budget=DEFAULT_TOKEN_BUDGET, max_messages=100, summary_budget=200):
+        """
+        Args:
+            token_budget: 窗口内消息的token总预算
+            max_messages: 窗口内最多保留的消息数
+            summary_budget: 滚动摘要的token预算，0表示不生成摘要
+        """
+        self.token_budget = token_budget
+        self.max_messages = max_messages
+        self.summary_budget = summary_budget
+        self.entries = deque()  # 窗口内的消息记录（Message，tokens已估算）
+        self.total_tokens = 0
+        self.summary = ""  # 被淘汰消息的滚动摘要
+        self._summary_lines = deque()  # 组成摘要的行（新的在后）
+        self._summary_tokens = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def append(self, msg):
+        """加入一条消息（时间和系统消息不会发送给AI，不进入窗口）
+
+        Args:
+            msg: 消息记录（Message）或 [类型, 内容] 列表
+        """
+        msg = Message.coerce(msg)
+        if msg.kind in (MessageKind.TIME, MessageKind.SYS) or not msg.content:
+            return
+        content = msg.content
+        tokens = estimate_tokens(content)
+        if tokens > self.token_budget:
+            # 单条消息超过整个预算时截断内容，避免粘贴的长文本撑爆上下文
+            content = clip_to_budget(content, self.token_budget)
+            tokens = estimate_tokens(content)
+            msg = Message(msg.kind, content, msg.sender, msg.chat, msg.timestamp, tokens)
+        else:
+            # 直接引用同一条记录（只缓存token数），不为窗口复制一份
+            msg.tokens = tokens
+        self.entries.append(msg)
+        self.total_tokens += tokens
+
+        evicted = []
+        while len(self.entries) > 1 and (self.total_tokens > self.token_budget
+                                         or len(self.entries) > self.max_messages):
+            old_record = self.entries.popleft()
+            self.total_tokens -= old_record.tokens
+            evicted.append(old_record)
+        if evicted and self.summary_budget:
+            self._fold_into_summary(evicted)
+
+    def extend(self, messages):
+        for msg in messages:
+            self.append(msg)
+
+    def _fold_into_summary(self, evicted):
+        """将被淘汰的消息并入滚动摘要，只保留最近的、在摘要预算内的部分"""
+        for msg in evicted:
+            speaker = 'A' if msg.kind == MessageKind.SELF else 'B'
+            line = f"{speaker}: {clip_to_budget(msg.content, self.summary_budget // 4 or 1)}"
+            self._summary_lines.append((line, estimate_tokens(line)))
+            self._summary_tokens += self._summary_lines[-1][1]
+        while self._summary_lines and self._summary_tokens > self.summary_budget:
+            self._summary_tokens -= self._summary_lines.popleft()[1]
+        self.summary = "\n".join(line for line, _ in self._summary_lines)
+
+    def messages(self):
+        """返回窗口内的消息记录列表；有摘要时第一项为 MessageKind.SUMMARY 类型的摘要记录"""
+        messages = list(self.entries)
+        if self.summary:
+            messages.insert(0, Message(MessageKind.SUMMARY, self.summary))
+        return messages
@@ -0,0 +1,137 @@
+import threading
+import time
+from datetime import datetime
+
+
+class HistoryDB:
+    """基于SQLite的聊天历史存储（可选后端）
+
+    使用WAL模式，消息先缓存在内存中，按数量或时间间隔批量写入；
+    按 (聊天, 时间) 建立索引，构建上下文时只需一次索引范围读取，
+    并且历史记录在程序重启后仍然保留。
+    """
+
+    def __init__(self, db_file="chat_history.db", batch_size=50, flush_interval=1.0):
+        """
+        Args:
+            db_file: 数据库文件路径
+            batch_size: 缓存多少条消息后批量写入
+            flush_interval: 距上次写入超过多少秒时批量写入
+        """
+        self.db_file = db_file
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._pending = []  # 等待批量写入的消息
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+
+        # 只有使用历史数据库时才导入sqlite3，不拖慢启动
+        import sqlite3
+
+        # 轮询线程写入、回复线程读取，共用一个连接并由锁保护
+        self.conn = sqlite3.connect(db_file, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS messages ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+            "chat TEXT NOT NULL, "
+            "type TEXT NOT NULL, "
+            "content TEXT NOT NULL, "
+            "ts REAL NOT NULL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_messages_chat_ts ON messages (chat, ts)")
+        self.conn.commit()
+
+    @staticmethod
+    def _to_timestamp(value):
+        """将datetime或数字统一转换为Unix时间戳"""
+        if isinstance(value, datetime):
+            return value.timestamp()
+        return float(value)
+
+    def add(self, chat, msg_type, content, timestamp=None):
+        """添加一条消息（缓存后批量写入）
+
+        Args:
+            chat: 聊天名称
+            msg_type: 消息类型 ('Time', 'Self', 'SYS' 或发送者名称)
+            content: 消息内容
+            timestamp: 消息时间（datetime或Unix时间戳），默认为当前时间
+        """
+        ts = self._to_timestamp(timestamp) if timestamp is not None else time.time()
+        with self._lock:
+            self._pending.append((chat, msg_type, content, ts))
+            if (len(self._pending) >= self.batch_size
+                    or time.monotonic() - self._last_flush >= self.flush_interval):
+                self._flush_locked()
+
+    def add_many(self, chat, messages, timestamp=None):
+        """添加多条消息（与缓存的消息一起立即批量写入）
+
+        Args:
+            chat: 聊天名称
+            messages: 消息列表，每项为 [类型, 内容]
+            timestamp: 消息时间（datetime或Unix时间戳），默认为当前时间
+        """
+        ts = self._to_timestamp(timestamp) if timestamp is not None else time.time()
+        with self._lock:
+            self._pending.extend((chat, msg[0], msg[1], ts) for msg in messages)
+            self._flush_locked()
+
+    def flush(self):
+        """立即写入所有缓存的消息"""
+        with self._lock:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        if self._pending:
+            with self.conn:
+                self.conn.executemany(
+                    "INSERT INTO messages (chat, type, content, ts) VALUES (?, ?, ?, ?)",
+                    self._pending,
+                )
+            self._pending = []
+        self._last_flush = time.monotonic()
+
+    def last_messages(self, chat, n=20):
+        """获取聊天最近的n条消息
+
+        Args:
+            chat: 聊天名称
+            n: 消息数量
+
+        Returns:
+            list: 按时间顺序排列的消息列表，每项为 [类型, 内容]
+        """
+        with self._lock:
+            self._flush_locked()
+            rows = self.conn.execute(
+                "SELECT type, content FROM messages WHERE chat = ? ORDER BY ts DESC, id DESC LIMIT ?",
+                (chat, n),
+            ).fetchall()
+        return [[msg_type, content] for msg_type, content in reversed(rows)]
+
+    def messages_since(self, chat, since):
+        """获取聊天在指定时间之后的所有消息
+
+        Args:
+            chat: 聊天名称
+            since: 起始时间（datetime或Unix时间戳，包含该时间）
+
+        Returns:
+            list: 按时间顺序排列的消息列表，每项为 [类型, 内容]
+        """
+        with self._lock:
+            self._flush_locked()
+            rows = self.conn.execute(
+                "SELECT type, content FROM messages WHERE chat = ? AND ts >= ? ORDER BY ts, id",
+                (chat, self._to_timestamp(since)),
+            ).fetchall()
+        return [[msg_type, content] for msg_type, content in rows]
+
+    def close(self):
+        """写入缓存的消息并关闭数据库"""
+        with self._lock:
+            self._flush_locked()
+            self.conn.close()
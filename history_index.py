@@ -0,0 +1,181 @@
+import heapq
+import math
+import re
+import threading
+from collections import deque
+
+from message_record import Message, MessageKind
+
+# 每个聊天的索引默认保留的消息数
+DEFAULT_INDEX_SIZE = 5000
+
+# 连续的中日韩文字切分为单字和n-gram，字母数字按整个单词作为词项
+CJK_RUN = re.compile(r'[\u2e80-\u9fff\uac00-\ud7af\uf900-\ufaff]+')
+WORD = re.compile(r'[0-9a-zA-Z]+')
+
+# BM25参数（消息很短，词频按1计）
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# 索引中至少有MIN_DOCUMENTS_FOR_SKIP条消息时，出现在超过MAX_DOCUMENT_FREQUENCY比例消息中的词项
+# （如"哈"、"的"）区分度很低，查询有其他词项时跳过，避免遍历很长的倒排列表
+MAX_DOCUMENT_FREQUENCY = 0.1
+MIN_DOCUMENTS_FOR_SKIP = 200
+
+# 每个词项最多遍历最近的多少条倒排记录（检索耗时有上限，较新的消息优先）
+MAX_SCANNED_POSTINGS = 2000
+
+
+def tokenize(text, n=2):
+    """把文本切分为去重后的词项：中文按单字和字符n-gram（单字词如"猫"也能命中），英文和数字按单词
+
+    Returns:
+        set: 词项集合
+    """
+    terms = set()
+    for run in CJK_RUN.findall(text):
+        terms.update(run)
+        terms.update(run[i:i + n] for i in range(len(run) - n + 1))
+    terms.update(word.lower() for word in WORD.findall(text))
+    return terms
+
+
+class HistoryIndex:
+    """一个聊天的增量倒排索引，用于按内容检索较早的消息
+
+    每条聊天双方的发言加入时切分为单字和字符n-gram，追加到各词项的倒排列表（消息编号递增，
+    列表天然有序）；检索时只遍历查询词项的倒排列表，按BM25打分取前k条。
+    超过max_documents条时淘汰最早的消息，被淘汰的编号在检索时跳过，
+    累积到一定数量后重建倒排列表释放内存。
+    """
+
+    def __init__(self, max_documents=DEFAULT_INDEX_SIZE, n=2):
+        """
+        Args:
+            max_documents: 索引中最多保留的消息数
+            n: 中文n-gram的长度
+        """
+        self.max_documents = max_documents
+        self.n = n
+        self.documents = deque()  # 保留的 (消息记录, 词项数)，第i项的编号为first_id + i
+        self.first_id = 0  # 最早保留的消息编号
+        self.postings = {}  # {词项: [消息编号, ...]}
+        self.total_terms = 0  # 保留消息的词项总数（计算平均长度）
+        self._stale = 0  # 倒排列表中已淘汰的编号数
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.documents)
+
+    def add(self, msg):
+        """索引一条消息（时间、系统消息和摘要不索引）"""
+        msg = Message.coerce(msg)
+        if msg.kind not in (MessageKind.FRIEND, MessageKind.SELF) or not msg.content:
+            return
+        terms = tokenize(msg.content, self.n)
+        if not terms:
+            return
+        with self._lock:
+            doc_id = self.first_id + len(self.documents)
+            self.documents.append((msg, len(terms)))
+            self.total_terms += len(terms)
+            for term in terms:
+                postings = self.postings.get(term)
+                if postings is None:
+                    self.postings[term] = [doc_id]
+                else:
+                    postings.append(doc_id)
+            while len(self.documents) > self.max_documents:
+                _, length = self.documents.popleft()
+                self.total_terms -= length
+                self.first_id += 1
+                self._stale += length
+            if self._stale > self.total_terms:
+                self._compact_locked()
+
+    def extend(self, messages):
+        for msg in messages:
+            self.add(msg)
+
+    def _compact_locked(self):
+        """从倒排列表中删除已淘汰的编号"""
+        first_id = self.first_id
+        for term in list(self.postings):
+            postings = self.postings[term]
+            if postings[0] >= first_id:
+                continue
+            kept = postings[self._bisect(postings, first_id):]
+            if kept:
+                self.postings[term] = kept
+            else:
+                del self.postings[term]
+        self._stale = 0
+
+    @staticmethod
+    def _bisect(postings, doc_id):
+        low, high = 0, len(postings)
+        while low < high:
+            mid = (low + high) // 2
+            if postings[mid] < doc_id:
+                low = mid + 1
+            else:
+                high = mid
+        return low
+
+    def following(self, doc_id, count=1):
+        """返回编号为doc_id的消息之后的count条消息 [(消息编号, 消息记录), ...]（检索到问题时一并取出回答）"""
+        with self._lock:
+            start = max(doc_id + 1, self.first_id)
+            end = min(doc_id + 1 + count, self.first_id + len(self.documents))
+            return [(i, self.documents[i - self.first_id][0]) for i in range(start, end)]
+
+    def search(self, query, k=5, exclude=()):
+        """检索与查询文本最相关的k条消息
+
+        Args:
+            query: 查询文本
+            k: 返回的消息数
+            exclude: 不返回的消息内容集合（例如已经在上下文中的消息）
+
+        Returns:
+            list: [(分数, 消息编号, 消息记录), ...]，按分数从高到低排列
+        """
+        terms = tokenize(query, self.n)
+        if not terms or k <= 0:
+            return []
+        with self._lock:
+            count = len(self.documents)
+            if not count:
+                return []
+            first_id = self.first_id
+            average = self.total_terms / count
+            scores = {}
+            for term in terms:
+                postings = self.postings.get(term)
+                if not postings:
+                    continue
+                start = self._bisect(postings, first_id) if postings[0] < first_id else 0
+                df = len(postings) - start
+                if len(terms) > 1 and count >= MIN_DOCUMENTS_FOR_SKIP and df > count * MAX_DOCUMENT_FREQUENCY:
+                    continue
+                idf = math.log(1 + (count - df + 0.5) / (df + 0.5))
+                for doc_id in postings[max(start, len(postings) - MAX_SCANNED_POSTINGS):]:
+                    scores[doc_id] = scores.get(doc_id, 0.0) + idf
+            documents = self.documents
+            ranked = []
+            for doc_id, score in scores.items():
+                msg, length = documents[doc_id - first_id]
+                norm = (BM25_K1 + 1) / (1 + BM25_K1 * (1 - BM25_B + BM25_B * length / average))
+                ranked.append((score * norm, doc_id, msg))
+        # 多取一些候选，跳过重复和需要排除的内容后仍有k条
+        ranked = heapq.nlargest(k * 4 + len(exclude), ranked, key=lambda item: (item[0], item[1]))
+        results = []
+        seen = set()
+        for score, doc_id, msg in ranked:
+            if msg.content in seen or msg.content in exclude:
+                continue
+            seen.add(msg.content)
+            results.append((score, doc_id, msg))
+            if len(results) >= k:
+                break
+        return results
@@ -0,0 +1,75 @@
+from collections import deque
+
+# 每个聊天保留多少条已记录消息的指纹用于去重
+FINGERPRINT_HISTORY = 500
+
+
+def fingerprint(msg):
+    """计算消息的指纹，用于判断微信中加载的历史消息是否已经记录过
+
+    只对聊天双方的发言计算指纹：时间消息的文本（如"昨天 12:00"）会随日期变化，
+    系统消息中混有本程序写入的记录，二者都不参与比对，返回None。
+
+    Args:
+        msg: 消息，格式为 [类型, 内容]（朋友消息的类型为聊天名称）
+
+    Returns:
+        int: 指纹，不参与比对的消息返回None
+    """
+    msg_type, content = msg[0], msg[1]
+    if msg_type in ('Time', 'SYS', 'Summary'):
+        return None
+    return hash(('Self' if msg_type == 'Self' else 'friend', content))
+
+
+class FingerprintHistory:
+    """一个聊天最近已记录消息的指纹序列"""
+
+    def __init__(self, maxlen=FINGERPRINT_HISTORY):
+        self.fingerprints = deque(maxlen=maxlen)
+
+    def __len__(self):
+        return len(self.fingerprints)
+
+    def add(self, msg):
+        """记录一条消息的指纹"""
+        value = fingerprint(msg)
+        if value is not None:
+            self.fingerprints.append(value)
+
+    def new_messages(self, fetched):
+        """从微信中加载的一批历史消息里找出尚未记录的部分
+
+        微信返回的是聊天窗口中最近的一段消息，与已记录消息的末尾有一段重叠。
+        按消息序列（而不是单条消息）比对：找到最靠后的位置j，使加载的前j条发言
+        与已记录的最后几条发言完全一致，j之后的消息即为新消息。
+        内容重复的单条消息（如多次"哈哈"）不会被误判为已记录；
+        重叠部分之后只有时间、系统消息时视为没有新消息。
+
+        Args:
+            fetched: 加载的消息列表（按时间顺序），每项为 [类型, 内容]
+
+        Returns:
+            list: 尚未记录的消息（fetched的一个后缀）
+        """
+        stored = list(self.fingerprints)
+        if not stored:
+            return list(fetched)
+
+        # 只比对聊天双方的发言，positions[i] 为第i条发言在fetched中的下标
+        positions = []
+        values = []
+        for index, msg in enumerate(fetched):
+            value = fingerprint(msg)
+            if value is not None:
+                positions.append(index)
+                values.append(value)
+
+        last = stored[-1]
+        for j in range(len(values), 0, -1):
+            if values[j - 1] != last:
+                continue
+            overlap = min(j, len(stored))
+            if values[j - overlap:j] == stored[len(stored) - overlap:]:
+                return list(fetched[positions[j - 1] + 1:]) if j < len(values) else []
+        return list(fetched)
@@ -0,0 +1,140 @@
+import glob
+import gzip
+import os
+import re
+import shutil
+import threading
+import time
+
+# 日志文件默认的轮转大小(字节)
+DEFAULT_MAX_BYTES = 10 * 1024 * 1024
+
+
+def segment_files(path):
+    """列出日志已轮转出的压缩分段，按时间从早到晚排序
+
+    分段文件名为 <日志名>.<轮转时间>-<序号><扩展名>.gz，
+    例如 chat_log.txt 轮转出 chat_log.20240101-120000-000.txt.gz。
+    """
+    root, ext = os.path.splitext(path)
+    pattern = re.compile(re.escape(root) + r'\.\d{8}-\d{6}-\d{3}' + re.escape(ext) + r'\.gz$')
+    return sorted(name for name in glob.glob(f"{glob.escape(root)}.*{glob.escape(ext)}.gz") if pattern.match(name))
+
+
+def read_segments(path, count):
+    """读取最近count个压缩分段的内容（按时间从早到晚）
+
+    Returns:
+        list: 每个分段的文本
+    """
+    return [read_segment(segment) for segment in (segment_files(path)[-count:] if count > 0 else [])]
+
+
+def read_segment(segment):
+    """读取一个压缩分段的内容，读取出错时返回空文本"""
+    try:
+        with gzip.open(segment, 'rt', encoding='utf-8', errors='replace') as f:
+            return f.read()
+    except Exception as e:
+        print(f"读取日志分段 {segment} 时出错: {str(e)}")
+        return ""
+
+
+class RotatingLog:
+    """按大小或时间轮转的文本日志
+
+    只追加写入当前（活动）日志文件；超过max_bytes字节或距上次轮转超过max_age秒时，
+    当前文件被压缩为gzip分段，随后写入的内容进入新的活动文件。
+    读取日志的代码因此只需要处理活动文件，需要更早的历史时再读取分段。
+    活动文件保持打开，提供writer（LogWriter）时由后台线程批量写入。
+    """
+
+    def __init__(self, path, max_bytes=DEFAULT_MAX_BYTES, max_age=None, header="", writer=None):
+        """
+        Args:
+            path: 活动日志文件路径
+            max_bytes: 活动文件超过多少字节时轮转，0或None表示不按大小轮转
+            max_age: 活动文件写入超过多少秒后轮转，None表示不按时间轮转
+            header: 轮转后写在新活动文件开头的文本
+            writer: 可选的LogWriter，提供时write只把文本放入后台写入队列
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.header = header
+        self.writer = writer
+        self.rotations = 0  # 已轮转的次数
+        self._started = time.monotonic()  # 当前活动文件开始写入的时间
+        self._file = None  # 保持打开的活动文件
+        self._lock = threading.Lock()
+
+    def write(self, text):
+        """追加文本到活动日志，必要时轮转"""
+        if self.writer is not None:
+            self.writer.write(self, text)
+        else:
+            self.write_batch(text).flush()
+
+    def write_batch(self, text):
+        """立即写入文本（不刷新），必要时轮转，返回活动文件对象"""
+        with self._lock:
+            if self._file is None:
+                self._file = open(self.path, 'a', encoding='utf-8')
+            self._file.write(text)
+            if self._should_rotate(self._file.tell()):
+                self._rotate_locked()
+                self._file = open(self.path, 'a', encoding='utf-8')
+            return self._file
+
+    def flush(self, timeout=None):
+        """等待后台写入队列中已有的内容写入文件（读取活动文件前调用）"""
+        if self.writer is not None:
+            self.writer.flush(timeout)
+        with self._lock:
+            if self._file is not None:
+                self._file.flush()
+
+    def close(self):
+        """关闭活动文件（之后的写入会重新打开）"""
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def _should_rotate(self, size):
+        if self.max_bytes and size >= self.max_bytes:
+            return True
+        return self.max_age is not None and time.monotonic() - self._started >= self.max_age
+
+    def rotate(self):
+        """立即轮转当前活动文件"""
+        with self._lock:
+            self._rotate_locked()
+
+    def _rotate_locked(self):
+        self._started = time.monotonic()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if not os.path.exists(self.path) or os.path.getsize(self.path) == 0:
+            return
+
+        root, ext = os.path.splitext(self.path)
+        stamp = time.strftime('%Y%m%d-%H%M%S')
+        index = 0
+        while os.path.exists(f"{root}.{stamp}-{index:03d}{ext}.gz"):
+            index += 1
+        segment = f"{root}.{stamp}-{index:03d}{ext}.gz"
+
+        # 先改名再压缩，改名后新的写入立即进入新的活动文件
+        pending = segment[:-len('.gz')] + ".rotating"
+        os.replace(self.path, pending)
+        with open(self.path, 'w', encoding='utf-8') as f:
+            f.write(self.header)
+        try:
+            with open(pending, 'rb') as src, gzip.open(segment, 'wb') as dst:
+                shutil.copyfileobj(src, dst)
+            os.remove(pending)
+        except Exception as e:
+            print(f"压缩日志分段 {segment} 时出错: {str(e)}")
+        self.rotations += 1
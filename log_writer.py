@@ -0,0 +1,159 @@
+import atexit
+import os
+import queue
+import threading
+import time
+
+from metrics import metrics
+
+# 磁盘同步策略
+FSYNC_NEVER = 'never'  # 只刷新到操作系统缓存，由系统决定何时落盘
+FSYNC_BATCH = 'batch'  # 每次批量提交后fsync
+FSYNC_INTERVAL = 'interval'  # 距上次fsync超过fsync_interval秒时，在批量提交后fsync
+FSYNC_POLICIES = (FSYNC_NEVER, FSYNC_BATCH, FSYNC_INTERVAL)
+
+
+class LogWriter:
+    """后台批量写入线程：轮询线程只把要写入的文本放入队列，由写入线程批量提交
+
+    写入目标（RotatingLog、MessageStore等）需要提供 write_batch(text) 方法，
+    在写入线程中写入一批文本并返回保持打开的文件对象（用于flush和fsync）。
+    同一批中写入同一目标的文本合并为一次写入；队列中的文本超过max_batch_bytes字节，
+    或第一条文本等待超过max_delay秒时提交一批。
+    """
+
+    def __init__(self, max_batch_bytes=64 * 1024, max_delay=0.2, fsync=FSYNC_NEVER, fsync_interval=1.0):
+        """
+        Args:
+            max_batch_bytes: 一批最多累积的文本长度（字符数），达到后立即提交
+            max_delay: 一批中第一条文本最长等待多少秒后提交
+            fsync: 磁盘同步策略，'never'、'batch' 或 'interval'
+            fsync_interval: fsync为'interval'时两次fsync的最短间隔(秒)
+        """
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"未知的fsync策略: {fsync}，可选: {', '.join(FSYNC_POLICIES)}")
+        self.max_batch_bytes = max_batch_bytes
+        self.max_delay = max_delay
+        self.fsync = fsync
+        self.fsync_interval = fsync_interval
+        self.batches = 0  # 已提交的批数
+        self.writes = 0  # 已写入的文本条数
+        self._last_fsync = time.monotonic()
+        self._queue = queue.Queue()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+        self._thread.start()
+        # 程序退出时（包括添加监听期间按下Ctrl+C）写完队列中剩余的内容
+        atexit.register(self.close)
+
+    def write(self, sink, text):
+        """将文本加入写入队列（不等待写入完成）"""
+        if self._closed:
+            sink.write_batch(text).flush()
+            return
+        self._queue.put((sink, text))
+
+    def call(self, func):
+        """在写入线程中按顺序执行func（用于需要与已排队写入保持顺序的快照、轮转等操作）"""
+        if self._closed:
+            func()
+            return
+        self._queue.put((None, func))
+
+    def flush(self, timeout=None):
+        """等待此前加入队列的内容全部写入（读取日志文件前调用）
+
+        Returns:
+            bool: 是否在超时前写入完成
+        """
+        if self._closed:
+            return True
+        done = threading.Event()
+        self._queue.put((None, done.set))
+        return done.wait(timeout)
+
+    def close(self):
+        """写完队列中剩余的内容并结束写入线程（可重复调用）"""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join()
+        atexit.unregister(self.close)
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            batch = [item]
+            size = len(item[1]) if item[0] is not None else 0
+            deadline = time.monotonic() + self.max_delay
+            stop = False
+            # 累积到大小上限或等待时间到期，遇到flush或call时立即提交
+            while size < self.max_batch_bytes and item[0] is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+                if item[0] is not None:
+                    size += len(item[1])
+            self._commit(batch)
+            if stop:
+                return
+
+    def _commit(self, batch):
+        """按顺序提交一批写入：相邻的同一目标的文本合并写入，遇到函数时先提交之前的文本"""
+        started = time.perf_counter()
+        pending = {}  # {写入目标: [文本, ...]}，按首次出现的顺序
+        files = []
+        for sink, payload in batch:
+            if sink is not None:
+                pending.setdefault(sink, []).append(payload)
+                continue
+            files.extend(self._write_pending(pending))
+            pending = {}
+            self._sync(files)
+            files = []
+            try:
+                payload()
+            except Exception as e:
+                print(f"后台写入任务出错: {str(e)}")
+        files.extend(self._write_pending(pending))
+        self._sync(files)
+        self.batches += 1
+        self.writes += sum(1 for sink, _ in batch if sink is not None)
+        metrics.inc('log_batches')
+        metrics.observe('log_commit', time.perf_counter() - started)
+
+    def _write_pending(self, pending):
+        files = []
+        for sink, texts in pending.items():
+            try:
+                files.append(sink.write_batch(''.join(texts)))
+            except Exception as e:
+                print(f"后台写入日志时出错: {str(e)}")
+        return files
+
+    def _sync(self, files):
+        if not files:
+            return
+        now = time.monotonic()
+        fsync = self.fsync == FSYNC_BATCH or (
+            self.fsync == FSYNC_INTERVAL and now - self._last_fsync >= self.fsync_interval)
+        for f in files:
+            try:
+                f.flush()
+                if fsync:
+                    os.fsync(f.fileno())
+            except Exception as e:
+                print(f"刷新日志文件时出错: {str(e)}")
+        if fsync:
+            self._last_fsync = now
@@ -0,0 +1,96 @@
+import sys
+import time
+from enum import IntEnum
+
+
+class MessageKind(IntEnum):
+    """消息种类"""
+    TIME = 0  # 时间消息
+    SYS = 1  # 系统消息
+    SELF = 2  # 自己发送的消息
+    FRIEND = 3  # 朋友（或群成员）发送的消息
+    SUMMARY = 4  # 上下文窗口中较早对话的摘要
+
+
+# 旧的 [类型, 内容] 格式中的类型文本与消息种类的对应关系（其余类型均为朋友消息的发送者）
+KIND_BY_TYPE = {'Time': MessageKind.TIME, 'SYS': MessageKind.SYS, 'Self': MessageKind.SELF,
+                'Summary': MessageKind.SUMMARY}
+TYPE_BY_KIND = {kind: msg_type for msg_type, kind in KIND_BY_TYPE.items()}
+
+
+class Message:
+    """消息记录
+
+    使用 __slots__ 避免每条消息一个 __dict__，聊天名称和发送者经过 sys.intern，
+    同一个聊天的所有消息共用同一个字符串对象。与共享聊天名称的 [类型, 内容] 列表相比，
+    每条记录多占用约40字节（见 benchmarks/bench_message_record.py），用于保存所属聊天、种类、
+    时间戳和消息文件中的序号。
+    为兼容旧的 [类型, 内容] 列表格式，msg[0] 返回类型文本，msg[1] 返回内容，
+    msg[2] 返回缓存的token数（上下文窗口中使用）。
+    """
+
+    __slots__ = ('chat', 'sender', 'kind', 'timestamp', 'content', 'tokens', 'seq')
+
+    def __init__(self, kind, content, sender='', chat='', timestamp=None, tokens=None, seq=None):
+        """
+        Args:
+            kind: 消息种类（MessageKind）
+            content: 消息内容
+            sender: 发送者（朋友消息为聊天名称或群成员昵称）
+            chat: 消息所属的聊天名称
+            timestamp: 记录时的单调时钟时间，默认为当前时间
+            tokens: 缓存的token数估算，None表示尚未估算
+            seq: 在格式化消息文件中的序号，None表示尚未记录
+        """
+        self.kind = kind
+        self.content = content
+        self.sender = sys.intern(sender) if sender else ''
+        self.chat = sys.intern(chat) if chat else ''
+        self.timestamp = time.monotonic() if timestamp is None else timestamp
+        self.tokens = tokens
+        self.seq = seq
+
+    @classmethod
+    def from_list(cls, msg, chat=''):
+        """从旧的 [类型, 内容] 列表创建消息记录"""
+        msg_type = msg[0]
+        kind = KIND_BY_TYPE.get(msg_type, MessageKind.FRIEND)
+        sender = msg_type if kind == MessageKind.FRIEND else ''
+        tokens = msg[2] if len(msg) > 2 else None
+        return cls(kind, msg[1], sender, chat, tokens=tokens)
+
+    @classmethod
+    def coerce(cls, msg, chat=''):
+        """消息记录原样返回，旧的列表格式转换为消息记录"""
+        return msg if isinstance(msg, cls) else cls.from_list(msg, chat)
+
+    @property
+    def type(self):
+        """旧格式中的类型文本：'Time'、'SYS'、'Self'、'Summary' 或朋友消息的发送者"""
+        return self.sender if self.kind == MessageKind.FRIEND else TYPE_BY_KIND[self.kind]
+
+    def to_list(self):
+        """转换为旧的 [类型, 内容] 列表（用于JSON存储）"""
+        return [self.type, self.content]
+
+    def __len__(self):
+        return 2 if self.tokens is None else 3
+
+    def __getitem__(self, index):
+        if index == 0:
+            return self.type
+        if index == 1:
+            return self.content
+        if index == 2 and self.tokens is not None:
+            return self.tokens
+        raise IndexError(index)
+
+    def __eq__(self, other):
+        if isinstance(other, Message):
+            return self.type == other.type and self.content == other.content
+        if isinstance(other, (list, tuple)):
+            return self.to_list() == list(other[:2])
+        return NotImplemented
+
+    def __repr__(self):
+        return f"Message({self.kind.name}, {self.content!r}, sender={self.sender!r}, chat={self.chat!r})"
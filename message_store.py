@@ -0,0 +1,208 @@
+import os
+import json
+
+
+class MessageStore:
+    """格式化消息存储：追加写入的 JSON Lines 日志 + 可选的压缩快照
+
+    每条消息只在日志末尾追加一行记录，写入成本与历史长度无关；
+    快照保存调用方传入的消息（ChatLogger传入各聊天保留的最近消息，更早的消息不再保存），
+    写完快照后日志被清空，加载时两者合并。
+    每条记录带有单调递增的序号，快照中记录它包含的最后一个序号，
+    加载时跳过日志中序号不大于该序号的记录（写完快照、清空日志之前中断时不会重复）。
+    提供writer（LogWriter）时，追加和快照都在后台写入线程中按顺序执行。
+    """
+
+    def __init__(self, journal_file="chat_messages.jsonl", snapshot_file=None, snapshot_every=0, writer=None):
+        """初始化消息存储
+
+        Args:
+            journal_file: 追加日志文件路径（每行一条 JSON 记录）
+            snapshot_file: 快照文件路径，默认为日志文件名加 .snapshot 后缀
+            snapshot_every: 每追加多少条消息生成一次快照，0 表示不自动生成
+            writer: 可选的LogWriter，提供时写入文件的操作交给后台写入线程
+        """
+        self.writer = writer
+        self.journal_file = journal_file
+        self.snapshot_file = snapshot_file or f"{os.path.splitext(journal_file)[0]}.snapshot.json"
+        self.snapshot_every = snapshot_every
+        self.count = 0  # 当前存储的消息数（快照中的消息加上之后追加的记录）
+        self.seq = 0  # 下一条记录的序号（单调递增，生成快照后不重置）
+        self._since_snapshot = 0
+        self._journal = None
+
+    def _open_journal(self):
+        """以追加模式打开日志文件（保持打开以避免每条消息都重新打开）"""
+        if self._journal is None:
+            self._journal = open(self.journal_file, 'a', encoding='utf-8')
+        return self._journal
+
+    def reset(self):
+        """清空日志和快照，重新开始记录"""
+        self.close()
+        with open(self.journal_file, 'w', encoding='utf-8'):
+            pass
+        if os.path.exists(self.snapshot_file):
+            os.remove(self.snapshot_file)
+        self.count = 0
+        self.seq = 0
+        self._since_snapshot = 0
+
+    def append(self, msg):
+        """追加一条消息
+
+        Args:
+            msg: 消息，格式为 [类型, 内容]（或同样支持下标访问的消息记录）
+
+        Returns:
+            int: 记录的序号
+        """
+        seq = self.seq
+        self._write(self._record(seq, msg))
+        self.seq += 1
+        self.count += 1
+        self._since_snapshot += 1
+        return seq
+
+    def extend(self, messages):
+        """追加多条消息（一次写入）
+
+        Args:
+            messages: 消息列表，每项为 [类型, 内容]
+
+        Returns:
+            int: 第一条记录的序号（之后的记录依次加一）
+        """
+        seq = self.seq
+        if not messages:
+            return seq
+        self._write(''.join(self._record(seq + offset, msg) for offset, msg in enumerate(messages)))
+        self.seq += len(messages)
+        self.count += len(messages)
+        self._since_snapshot += len(messages)
+        return seq
+
+    @staticmethod
+    def _record(seq, msg):
+        """一条追加日志记录（一行JSON）；消息记录属于具体聊天时同时保存聊天名称"""
+        record = {"seq": seq, "type": msg[0], "content": msg[1]}
+        chat = getattr(msg, 'chat', '')
+        if chat:
+            record["chat"] = chat
+        return json.dumps(record, ensure_ascii=False) + "\n"
+
+    def _write(self, text):
+        if self.writer is not None:
+            self.writer.write(self, text)
+        else:
+            self.write_batch(text).flush()
+
+    def write_batch(self, text):
+        """立即写入追加日志（不刷新），返回日志文件对象"""
+        journal = self._open_journal()
+        journal.write(text)
+        return journal
+
+    def snapshot_due(self):
+        """追加日志中的记录数是否已达到快照间隔"""
+        return bool(self.snapshot_every) and self._since_snapshot >= self.snapshot_every
+
+    def maybe_snapshot(self, message_list):
+        """达到快照间隔时生成快照
+
+        Args:
+            message_list: 要保存在快照中的消息（完整列表或保留的最近消息）
+
+        Returns:
+            bool: 是否生成了快照
+        """
+        if self.snapshot_due():
+            self.snapshot(message_list)
+            return True
+        return False
+
+    def snapshot(self, message_list):
+        """将消息列表写入快照，并清空追加日志（不在列表中的较早消息不再保存）
+
+        先写临时文件再原子替换，保证快照文件始终完整；快照中记录已追加的最后一个序号，
+        即使清空日志前中断，加载时也会跳过序号不大于它的记录（它们已包含在快照中或已被淘汰）。
+
+        Args:
+            message_list: 要保存在快照中的消息（完整列表或内存中保留的最近消息）
+        """
+        messages = [self._entry(msg) for msg in message_list]
+        last_seq = self.seq - 1
+        self.count = len(messages)
+        self._since_snapshot = 0
+        if self.writer is not None:
+            # 在写入线程中执行，保证之前排队的追加记录先写入
+            self.writer.call(lambda: self._write_snapshot(messages, last_seq))
+        else:
+            self._write_snapshot(messages, last_seq)
+
+    @staticmethod
+    def _entry(msg):
+        """快照中的一条消息：[类型, 内容]，属于具体聊天时为 [类型, 内容, 聊天名称]"""
+        chat = getattr(msg, 'chat', '')
+        return [msg[0], msg[1], chat] if chat else [msg[0], msg[1]]
+
+    def _write_snapshot(self, messages, last_seq):
+        tmp_file = self.snapshot_file + ".tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump({"last_seq": last_seq, "count": len(messages), "messages": messages}, f, ensure_ascii=False)
+        os.replace(tmp_file, self.snapshot_file)
+
+        self.close()
+        with open(self.journal_file, 'w', encoding='utf-8'):
+            pass
+
+    def load(self):
+        """读取快照中的消息和快照之后追加的记录
+
+        快照只包含生成时保留的消息，因此压缩过的消息文件加载出的是保留的最近消息加上之后追加的消息，
+        不是全部历史（全部历史保存在聊天日志和历史数据库中）。
+
+        Returns:
+            list: 消息列表，每项为 [类型, 内容]，属于具体聊天的消息为 [类型, 内容, 聊天名称]
+        """
+        messages = []
+        last_seq = -1
+        if os.path.exists(self.snapshot_file):
+            try:
+                with open(self.snapshot_file, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                messages = [list(msg) for msg in data.get("messages", [])]
+                # 旧的快照没有last_seq，之后的记录从count开始编号
+                last_seq = data.get("last_seq", data.get("count", len(messages)) - 1)
+            except Exception as e:
+                print(f"读取消息快照时出错: {str(e)}")
+
+        if os.path.exists(self.journal_file):
+            with open(self.journal_file, 'r', encoding='utf-8') as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # 最后一行可能因中断而不完整，直接跳过
+                        continue
+                    seq = record.get("seq", last_seq + 1)
+                    if seq <= last_seq:
+                        continue  # 已包含在快照中
+                    last_seq = seq
+                    chat = record.get("chat")
+                    messages.append([record["type"], record["content"], chat] if chat else
+                                    [record["type"], record["content"]])
+
+        self.count = len(messages)
+        self.seq = last_seq + 1
+        self._since_snapshot = 0
+        return messages
+
+    def close(self):
+        """关闭日志文件"""
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
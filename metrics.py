@@ -0,0 +1,196 @@
+import bisect
+import json
+import os
+import threading
+import time
+
+# 各阶段耗时直方图的桶上限(秒)
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class Histogram:
+    """累计直方图（与Prometheus的histogram语义一致）"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # 最后一个桶为 +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+
+class _NullTimer:
+    """指标关闭时使用的空计时器"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class _StageTimer:
+    def __init__(self, metrics, stage):
+        self.metrics = metrics
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.observe(self.stage, time.perf_counter() - self.start)
+        return False
+
+
+class Metrics:
+    """轻量的指标收集：每个阶段一个耗时直方图，外加若干事件计数器
+
+    默认关闭，关闭时 timer() 返回共享的空计时器，inc()/observe() 直接返回，
+    几乎没有额外开销。
+    """
+
+    def __init__(self, prefix="wechat_ai"):
+        self.prefix = prefix
+        self.enabled = False
+        self.histograms = {}  # {阶段: Histogram}
+        self.counters = {}  # {事件: 次数}
+        self._lock = threading.Lock()
+        self._http_server = None
+        self._flush_thread = None
+        self._flush_stop = threading.Event()
+
+    def enable(self):
+        self.enabled = True
+
+    def timer(self, stage):
+        """统计代码块耗时的上下文管理器
+
+        用法: with metrics.timer('poll'): ...
+        """
+        if not self.enabled:
+            return _NULL_TIMER
+        return _StageTimer(self, stage)
+
+    def observe(self, stage, seconds):
+        """记录一次阶段耗时(秒)"""
+        if not self.enabled:
+            return
+        with self._lock:
+            histogram = self.histograms.get(stage)
+            if histogram is None:
+                histogram = self.histograms[stage] = Histogram()
+            histogram.observe(seconds)
+
+    def inc(self, name, amount=1):
+        """事件计数器加一（或加amount）"""
+        if not self.enabled:
+            return
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def render_prometheus(self):
+        """以Prometheus文本格式导出所有指标"""
+        lines = []
+        with self._lock:
+            name = f"{self.prefix}_stage_seconds"
+            lines.append(f"# HELP {name} 各处理阶段的耗时")
+            lines.append(f"# TYPE {name} histogram")
+            for stage, histogram in sorted(self.histograms.items()):
+                cumulative = 0
+                for bound, count in zip(histogram.buckets + (float('inf'),), histogram.counts):
+                    cumulative += count
+                    le = '+Inf' if bound == float('inf') else repr(bound)
+                    lines.append(f'{name}_bucket{{stage="{stage}",le="{le}"}} {cumulative}')
+                lines.append(f'{name}_sum{{stage="{stage}"}} {histogram.sum}')
+                lines.append(f'{name}_count{{stage="{stage}"}} {histogram.count}')
+
+            name = f"{self.prefix}_events_total"
+            lines.append(f"# HELP {name} 事件计数")
+            lines.append(f"# TYPE {name} counter")
+            for event, count in sorted(self.counters.items()):
+                lines.append(f'{name}{{event="{event}"}} {count}')
+        return "\n".join(lines) + "\n"
+
+    def to_dict(self):
+        """以字典形式导出所有指标（用于JSON文件）"""
+        with self._lock:
+            return {
+                "timestamp": time.time(),
+                "stages": {
+                    stage: {
+                        "count": histogram.count,
+                        "sum": histogram.sum,
+                        "buckets": dict(zip([str(b) for b in histogram.buckets] + ['+Inf'], histogram.counts)),
+                    }
+                    for stage, histogram in self.histograms.items()
+                },
+                "counters": dict(self.counters),
+            }
+
+    def start_http_server(self, port=9108, host="127.0.0.1"):
+        """在后台线程中启动 /metrics 接口（Prometheus文本格式）"""
+        # 只有开启指标接口时才导入http.server，不拖慢启动
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = metrics.render_prometheus().encode('utf-8')
+                self.send_response(200 if self.path.startswith('/metrics') else 404)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.enable()
+        self._http_server = ThreadingHTTPServer((host, port), Handler)
+        self._http_server.daemon_threads = True
+        threading.Thread(target=self._http_server.serve_forever, name="MetricsHTTP", daemon=True).start()
+        print(f"指标接口已启动: http://{host}:{self._http_server.server_address[1]}/metrics")
+
+    def start_json_flush(self, path, interval=10.0):
+        """在后台线程中每隔interval秒将指标写入JSON文件"""
+        self.enable()
+
+        def flush_loop():
+            while not self._flush_stop.wait(interval):
+                self.flush_json(path)
+
+        self._flush_thread = threading.Thread(target=flush_loop, name="MetricsFlush", daemon=True)
+        self._flush_thread.start()
+        print(f"指标将每 {interval} 秒写入: {path}")
+
+    def flush_json(self, path):
+        """将指标写入JSON文件（先写临时文件再替换）"""
+        try:
+            tmp_path = path + ".tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.to_dict(), f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            print(f"写入指标文件时出错: {str(e)}")
+
+    def shutdown(self, json_path=None):
+        """停止导出线程，指定json_path时最后写入一次"""
+        self._flush_stop.set()
+        if json_path:
+            self.flush_json(json_path)
+        if self._http_server is not None:
+            self._http_server.shutdown()
+            self._http_server = None
+
+
+# 进程内共享的指标实例（默认关闭）
+metrics = Metrics()
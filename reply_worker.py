@@ -0,0 +1,138 @@
+import queue
+import threading
+import time
+import traceback
+from collections import deque
+
+
+class ReplyJob:
+    """一次AI回复任务"""
+
+    def __init__(self, session, messages, generation, stream_sentences=False, speculative=False):
+        """
+        Args:
+            session: 回复所属的ChatSession
+            messages: 生成回复所用的聊天消息列表
+            generation: 提交任务时该聊天的消息代数，用于判断回复是否过时
+            stream_sentences: 是否逐句交付（生成过程中完成的句子放入sentences）
+            speculative: 是否为预生成的回复（回复截止时间到达前开始生成，到达后才发送）
+        """
+        self.session = session
+        self.chat_name = session.name
+        self.messages = messages
+        self.generation = generation
+        self.response = None
+        self.stream_sentences = stream_sentences
+        self.sentences = deque()  # 已生成、尚未发送的句子
+        self.sent = []  # 已发送的内容
+        self.finished = False  # 生成是否已结束（由轮询线程取走结果时设置）
+        self.speculative = speculative
+        self.released = not speculative  # 是否可以发送（预生成的回复在截止时间到达后才可以发送）
+        self.submitted_at = time.monotonic()
+
+
+class ReplyWorker:
+    """后台回复线程池：从任务队列取出任务调用AI生成回复，不阻塞消息轮询
+
+    不同聊天的回复由多个工作线程并发生成，同一聊天同一时间最多只有一个任务。
+    每个聊天维护一个消息代数，收到新消息时代数加一；
+    生成过程中代数发生变化的任务会被中止，完成的回复放入结果队列，
+    由轮询线程取出后发送（wxauto的界面操作只在轮询线程中进行）。
+    """
+
+    def __init__(self, max_workers=4):
+        """
+        Args:
+            max_workers: 工作线程数，即最多同时生成回复的聊天数
+        """
+        self.jobs = queue.Queue()
+        self.results = queue.Queue()
+        self.generations = {}  # {聊天名称: 消息代数}
+        self.pending = set()  # 已提交但尚未取走结果的聊天名称
+        self._lock = threading.Lock()
+        self._threads = []
+        for i in range(max_workers):
+            thread = threading.Thread(target=self._run, name=f"ReplyWorker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def invalidate(self, chat_name):
+        """聊天收到新消息，使该聊天正在生成的回复过时"""
+        with self._lock:
+            self.generations[chat_name] = self.generations.get(chat_name, 0) + 1
+
+    def is_current(self, job):
+        """任务提交后该聊天是否没有新消息"""
+        with self._lock:
+            return self.generations.get(job.chat_name, 0) == job.generation
+
+    def is_busy(self, chat_name):
+        """该聊天是否有尚未完成的回复任务"""
+        with self._lock:
+            return chat_name in self.pending
+
+    def has_pending(self):
+        """是否有尚未完成的回复任务"""
+        with self._lock:
+            return bool(self.pending)
+
+    def submit(self, session, messages, stream_sentences=False, speculative=False):
+        """提交回复任务
+
+        Args:
+            session: 回复所属的ChatSession
+            messages: 生成回复所用的聊天消息列表，为None时由ChatAI从会话日志解析
+            stream_sentences: 是否逐句交付回复
+            speculative: 是否为预生成的回复
+
+        Returns:
+            ReplyJob: 提交的任务，如果该聊天已有未完成的任务则返回None
+        """
+        with self._lock:
+            if session.name in self.pending:
+                return None
+            self.pending.add(session.name)
+            job = ReplyJob(session, messages, self.generations.get(session.name, 0), stream_sentences, speculative)
+        self.jobs.put(job)
+        return job
+
+    def _run(self):
+        """工作线程主循环"""
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                break
+            try:
+                if self.is_current(job):
+                    on_sentence = job.sentences.append if job.stream_sentences else None
+                    job.response = job.session.chat_ai.run(job.messages, cancel_check=lambda: not self.is_current(job),
+                                                           on_sentence=on_sentence)
+            except Exception as e:
+                print(f"后台生成AI回复时出错: {str(e)}")
+                traceback.print_exc()
+                job.response = f"错误: {str(e)}"
+            self.results.put(job)
+
+    def get_finished(self):
+        """取出所有已完成的任务（不阻塞）
+
+        Returns:
+            list: 已完成的ReplyJob列表
+        """
+        finished = []
+        while True:
+            try:
+                job = self.results.get_nowait()
+            except queue.Empty:
+                break
+            with self._lock:
+                self.pending.discard(job.chat_name)
+            finished.append(job)
+        return finished
+
+    def stop(self, timeout=5):
+        """停止所有工作线程"""
+        for _ in self._threads:
+            self.jobs.put(None)
+        for thread in self._threads:
+            thread.join(timeout)
@@ -0,0 +1,95 @@
+import threading
+import time
+from collections import deque
+
+
+class DeadlineExceeded(Exception):
+    """AI请求超过了截止时间（排队等待限流、等待首字或整体耗时）"""
+
+
+class FirstTokenTimeout(DeadlineExceeded):
+    """在首字截止时间内没有收到任何输出（服务端卡住），可以重试"""
+
+
+class TokenBucket:
+    """令牌桶限流器（线程安全），所有聊天共享一个实例以限制整体请求速率
+
+    桶中最多存放capacity个令牌，每秒补充rate个；每次请求消耗一个令牌，
+    允许短时间内突发capacity个请求，长期速率不超过rate。
+    """
+
+    def __init__(self, rate, capacity=1):
+        """
+        Args:
+            rate: 每秒补充的令牌数，0或None表示不限流
+            capacity: 桶容量（允许的突发请求数）
+        """
+        self.rate = rate
+        self.capacity = max(capacity, 1)
+        self.tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill_locked(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self):
+        """有令牌时立即取走一个并返回True，否则返回False（不等待）"""
+        if not self.rate:
+            return True
+        with self._lock:
+            self._refill_locked(time.monotonic())
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return True
+            return False
+
+    def acquire(self, timeout=None):
+        """取走一个令牌，没有令牌时等待补充
+
+        Args:
+            timeout: 最长等待时间(秒)，None表示一直等待
+
+        Returns:
+            bool: 是否取得令牌（超时返回False）
+        """
+        if not self.rate:
+            return True
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill_locked(now)
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return True
+                wait = (1 - self.tokens) / self.rate
+            if deadline is not None:
+                if now + wait > deadline:
+                    return False
+            time.sleep(wait)
+
+
+class LatencyTracker:
+    """记录最近若干次首字延迟，用于计算对冲请求的触发阈值"""
+
+    def __init__(self, window=200):
+        self.samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.samples)
+
+    def observe(self, seconds):
+        with self._lock:
+            self.samples.append(seconds)
+
+    def percentile(self, pct):
+        """最近样本的第pct百分位数，没有样本时返回None"""
+        with self._lock:
+            values = sorted(self.samples)
+        if not values:
+            return None
+        index = min(len(values) - 1, max(0, int(round(pct / 100 * (len(values) - 1)))))
+        return values[index]
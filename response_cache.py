@@ -0,0 +1,65 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+
+class ResponseCache:
+    """AI回复的LRU缓存（带过期时间）
+
+    以格式化后上下文的哈希为键，相同的上下文在过期前不会再次调用AI模型。
+    """
+
+    def __init__(self, maxsize=256, ttl=600):
+        """
+        Args:
+            maxsize: 最多缓存的回复数量，超过后淘汰最久未使用的
+            ttl: 缓存有效时间(秒)
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # {键: (写入时间, 回复)}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(messages, model=""):
+        """计算上下文的缓存键
+
+        Args:
+            messages: OpenAI格式的消息列表
+            model: 模型名称（不同模型的回复分开缓存）
+        """
+        payload = json.dumps([model, messages], ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        """查找缓存的回复
+
+        Returns:
+            str: 缓存的回复，未命中或已过期时返回None
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry[0] <= self.ttl:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, response):
+        """缓存一条回复"""
+        with self._lock:
+            self._entries[key] = (time.monotonic(), response)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def summary(self):
+        """返回统计摘要"""
+        return f"回复缓存命中: {self.hits}, 未命中: {self.misses}, 当前条目: {len(self._entries)}"
@@ -0,0 +1,127 @@
+import heapq
+import itertools
+import random
+import time
+
+
+class DeadlineScheduler:
+    """按截止时间排序的最小堆，用于管理每个聊天的回复截止时间
+
+    重新设置或取消截止时间时不从堆中删除旧项，而是在弹出时跳过
+    与当前记录不一致的过期项（惰性删除）。
+    """
+
+    def __init__(self):
+        self._heap = []  # 每项为 (截止时间, 序号, 键)
+        self._deadlines = {}  # {键: 当前有效的截止时间}
+        self._counter = itertools.count()
+
+    def __len__(self):
+        return len(self._deadlines)
+
+    def __contains__(self, key):
+        return key in self._deadlines
+
+    def schedule(self, key, deadline):
+        """设置（或重新设置）键的截止时间"""
+        self._deadlines[key] = deadline
+        heapq.heappush(self._heap, (deadline, next(self._counter), key))
+
+    def cancel(self, key):
+        """取消键的截止时间"""
+        self._deadlines.pop(key, None)
+
+    def _discard_stale(self):
+        while self._heap and self._deadlines.get(self._heap[0][2]) != self._heap[0][0]:
+            heapq.heappop(self._heap)
+
+    def next_deadline(self):
+        """最早的有效截止时间，没有时返回None"""
+        self._discard_stale()
+        return self._heap[0][0] if self._heap else None
+
+    def pop_due(self, now):
+        """弹出所有截止时间不晚于now的键
+
+        Returns:
+            list: 已到期的键，按截止时间排序
+        """
+        due = []
+        while True:
+            self._discard_stale()
+            if not self._heap or self._heap[0][0] > now:
+                return due
+            _, _, key = heapq.heappop(self._heap)
+            del self._deadlines[key]
+            due.append(key)
+
+
+class AdaptivePoller:
+    """自适应轮询间隔：有活动时加快轮询，空闲时逐步放慢"""
+
+    def __init__(self, min_interval=0.2, max_interval=5.0, factor=1.5, initial=1.0):
+        """
+        Args:
+            min_interval: 有活动时的轮询间隔(秒)
+            max_interval: 空闲时的最大轮询间隔(秒)
+            factor: 每次空闲轮询后间隔的放大倍数
+            initial: 初始轮询间隔(秒)
+        """
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.factor = factor
+        self.interval = min(max(initial, min_interval), max_interval)
+
+    def on_activity(self):
+        """有新消息或正在生成回复，恢复最快的轮询间隔"""
+        self.interval = self.min_interval
+        return self.interval
+
+    def on_idle(self):
+        """本次轮询没有活动，放慢轮询间隔"""
+        self.interval = min(self.interval * self.factor, self.max_interval)
+        return self.interval
+
+
+class Backoff:
+    """带随机抖动的指数退避：等待时间在当前退避上限的一半到上限之间随机选取"""
+
+    def __init__(self, base=1.0, cap=60.0):
+        """
+        Args:
+            base: 第一次退避的等待上限(秒)
+            cap: 退避等待时间的上限(秒)
+        """
+        self.base = base
+        self.cap = cap
+        self.attempt = 0
+
+    def next_delay(self):
+        """返回下一次的等待时间，并增加失败次数"""
+        ceiling = min(self.cap, self.base * (2 ** self.attempt))
+        delay = ceiling / 2 + random.uniform(0, ceiling / 2)
+        self.attempt += 1
+        return delay
+
+    def reset(self):
+        """成功后重置失败次数"""
+        self.attempt = 0
+
+
+def wait_until(predicate, timeout, interval=0.05, max_interval=0.5):
+    """轮询predicate直到返回真值或超时，轮询间隔从interval逐步加倍到max_interval
+
+    用于等待微信窗口切换、历史消息加载等没有完成通知的界面操作，
+    操作很快完成时不必等满固定时间，操作卡住时最多等待timeout秒。
+
+    Returns:
+        predicate最后一次的返回值（超时时为假值）
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        result = predicate()
+        remaining = deadline - time.monotonic()
+        if result or remaining <= 0:
+            return result
+        time.sleep(min(interval, remaining))
+        interval = min(interval * 2, max_interval)
@@ -0,0 +1,78 @@
+import re
+
+# 中文句末标点，以及换行
+CJK_TERMINATORS = '。！？!?…～~\n'
+
+# 英文句号只有在后面是空白时才算句末（避免把 3.5、www.qq.com 切开）
+ASCII_TERMINATORS = '.'
+
+# 紧跟在句末标点后、仍属于同一句的收尾字符
+CLOSING_CHARS = '"\'”’）)】」』'
+
+# 回复开头的说话人前缀，如 "A: "、"A："、"B: "
+SPEAKER_PREFIX = re.compile(r'^\s*[AB]\s*[:：]\s*')
+
+
+def strip_speaker_prefix(text):
+    """去掉句子开头的 A:/B: 说话人前缀"""
+    return SPEAKER_PREFIX.sub('', text, count=1)
+
+
+class SentenceSplitter:
+    """把流式输出的文本按中英文句子边界切分
+
+    feed() 每次传入新的文本片段，返回其中已经完整的句子；
+    连续的句末标点（如"！！"、"?!"）和随后的引号、括号归入同一句，
+    所以句末标点位于缓冲区末尾时会等待下一段文本再决定。
+    """
+
+    def __init__(self):
+        self.buffer = ""
+
+    def feed(self, text):
+        """传入新的文本片段
+
+        Returns:
+            list: 新完成的句子（已去掉说话人前缀和首尾空白）
+        """
+        self.buffer += text
+        sentences = []
+        start = 0
+        i = 0
+        length = len(self.buffer)
+        while i < length:
+            char = self.buffer[i]
+            if char in CJK_TERMINATORS or char in ASCII_TERMINATORS:
+                end = i + 1
+                while end < length and (self.buffer[end] in CJK_TERMINATORS
+                                        or self.buffer[end] in ASCII_TERMINATORS
+                                        or self.buffer[end] in CLOSING_CHARS):
+                    end += 1
+                if end >= length:
+                    break  # 后面可能还有标点，等待更多文本
+                if char in ASCII_TERMINATORS and not self.buffer[end].isspace():
+                    i = end
+                    continue
+                self._emit(self.buffer[start:end], sentences)
+                start = i = end
+                continue
+            i += 1
+        self.buffer = self.buffer[start:]
+        return sentences
+
+    def flush(self):
+        """输出缓冲区中剩余的文本（流结束时调用）
+
+        Returns:
+            list: 剩余的句子
+        """
+        sentences = []
+        self._emit(self.buffer, sentences)
+        self.buffer = ""
+        return sentences
+
+    @staticmethod
+    def _emit(text, sentences):
+        text = strip_speaker_prefix(text).strip()
+        if text:
+            sentences.append(text)
@@ -0,0 +1,112 @@
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+
+class ImportRecorder:
+    """记录每个线程导入的模块：放在sys.meta_path最前面，只记录后返回None，由其他查找器完成导入"""
+
+    def __init__(self):
+        self.imports = []  # [(线程编号, 时间, 顶层模块名)]
+
+    def find_spec(self, name, path=None, target=None):
+        self.imports.append((threading.get_ident(), time.perf_counter(), name.split('.')[0]))
+        return None
+
+    def install(self):
+        """放到sys.meta_path最前面开始记录，返回自身"""
+        sys.meta_path.insert(0, self)
+        return self
+
+    def remove(self):
+        """停止记录（已记录的导入保留）"""
+        if self in sys.meta_path:
+            sys.meta_path.remove(self)
+
+    def modules(self, start, end, thread=None):
+        """start到end之间导入的顶层模块（thread为线程编号，None表示所有线程），下划线开头的内部模块排在后面"""
+        modules = {name for ident, when, name in self.imports
+                   if (thread is None or ident == thread) and start <= when <= end}
+        return sorted(modules, key=lambda name: (name.startswith('_'), name.lower()))
+
+
+class StartupProfile:
+    """记录启动各阶段的耗时，用于发现启动变慢的原因
+
+    各阶段可以在不同的线程中并行执行（例如连接微信的同时在后台导入openai），
+    每个阶段记录所在线程、相对启动时刻的开始时间和耗时；开启时还通过导入钩子记录
+    每个阶段在本线程中新导入的顶层模块。关闭时只记录耗时，开销可以忽略。
+    """
+
+    def __init__(self, enabled=False):
+        """
+        Args:
+            enabled: 是否记录各阶段导入的模块并在report()时输出明细
+        """
+        self.enabled = enabled
+        self.started = time.perf_counter()
+        self.phases = []  # [(阶段名称, 线程名称, 开始时间(相对启动, 秒), 耗时(秒), 新导入的顶层模块)]
+        self._running = {}  # 正在进行的阶段 {阶段名称: 开始时间}
+        self._lock = threading.Lock()
+        self._recorder = None
+        if enabled:
+            self._recorder = ImportRecorder().install()
+
+    def record(self, name, start, end, modules=None):
+        """记录一个在外部计时的阶段（start、end为time.perf_counter()的值）
+
+        Args:
+            modules: 该阶段新导入的顶层模块，None表示从导入钩子中取当前线程在这段时间内的导入
+        """
+        if modules is None:
+            modules = self._recorder.modules(start, end, threading.get_ident()) if self._recorder is not None else ()
+        modules = tuple(modules) if self.enabled else ()
+        with self._lock:
+            self.phases.append((name, threading.current_thread().name, start - self.started, end - start, modules))
+
+    @contextmanager
+    def phase(self, name):
+        """记录with块的耗时"""
+        start = time.perf_counter()
+        with self._lock:
+            self._running[name] = start
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            with self._lock:
+                self._running.pop(name, None)
+            self.record(name, start, end)
+
+    def start_thread(self, name, target):
+        """在后台线程中执行target，整个任务作为一个阶段计时
+
+        Returns:
+            threading.Thread: 已启动的线程
+        """
+        def run():
+            with self.phase(name):
+                target()
+
+        thread = threading.Thread(target=run, name=f"startup-{name}", daemon=True)
+        thread.start()
+        return thread
+
+    def report(self):
+        """输出启动各阶段的耗时明细（按开始时间排序），并移除导入钩子"""
+        if self._recorder is not None:
+            self._recorder.remove()
+        now = time.perf_counter()
+        with self._lock:
+            phases = sorted(self.phases, key=lambda phase: phase[2])
+            running = dict(self._running)
+        print("\n===== 启动耗时 =====")
+        print(f"从创建ChatLogger到现在: {now - self.started:.3f} 秒")
+        print(f"{'阶段':<24}{'线程':<24}{'开始(秒)':>10}{'耗时(秒)':>10}  新导入的模块")
+        for name, thread, start, elapsed, modules in phases:
+            imported = ", ".join(modules[:8]) + (f" 等{len(modules)}个" if len(modules) > 8 else "")
+            print(f"{name:<24}{thread:<24}{start:>10.3f}{elapsed:>10.3f}  {imported}")
+        for name, start in running.items():
+            print(f"{name:<24}{'(仍在进行)':<24}{start - self.started:>10.3f}{now - start:>10.3f}")
+        print("====================\n")
@@ -0,0 +1,130 @@
+import re
+from datetime import datetime
+
+# 微信中的媒体消息在文本中显示为这些占位符（语音消息后面带有时长）
+MEDIA_ONLY = re.compile(r'\[(?:图片|视频|文件|动画表情|链接|位置|名片|音乐|小程序|聊天记录)\]'
+                        r'|\[语音\]\d+秒(?:,未播放)?')
+
+# 微信内置表情在文本中显示为 [名称]
+WECHAT_STICKERS = (
+    '微笑', '撇嘴', '色', '发呆', '得意', '流泪', '害羞', '闭嘴', '睡', '大哭', '尴尬', '发怒', '调皮', '呲牙',
+    '惊讶', '难过', '囧', '抓狂', '吐', '偷笑', '愉快', '白眼', '傲慢', '困', '惊恐', '憨笑', '悠闲', '咒骂',
+    '疑问', '嘘', '晕', '衰', '骷髅', '敲打', '再见', '擦汗', '抠鼻', '鼓掌', '坏笑', '右哼哼', '左哼哼', '鄙视',
+    '委屈', '快哭了', '阴险', '亲亲', '可怜', '笑脸', '生病', '脸红', '破涕为笑', '恐惧', '失望', '无语', '嘿哈',
+    '捂脸', '奸笑', '机智', '皱眉', '耶', '吃瓜', '加油', '汗', '天啊', 'Emm', '社会社会', '旺柴', '好的', '打脸',
+    '哇', '翻白眼', '666', '让我看看', '叹气', '苦涩', '裂开', '嘴唇', '爱心', '心碎', '拥抱', '强', '弱', '握手',
+    '胜利', '抱拳', '勾引', '拳头', '合十', '啤酒', '咖啡', '蛋糕', '玫瑰', '凋谢', '菜刀', '炸弹', '便便', '月亮',
+    '太阳', '庆祝', '礼物', '红包', '發', '福', '烟花', '爆竹', '猪头', '跳跳', '发抖', '转圈',
+)
+
+# 表情：微信表情 [调皮] 或 emoji
+EMOJI = (r'\[(?:' + '|'.join(re.escape(name) for name in WECHAT_STICKERS) + r')\]'
+         r'|[\U0001F000-\U0001FAFF\u2600-\u27BF\u2B00-\u2BFF]')
+
+# 只由表情组成的消息：至少有一个表情，其余为emoji修饰符、空白和标点
+# （只有标点的消息，如单独的"？"，不算表情；[OK]等不认识的方括号内容也不算）
+EMOJI_ONLY = re.compile(rf'(?=.*?(?:{EMOJI}))(?:{EMOJI}|[\uFE0F\u200D\s,.!?~，。！？～…])+', re.S)
+
+# 撤回消息的提示
+RECALL = re.compile(r'撤回了一条消息')
+
+# 引用消息中被引用的部分：「昵称：内容」加分隔线，或末尾的"引用 昵称 的消息 : 内容"（昵称可能为空）
+QUOTE = re.compile(r'「[^」]*」\s*(?:-\s*){3,}|\n?引用\s*\S*\s*的消息\s*:.*$', re.S)
+
+
+def compile_alternatives(keywords=(), patterns=()):
+    """把关键词和正则表达式合并编译为一个正则（一次扫描匹配全部规则），都为空时返回None"""
+    alternatives = [re.escape(keyword) for keyword in keywords if keyword]
+    alternatives += [f"(?:{pattern})" for pattern in patterns if pattern]
+    return re.compile('|'.join(alternatives)) if alternatives else None
+
+
+def parse_clock(text):
+    """把 'HH:MM' 转换为当天的分钟数"""
+    hour, minute = text.split(':')
+    return int(hour) * 60 + int(minute)
+
+
+class TriggerRules:
+    """自动回复的触发规则：判断朋友消息是否需要AI回复
+
+    不需要回复的消息（只有表情、只有图片等媒体、撤回提示、只有引用内容、
+    不含触发关键词、群聊中没有@自己、命中忽略规则）不会开始新的回复轮次，
+    回复截止时间到达时也就不会调用AI。所有规则在创建时编译，
+    每条消息只做几次正则匹配。
+    """
+
+    def __init__(self, keywords=(), patterns=(), ignore=(), ignore_patterns=(), require_mention=False,
+                 mention_names=(), skip_emoji_only=True, skip_media_only=True, skip_recall=True,
+                 skip_quote_only=True, quiet_hours=None):
+        """
+        Args:
+            keywords: 触发关键词，提供关键词或patterns时只有命中的消息才需要回复
+            patterns: 触发正则表达式
+            ignore: 忽略关键词，命中的消息不需要回复
+            ignore_patterns: 忽略正则表达式
+            require_mention: 是否只回复@了自己的消息（用于群聊）
+            mention_names: 自己在群聊中的昵称（可以有多个），用于识别@
+            skip_emoji_only: 跳过只有表情的消息
+            skip_media_only: 跳过只有图片、视频、语音等媒体的消息
+            skip_recall: 跳过撤回消息的提示
+            skip_quote_only: 跳过只有引用内容、没有新内容的消息
+            quiet_hours: 免打扰时段 ('HH:MM', 'HH:MM')，可以跨午夜，期间不自动回复
+        """
+        self.trigger = compile_alternatives(keywords, patterns)
+        self.ignore = compile_alternatives(ignore, ignore_patterns)
+        self.require_mention = require_mention
+        self.mention = None
+        if mention_names:
+            names = '|'.join(re.escape(name) for name in mention_names)
+            self.mention = re.compile(rf'@(?:{names})(?:[\s\u2005]|$)')
+        self.skip_emoji_only = skip_emoji_only
+        self.skip_media_only = skip_media_only
+        self.skip_recall = skip_recall
+        self.skip_quote_only = skip_quote_only
+        self.quiet_hours = None
+        if quiet_hours:
+            self.quiet_hours = (parse_clock(quiet_hours[0]), parse_clock(quiet_hours[1]))
+
+    def filter_reason(self, content):
+        """判断朋友消息是否需要回复
+
+        Returns:
+            str: 不需要回复的原因（'recall'、'quote'、'media'、'emoji'、'ignore'、'mention'、'keyword'），
+                需要回复时返回None
+        """
+        text = content.strip()
+        if self.skip_recall and RECALL.search(text):
+            return 'recall'
+        if self.skip_quote_only and ('」' in text or '引用' in text):
+            text = QUOTE.sub('', text).strip()
+            if not text:
+                return 'quote'
+        if self.skip_media_only and MEDIA_ONLY.fullmatch(text):
+            return 'media'
+        if self.skip_emoji_only and (not text or EMOJI_ONLY.fullmatch(text)):
+            return 'emoji'
+        if self.ignore is not None and self.ignore.search(text):
+            return 'ignore'
+        if self.require_mention and (self.mention is None or not self.mention.search(text)):
+            return 'mention'
+        if self.trigger is not None and not self.trigger.search(text):
+            # 群聊中@自己的消息不要求命中关键词
+            if self.mention is None or not self.mention.search(text):
+                return 'keyword'
+        return None
+
+    def in_quiet_hours(self, now=None):
+        """当前是否处于免打扰时段"""
+        if self.quiet_hours is None:
+            return False
+        now = now or datetime.now()
+        minute = now.hour * 60 + now.minute
+        start, end = self.quiet_hours
+        if start <= end:
+            return start <= minute < end
+        return minute >= start or minute < end
+
+
+# 默认规则：跳过只有表情、媒体、撤回提示和引用内容的消息
+DEFAULT_TRIGGER_RULES = TriggerRules()
@@ -0,0 +1,197 @@
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+
+
+class WeChatDriver(ABC):
+    """微信驱动接口：ChatLogger 只通过这些方法与微信交互
+
+    方法名与 wxauto.WeChat 保持一致，GetListenMessage 返回 {聊天对象: [消息, ...]}，
+    聊天对象需要有 who 属性和 SendMsg 方法，消息需要有 type/content/time 属性。
+    CurrentChat 是可选功能：has_current_chat 为True的驱动才提供，
+    否则ChatLogger不等待窗口切换完成。
+    """
+
+    has_current_chat = False  # 是否支持CurrentChat()（当前打开的聊天窗口名称）
+
+    @abstractmethod
+    def GetSessionList(self):
+        pass
+
+    @abstractmethod
+    def Search(self, who):
+        pass
+
+    @abstractmethod
+    def ChatWith(self, who):
+        pass
+
+    @abstractmethod
+    def LoadMoreMessage(self):
+        pass
+
+    @abstractmethod
+    def GetAllMessage(self):
+        pass
+
+    @abstractmethod
+    def AddListenChat(self, who):
+        pass
+
+    @abstractmethod
+    def GetListenMessage(self):
+        pass
+
+
+class WxautoDriver(WeChatDriver):
+    """基于 wxauto 的真实微信驱动（仅支持Windows，创建时才导入wxauto）"""
+
+    def __init__(self):
+        from wxauto import WeChat
+        self.wx = WeChat()
+        # 较早版本的wxauto没有CurrentChat
+        self.has_current_chat = hasattr(self.wx, 'CurrentChat')
+
+    def GetSessionList(self):
+        return self.wx.GetSessionList()
+
+    def Search(self, who):
+        return self.wx.Search(who)
+
+    def ChatWith(self, who):
+        return self.wx.ChatWith(who)
+
+    def CurrentChat(self):
+        return self.wx.CurrentChat()
+
+    def LoadMoreMessage(self):
+        return self.wx.LoadMoreMessage()
+
+    def GetAllMessage(self):
+        return self.wx.GetAllMessage()
+
+    def AddListenChat(self, who):
+        return self.wx.AddListenChat(who=who)
+
+    def GetListenMessage(self):
+        return self.wx.GetListenMessage()
+
+
+class FakeMessage:
+    """模拟的微信消息"""
+
+    def __init__(self, type, content, time=''):
+        self.type = type  # 'friend' / 'self' / 'time' / 'sys'
+        self.content = content
+        self.time = time
+
+
+class FakeChat:
+    """模拟的聊天窗口，记录所有发送的消息"""
+
+    def __init__(self, driver, who):
+        self.driver = driver
+        self.who = who
+        self.sent = []  # 每项为 (发送时的单调时钟时间, 内容)
+
+    def SendMsg(self, msg):
+        self.sent.append((time.monotonic(), msg))
+        if self.driver.on_send is not None:
+            self.driver.on_send(self.who, msg)
+        if self.driver.echo_sent:
+            # 真实微信中自己发送的消息会出现在监听消息里
+            self.driver.push(self.who, 'self', msg)
+
+
+class FakeWeChat(WeChatDriver):
+    """可编程的进程内微信模拟，用于基准测试和在非Windows环境下运行
+
+    通过 push() 向监听的聊天投递消息（线程安全），
+    GetListenMessage() 返回投递后尚未取走的消息。
+    """
+
+    has_current_chat = True
+
+    def __init__(self, sessions=None, history=None, echo_sent=True, on_send=None,
+                 switch_delay=0.0, load_delay=0.0, search_delay=0.0, attach_delay=0.0):
+        """
+        Args:
+            sessions: 会话列表中的聊天名称
+            history: 每个聊天的历史消息 {聊天名称: [(类型, 内容), ...]}
+            echo_sent: SendMsg发送的消息是否作为'self'消息出现在监听消息中
+            on_send: 可选回调 on_send(聊天名称, 内容)，每次SendMsg时调用
+            switch_delay: ChatWith后窗口切换完成所需的时间(秒)，期间CurrentChat仍返回原来的聊天
+            load_delay: LoadMoreMessage后历史消息加载完成所需的时间(秒)，加载完成前GetAllMessage只返回最近一半
+            search_delay: Search后聊天出现在会话列表中所需的时间(秒)
+            attach_delay: 创建时连接微信所需的时间(秒)
+        """
+        if attach_delay:
+            time.sleep(attach_delay)
+        self.switch_delay = switch_delay
+        self.load_delay = load_delay
+        self.search_delay = search_delay
+        self._switch = (None, 0.0)  # (正在切换到的聊天, 切换完成的时间)
+        self._loaded = (None, 0.0)  # (加载了更多历史消息的聊天, 加载完成的时间)
+        self._searching = {}  # {正在搜索的聊天名称: 出现在会话列表中的时间}
+        self.sessions = list(sessions or [])
+        self.history = history or {}
+        self.echo_sent = echo_sent
+        self.on_send = on_send
+        self.chats = {}  # {聊天名称: FakeChat}，只包含已监听的聊天
+        self.current = None
+        self._inbox = deque()  # 待取走的 (聊天名称, FakeMessage)
+        self._lock = threading.Lock()
+
+    def push(self, who, type, content):
+        """向聊天投递一条消息（未监听的聊天会被忽略）"""
+        with self._lock:
+            self._inbox.append((who, FakeMessage(type, content, time.strftime('%Y-%m-%d %H:%M:%S'))))
+
+    def GetSessionList(self):
+        now = time.monotonic()
+        for who, ready_at in list(self._searching.items()):
+            if now >= ready_at:
+                del self._searching[who]
+                self.sessions.append(who)
+        return list(self.sessions)
+
+    def Search(self, who):
+        if who not in self.sessions and who not in self._searching:
+            self._searching[who] = time.monotonic() + self.search_delay
+
+    def ChatWith(self, who):
+        self._switch = (who, time.monotonic() + self.switch_delay)
+
+    def CurrentChat(self):
+        who, ready_at = self._switch
+        if who is not None and time.monotonic() >= ready_at:
+            self.current = who
+        return self.current
+
+    def LoadMoreMessage(self):
+        self._loaded = (self.CurrentChat(), time.monotonic() + self.load_delay)
+
+    def GetAllMessage(self):
+        current = self.CurrentChat()
+        history = self.history.get(current, [])
+        who, ready_at = self._loaded
+        if who != current or time.monotonic() < ready_at:
+            history = history[len(history) // 2:]
+        return [FakeMessage(type, content) for type, content in history]
+
+    def AddListenChat(self, who):
+        chat = self.chats.get(who)
+        if chat is None:
+            chat = self.chats[who] = FakeChat(self, who)
+        return chat
+
+    def GetListenMessage(self):
+        with self._lock:
+            pending, self._inbox = self._inbox, deque()
+        result = {}
+        for who, msg in pending:
+            chat = self.chats.get(who)
+            if chat is not None:
+                result.setdefault(chat, []).append(msg)
+        return result